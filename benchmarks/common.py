@@ -0,0 +1,91 @@
+"""
+Helpers shared by the benchmarks: percentiles, saving the results and swapping the
+database used by the resources.
+"""
+import json
+import platform
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from subprocess import run, PIPE
+from nautical_api import resources
+from nautical_api.connector import NauticalDatabase
+
+
+def percentile(values, pct):
+    """
+    :param values: Sorted list of values
+    :param pct: Percentile (0 - 100)
+    :return: value at the percentile (nearest rank), None when there are no values
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """
+    :param latencies: Latency (seconds) of each request
+    :param elapsed: Seconds spent sending all requests
+    :param errors: Number of failed requests
+    :return: dictionary of the count, errors, throughput (requests/second) and latency
+    percentiles (milliseconds)
+    """
+    values = sorted(latencies)
+
+    def _ms(x):
+        return round(x * 1000.0, 3) if x is not None else None
+
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput": round(len(values) / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None)
+    }
+
+
+def save_results(path, name, config, results):
+    """
+    Save the results of a benchmark as JSON along with the information needed to compare
+    runs over time (time, commit, python version).
+
+    :param path: Path of the JSON file
+    :param name: Name of the benchmark
+    :param config: dictionary of the options of the benchmark
+    :param results: dictionary of the results
+    """
+    commit = run(["git", "rev-parse", "--short", "HEAD"], stdout=PIPE, stderr=PIPE, universal_newlines=True)
+    output = {
+        "benchmark": name,
+        "time": datetime.now(timezone.utc).isoformat(),
+        "commit": commit.stdout.strip() or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results
+    }
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+
+
+@contextmanager
+def database(**kwargs):
+    """
+    Create a database that replaces the singleton used by the resources while in the context.
+
+    :param kwargs: Arguments of the NauticalDatabase
+    :return: the database, the sources are pulled
+    """
+    previous = NauticalDatabase._instance
+    db = NauticalDatabase.__wrapped__(**kwargs)
+    NauticalDatabase._instance = db
+    resources._bodies.clear()
+    try:
+        db._pull_all()
+        yield db
+    finally:
+        db.stop()
+        NauticalDatabase._instance = previous
@@ -0,0 +1,77 @@
+"""
+Compare two results files of the same benchmark (`--output` of `benchmarks.load` or
+`benchmarks.micro`), such as the results of the main branch and of a change.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+
+
+# Values where a lower number is better, all other values are reported without a verdict
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "max_ms", "best_us", "median_us", "errors")
+HIGHER_IS_BETTER = ("throughput", )
+
+
+def flatten(results, prefix=""):
+    """
+    :return: dictionary of the dotted path of each numeric value mapped to the value
+    """
+    output = {}
+    for key, value in results.items():
+        path = "{}.{}".format(prefix, key) if prefix else str(key)
+        if isinstance(value, dict):
+            output.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            output[path] = value
+    return output
+
+
+def compare(before, after, threshold):
+    """
+    :param before: Results of the baseline
+    :param after: Results to compare against the baseline
+    :param threshold: Change (percent) reported as a regression or an improvement
+    :return: list of (path, before, after, change percent, verdict)
+    """
+    before, after = flatten(before), flatten(after)
+    output = []
+    for path in sorted(set(before) & set(after)):
+        old, new = before[path], after[path]
+        change = (new - old) / old * 100.0 if old else 0.0
+        metric = path.rsplit(".", 1)[-1]
+
+        verdict = ""
+        if metric in LOWER_IS_BETTER and abs(change) >= threshold:
+            verdict = "regression" if change > 0 else "improvement"
+        elif metric in HIGHER_IS_BETTER and abs(change) >= threshold:
+            verdict = "regression" if change < 0 else "improvement"
+        output.append((path, old, new, change, verdict))
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser("Compare benchmark results")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', help='Change (percent) reported as a regression.', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    if before.get("benchmark") != after.get("benchmark"):
+        parser.error("the results are from different benchmarks")
+
+    rows = compare(before["results"], after["results"], args.threshold)
+    for path, old, new, change, verdict in rows:
+        print("{:<40} {:>12g} {:>12g} {:>+8.1f}% {}".format(path, old, new, change, verdict))
+
+    if any(row[4] == "regression" for row in rows):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the threaded and asyncio engines of the connector against the simulated
+NOAA backend, where every fetch of a buoy sleeps to simulate NOAA.
+
+    python -m benchmarks.engines --stations 500 --latency 0.05 --workers 16
+"""
+import argparse
+from time import time
+from nautical_api.connector import NauticalDatabase
+from nautical_api.engine import ENGINES
+from .simulator import SimulatedNOAA
+
+
+def run(engine, num_stations, latency, workers):
+    """
+    Time the warm up of all stations, and a single batch request for all (cold) stations
+    for an engine.
+
+    :return: Dictionary of the timings in seconds
+    """
+    sim = SimulatedNOAA(num_stations, sources=1, latency=latency)
+    result = {}
+
+    for prefetch in (True, False):
+        db = NauticalDatabase.__wrapped__(
+            prefetch=prefetch,
+            prefetch_workers=workers,
+            fetch_workers=workers,
+            engine=engine,
+            sources_fn=sim.sources,
+            buoy_fn=sim.create_buoy
+        )
+
+        start = time()
+        db._pull_all()
+        if prefetch:
+            db._prefetch_thread.join()
+            result["warm"] = time() - start
+        else:
+            readings, errors = db.get_buoy_readings(db.get_all_buoy_ids())
+            result["cold_batch"] = time() - start
+            result["errors"] = len(errors)
+        db.stop()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser("Connector engine benchmark")
+    parser.add_argument('--stations', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    for engine in ENGINES:
+        result = run(engine, args.stations, args.latency, args.workers)
+        print("{:<8} warm up {:.3f}s, cold batch {:.3f}s, errors {}".format(
+            engine, result["warm"], result["cold_batch"], result["errors"]
+        ))
+
+
+if __name__ == '__main__':
+    main()
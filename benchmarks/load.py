@@ -0,0 +1,196 @@
+"""
+Load test of the REST api against the simulated NOAA backend. Concurrent clients send
+requests to each endpoint, first with a cold cache (a new database for each endpoint, no
+buoys retrieved and no bodies encoded) and then with a warm cache (all buoys retrieved).
+The latency percentiles and throughput are reported for each endpoint.
+
+The requests are sent to the Flask application in the same process (`--target flask`) or
+to the waitress server used by `nautical_api.app.main` (`--target waitress`).
+
+    python -m benchmarks.load --stations 1000 --latency lognormal:-3,0.5 --clients 8 --output load.json
+"""
+import argparse
+from logging import getLogger, ERROR
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from random import Random
+from threading import Thread
+from time import perf_counter
+from nautical_api.app import create_app
+from .common import database, save_results, summarize
+from .simulator import SimulatedNOAA
+
+
+ENDPOINTS = ("sources", "buoys", "buoy", "batch", "near")
+
+
+def make_path(endpoint, stations, rand, batch_size):
+    """
+    :return: path of a request to the endpoint
+    """
+    if endpoint == "sources":
+        return "/sources"
+    if endpoint == "buoys":
+        return "/buoys"
+    if endpoint == "buoy":
+        return "/buoys/{}".format(rand.choice(stations))
+    if endpoint == "batch":
+        return "/buoys/batch?ids={}".format(",".join(rand.sample(stations, batch_size)))
+    if endpoint == "near":
+        return "/buoys/near?lat={:.3f}&lon={:.3f}&radius_km=500".format(
+            rand.uniform(-60.0, 60.0), rand.uniform(-180.0, 180.0)
+        )
+    raise ValueError(endpoint)
+
+
+class FlaskTarget:
+
+    """
+    Send the requests to the Flask application in the same process.
+    """
+
+    def __init__(self):
+        self._app = create_app()
+
+    def client(self):
+        client = self._app.test_client()
+
+        def _get(path):
+            return client.get(path).status_code
+
+        return _get
+
+    def close(self):
+        pass
+
+
+class WaitressTarget:
+
+    """
+    Send the requests over HTTP to a waitress server, in the same manner as `nautical_api.app.main`.
+    """
+
+    def __init__(self, threads):
+        from waitress import create_server
+
+        self._server = create_server(create_app(), host="127.0.0.1", port=0, threads=threads)
+        self.port = self._server.effective_port
+        self._thread = Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+
+    def client(self):
+        conn = HTTPConnection("127.0.0.1", self.port)
+
+        def _get(path):
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            resp.read()
+            return resp.status
+
+        return _get
+
+    def close(self):
+        # closing the sockets while the loop is running fails, the server runs
+        # in a daemon thread until the process exits.
+        pass
+
+
+def load(target, endpoint, stations, clients, requests, batch_size, seed):
+    """
+    Send the requests to an endpoint from concurrent clients.
+
+    :return: summary of the requests, see `benchmarks.common.summarize`
+    """
+    def _client(index):
+        get = target.client()
+        rand = Random(seed + index)
+        latencies, errors = [], 0
+        for _ in range(requests):
+            path = make_path(endpoint, stations, rand, batch_size)
+            start = perf_counter()
+            status = get(path)
+            latencies.append(perf_counter() - start)
+            errors += int(status >= 400)
+        return latencies, errors
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(_client, range(clients)))
+    elapsed = perf_counter() - start
+
+    return summarize([x for latencies, _ in results for x in latencies], elapsed, sum(x for _, x in results))
+
+
+def run(args):
+    """
+    Run the load test for the cold and warm cache.
+
+    :return: dictionary of the cache state mapped to the summary of each endpoint
+    """
+    sim = SimulatedNOAA(args.stations, args.sources, args.latency, args.error_rate, args.seed)
+    results = {"cold": {}, "warm": {}}
+    options = dict(prefetch=False, fetch_workers=args.workers, sources_fn=sim.sources, buoy_fn=sim.create_buoy)
+
+    # the resources look up the database for each request, the target is shared by the databases
+    target = WaitressTarget(args.threads) if args.target == "waitress" else FlaskTarget()
+    try:
+        # each endpoint starts cold, the readings and bodies of the previous endpoints are not reused
+        for endpoint in args.endpoints:
+            with database(**options):
+                results["cold"][endpoint] = load(
+                    target, endpoint, sim.stations, args.clients, args.requests, args.batch_size, args.seed
+                )
+
+        with database(**options) as db:
+            start = perf_counter()
+            db.get_buoy_readings(db.get_all_buoy_ids())
+            results["warm_up_seconds"] = round(perf_counter() - start, 3)
+
+            for endpoint in args.endpoints:
+                results["warm"][endpoint] = load(
+                    target, endpoint, sim.stations, args.clients, args.requests, args.batch_size, args.seed
+                )
+    finally:
+        target.close()
+
+    results["fetches"] = sim.fetches
+    results["fetch_errors"] = sim.errors
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser("REST api load test")
+    parser.add_argument('--target', choices=["flask", "waitress"], default="flask")
+    parser.add_argument('--stations', type=int, default=500)
+    parser.add_argument('--sources', type=int, default=5)
+    parser.add_argument('--latency', help='Latency distribution of a fetch, see simulator.parse_latency.',
+                        default="fixed:0.02")
+    parser.add_argument('--error_rate', type=float, default=0.0)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', help='Number of requests sent by each client to each endpoint.',
+                        type=int, default=50)
+    parser.add_argument('--batch_size', type=int, default=20)
+    parser.add_argument('--workers', help='Fetch workers of the database.', type=int, default=16)
+    parser.add_argument('--threads', help='Threads of the waitress server.', type=int, default=16)
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Path of the JSON file where the results are saved.')
+    args = parser.parse_args()
+
+    # the simulated failures are logged as warnings
+    getLogger().setLevel(ERROR)
+
+    results = run(args)
+    for state in ("cold", "warm"):
+        for endpoint, summary in results[state].items():
+            print("{:<5} {:<8} {:>8.1f} req/s  p50 {:>8.3f}ms  p95 {:>8.3f}ms  p99 {:>8.3f}ms  errors {}".format(
+                state, endpoint, summary["throughput"], summary["p50_ms"], summary["p95_ms"],
+                summary["p99_ms"], summary["errors"]
+            ))
+
+    if args.output:
+        save_results(args.output, "load", vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
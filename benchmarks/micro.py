@@ -0,0 +1,87 @@
+"""
+Micro-benchmarks of the hot paths of the connector: encoding the buoy information
+and the lookups used by the resources. All buoys are retrieved (warm) from the
+simulated NOAA backend before the lookups are timed.
+
+    python -m benchmarks.micro --stations 1000 --output micro.json
+"""
+import argparse
+from random import Random
+from timeit import Timer
+from nautical_api.connector import jsonify_buoy_data
+from nautical_api.serializer import encode_buoy
+from json import dumps
+from .common import database, save_results
+from .simulator import SimulatedNOAA
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """
+    Time a function, the number of calls is chosen so each repetition takes at least `min_time`.
+
+    :return: dictionary of the best and median time (microseconds) of a single call
+    """
+    timer = Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = sorted(x / number * 1e6 for x in timer.repeat(repeat=repeat, number=number))
+    return {"calls": number * repeat, "best_us": round(times[0], 3), "median_us": round(times[len(times) // 2], 3)}
+
+
+def run(args):
+    """
+    :return: dictionary of the name of each benchmark mapped to its timing
+    """
+    sim = SimulatedNOAA(args.stations, args.sources, "fixed:0", 0.0, args.seed)
+    rand = Random(args.seed)
+    results = {}
+
+    with database(prefetch=False, sources_fn=sim.sources, buoy_fn=sim.create_buoy) as db:
+        buoy_ids = db.get_all_buoy_ids()
+        db.get_buoy_readings(buoy_ids)
+
+        data = db.get_buoy(buoy_ids[0])
+        source = db.get_all_source_ids()[0]
+        some = rand.sample(buoy_ids, min(50, len(buoy_ids)))
+
+        benchmarks = {
+            "jsonify_buoy_data": lambda: jsonify_buoy_data(data),
+            "dumps_jsonify_buoy_data": lambda: dumps(jsonify_buoy_data(data)),
+            "encode_buoy": lambda: encode_buoy(data),
+            "get_buoy": lambda: db.get_buoy(buoy_ids[rand.randrange(len(buoy_ids))]),
+            "get_buoy_readings_50": lambda: db.get_buoy_readings(some),
+            "get_all_buoy_ids": db.get_all_buoy_ids,
+            "get_all_source_ids": db.get_all_source_ids,
+            "get_aliases": db.get_aliases,
+            "get_source": lambda: db.get_source(source),
+            "get_buoys_near": lambda: db.get_buoys_near(rand.uniform(-60, 60), rand.uniform(-180, 180), 500.0, 10),
+            "query_buoys": lambda: db.query_buoys([("wvht", "gt", 4.0)])
+        }
+        for name, fn in benchmarks.items():
+            if not args.only or name in args.only:
+                results[name] = measure(fn, args.repeat, args.min_time)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser("Connector micro-benchmarks")
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--sources', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min_time', help='Min seconds of each repetition.', type=float, default=0.2)
+    parser.add_argument('--only', nargs='+', help='Names of the benchmarks to run.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Path of the JSON file where the results are saved.')
+    args = parser.parse_args()
+
+    results = run(args)
+    for name, timing in results.items():
+        print("{:<22} best {:>10.3f}us  median {:>10.3f}us".format(name, timing["best_us"], timing["median_us"]))
+
+    if args.output:
+        save_results(args.output, "micro", vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
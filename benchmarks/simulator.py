@@ -0,0 +1,120 @@
+"""
+Simulated NOAA backend for the benchmarks. The simulator replaces the calls to the
+nautical library made by the connector (`get_buoy_sources` and `create_buoy`) with
+local data, where each fetch of a buoy waits for a latency drawn from a distribution
+and fails at a configurable rate.
+
+    sim = SimulatedNOAA(stations=1000, latency="lognormal:-3,0.5", error_rate=0.01)
+    db = NauticalDatabase(sources_fn=sim.sources, buoy_fn=sim.create_buoy)
+"""
+from random import Random
+from threading import Lock
+from time import sleep
+from urllib.error import HTTPError
+from nautical.location.point import Point
+from nautical.noaa.buoy.buoy import Buoy
+from nautical.noaa.buoy.buoy_data import BuoyData
+from nautical.noaa.buoy.source import Source
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution.
+
+    - `fixed:<seconds>`
+    - `uniform:<low>,<high>`
+    - `lognormal:<mu>,<sigma>` (of the natural log of the seconds)
+    - `<seconds>` is the same as `fixed:<seconds>`
+
+    :param spec: Description of the distribution
+    :return: Function in the form of `func(random)` that returns a latency in seconds
+    """
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+
+    values = [float(x) for x in params.split(",")]
+    if kind == "fixed" and len(values) == 1:
+        return lambda _: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rand: rand.uniform(*values)
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rand: rand.lognormvariate(*values)
+    raise ValueError("invalid latency distribution: {}".format(spec))
+
+
+class SimulatedNOAA:
+
+    """
+    Local stand-in for NOAA. The stations are spread over the sources and have a
+    location, the information of a station changes on each fetch.
+    """
+
+    def __init__(self, stations=500, sources=5, latency="fixed:0.05", error_rate=0.0, seed=0):
+        """
+        :param stations: Number of stations
+        :param sources: Number of sources the stations are spread over
+        :param latency: Latency distribution of a fetch, see `parse_latency`
+        :param error_rate: Fraction of the fetches that fail (HTTPError)
+        :param seed: Seed of the random numbers
+        """
+        self.num_stations = int(stations)
+        self.error_rate = float(error_rate)
+        self._latency = parse_latency(latency)
+        self._rand = Random(seed)
+        self._lock = Lock()
+
+        self.fetches = 0
+        self.errors = 0
+
+        self._sources = {}
+        for i in range(max(1, int(sources))):
+            source = Source("Simulated Source/{}".format(i), "Simulated source")
+            self._sources[source.name] = source
+
+        sources = list(self._sources.values())
+        self.stations = []
+        for i in range(self.num_stations):
+            station = "S{:05d}".format(i)
+            location = Point(self._rand.uniform(-60.0, 60.0), self._rand.uniform(-180.0, 180.0))
+            sources[i % len(sources)].add_buoy(Buoy(station, location=location))
+            self.stations.append(station)
+
+    def sources(self):
+        """
+        Replaces `nautical.io.sources.get_buoy_sources`.
+
+        :return: dictionary of source names mapped to their respective source
+        """
+        return dict(self._sources)
+
+    def create_buoy(self, station):
+        """
+        Replaces `nautical.io.buoy.create_buoy`, waits for the latency of the fetch.
+
+        :param station: ID of the buoy
+        :return: nautical.noaa.buoy.Buoy with present data
+        :raises HTTPError: for the fraction of the fetches set by the error rate
+        """
+        with self._lock:
+            latency = self._latency(self._rand)
+            failed = self._rand.random() < self.error_rate
+            wvht = round(self._rand.uniform(0.2, 6.0), 1)
+            wspd = round(self._rand.uniform(0.0, 30.0), 1)
+            self.fetches += 1
+            self.errors += int(failed)
+
+        sleep(max(0.0, latency))
+        if failed:
+            raise HTTPError("https://www.ndbc.noaa.gov/station_page.php?station={}".format(station),
+                            503, "Simulated failure", None, None)
+
+        data = BuoyData()
+        data.set("wvht", wvht)
+        data.set("wspd", wspd)
+        data.set("wdir", "NW")
+        data.set("atmp", 15.0)
+
+        buoy = Buoy(station)
+        buoy.present = data
+        return buoy
@@ -0,0 +1,6 @@
+from time import time
+
+
+# Time (seconds since the epoch) that the package was imported, the cold start of the
+# application is measured from it
+STARTED = time()
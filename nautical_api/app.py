@@ -1,14 +1,29 @@
 import argparse
 from signal import signal, SIGINT, SIGTERM
 from threading import Event
-from time import sleep
+from time import perf_counter, time
 from logging import getLogger, DEBUG, INFO, WARNING, CRITICAL, ERROR, StreamHandler, Formatter
 from sys import stdout
-from os import environ
-from flask import Flask
+from os import environ, path
+from multiprocessing import get_context
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+from tempfile import gettempdir
+from flask import Flask, g, request
 from flask_restful import Api
 from .resources import *
-from .connector import NauticalDatabase
+from .connector import (
+    NauticalDatabase, DEFAULT_PREFETCH_WORKERS, DEFAULT_FETCH_WORKERS, DEFAULT_SOURCE_INTERVAL,
+    DEFAULT_FETCH_RETRIES, DEFAULT_RETRY_DELAY
+)
+from .breaker import DEFAULT_NEGATIVE_TTL, DEFAULT_THRESHOLD, DEFAULT_COOLDOWN
+from .engine import ENGINES
+from .history import DEFAULT_HISTORY_SIZE
+from .frequency import DEFAULT_HOT_SIZE
+from .columnar import DEFAULT_SNAPSHOT_KEEP, DEFAULT_SNAPSHOT_INTERVAL
+from .responses import output_json
+from .metrics import REQUEST_SECONDS, RESPONSES, STARTUP_SECONDS
+from . import STARTED
+from .serializer import BACKENDS, set_backend
 
 
 h = StreamHandler(stdout)
@@ -16,6 +31,70 @@ h = StreamHandler(stdout)
 h.setFormatter(Formatter('[%(levelname)s] [%(asctime)s]: %(message)s'))
 getLogger().addHandler(h)
 
+# Names of the logging levels of the application
+LOG_LEVELS = {
+    "WARNING": WARNING,
+    "ERROR": ERROR,
+    "CRITICAL": CRITICAL,
+    "INFO": INFO,
+    "DEBUG": DEBUG
+}
+# Endpoints of the checks, their responses do not end the cold start
+PROBE_ENDPOINTS = ("health", "ready", "metrics")
+# set once the first successful response was sent
+_first_response = Event()
+
+
+def create_app():
+    """
+    Create the flask application and add all resources to the api.
+
+    :return: Flask application
+    """
+    app = Flask("nautical_rest_api")
+    api = Api(app)
+    api.representations["application/json"] = output_json
+
+    # Add all resources to the api
+    api.add_resource(AllSourcesGetter(), "/sources")
+    api.add_resource(SpecificSourceGetter(), "/sources/<string:source_id>")
+    api.add_resource(AllBuoysGetter(), "/buoys")
+    api.add_resource(BatchBuoyGetter(), "/buoys/batch")
+    api.add_resource(BuoyExportGetter(), "/buoys/export")
+    api.add_resource(BuoyQueryGetter(), "/buoys/query")
+    api.add_resource(NearBuoysGetter(), "/buoys/near")
+    api.add_resource(BoundingBoxBuoysGetter(), "/buoys/bbox")
+    api.add_resource(SpecificBuoyGetter(), "/buoys/<string:buoy_id>")
+    api.add_resource(BuoyHistoryGetter(), "/buoys/<string:buoy_id>/history")
+    api.add_resource(EventStreamGetter(), "/events")
+    api.add_resource(ChangesGetter(), "/changes")
+    api.add_resource(ScheduleGetter(), "/schedule")
+    api.add_resource(HotSetGetter(), "/hotset")
+    api.add_resource(BreakersGetter(), "/breakers")
+    api.add_resource(CompressionStatsGetter(), "/stats/compression")
+    api.add_resource(MetricsGetter(), "/metrics")
+    api.add_resource(SnapshotFileGetter(), "/snapshot")
+    api.add_resource(HealthGetter(), "/healthz")
+    api.add_resource(ReadyGetter(), "/readyz")
+
+    @app.before_request
+    def _start_timer():
+        g.start = perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        endpoint = request.endpoint or "unknown"
+        REQUEST_SECONDS.labels(endpoint).observe(perf_counter() - g.start)
+        RESPONSES.labels(endpoint, str(response.status_code)).inc()
+        if not _first_response.is_set() and response.status_code < 400 and endpoint not in PROBE_ENDPOINTS:
+            _first_response.set()
+            seconds = time() - STARTED
+            STARTUP_SECONDS.labels("first_response").set(seconds)
+            log.info("First response ({}) {:.3f} seconds after the start".format(endpoint, seconds))
+        return response
+
+    return app
+
 
 def main():
     """
@@ -30,16 +109,149 @@ def main():
     )
     parser.add_argument('-p', '--port', help='Port where the app is executed.', default=5000)
     parser.add_argument('-a', '--host', help='Host where the app is executed.', default="localhost")
+    parser.add_argument(
+        '--no_prefetch', help='Do not warm the buoys after each pull.', action='store_true'
+    )
+    parser.add_argument(
+        '--prefetch_workers',
+        help='Max number of buoys fetched concurrently while warming.',
+        type=int,
+        default=DEFAULT_PREFETCH_WORKERS
+    )
+    parser.add_argument(
+        '--prefetch_sources',
+        help='Names or endpoints of the sources to warm, all sources when not provided.',
+        nargs='+',
+        default=None
+    )
+    parser.add_argument(
+        '--hot_size',
+        help='Number of the most requested buoys (hot set) that are warmed and refreshed first.',
+        type=int,
+        default=DEFAULT_HOT_SIZE
+    )
+    parser.add_argument(
+        '--prefetch_hot_only',
+        help='Only warm and refresh the hot set in the background, other buoys are fetched on request.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--cache_entries',
+        help='Max number of buoy readings kept in memory, the least recently used are evicted.',
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--cache_bytes',
+        help='Max number of bytes (estimated) used by the buoy readings kept in memory.',
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--cache_ttl',
+        help='Seconds after the observation that a buoy reading expires.',
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--fetch_workers',
+        help='Max number of buoys fetched concurrently in the background (in flight for asyncio).',
+        type=int,
+        default=DEFAULT_FETCH_WORKERS
+    )
+    parser.add_argument(
+        '--fetch_retries',
+        help='Number of times a buoy is retrieved again after a transient error (timeout, HTTP 5xx).',
+        type=int,
+        default=DEFAULT_FETCH_RETRIES
+    )
+    parser.add_argument(
+        '--retry_delay',
+        help='Seconds before the first retry, doubled (with a random jitter) for each retry.',
+        type=float,
+        default=DEFAULT_RETRY_DELAY
+    )
+    parser.add_argument(
+        '--negative_ttl',
+        help='Seconds that a failure to retrieve a buoy is cached.',
+        type=float,
+        default=DEFAULT_NEGATIVE_TTL
+    )
+    parser.add_argument(
+        '--breaker_threshold',
+        help='Consecutive failures of a buoy that stop retrieving the buoy for a cooldown.',
+        type=int,
+        default=DEFAULT_THRESHOLD
+    )
+    parser.add_argument(
+        '--breaker_cooldown',
+        help='Seconds before retrieving a failing buoy again, doubled each time it fails again.',
+        type=float,
+        default=DEFAULT_COOLDOWN
+    )
+    parser.add_argument(
+        '--engine',
+        help='Engine that schedules the pulls and runs the fetches.',
+        default="thread",
+        choices=list(ENGINES.keys())
+    )
+    parser.add_argument(
+        '--store',
+        help='Path to the persistent (SQLite) store used to serve the last known data after a restart.',
+        default=environ.get("NAUTICAL_REST_API_STORE")
+    )
+    parser.add_argument(
+        '--history_size',
+        help='Max number of readings kept in the history of each buoy, 0 to disable.',
+        type=int,
+        default=DEFAULT_HISTORY_SIZE
+    )
+    parser.add_argument(
+        '--source_interval',
+        help='Seconds between the pulls of the sources, the buoys are refreshed on their own schedule.',
+        type=float,
+        default=DEFAULT_SOURCE_INTERVAL
+    )
+
+    parser.add_argument(
+        '--json_backend',
+        help='Backend used to encode the responses, orjson (when installed) writes compact JSON.',
+        default="stdlib",
+        choices=list(BACKENDS)
+    )
+    parser.add_argument(
+        '--snapshot_dir',
+        help='Directory of the columnar (Arrow IPC) snapshot files of the data, requires pyarrow.',
+        default=environ.get("NAUTICAL_REST_API_SNAPSHOT_DIR")
+    )
+    parser.add_argument(
+        '--snapshot_keep',
+        help='Number of snapshot files that are kept.',
+        type=int,
+        default=DEFAULT_SNAPSHOT_KEEP
+    )
+    parser.add_argument(
+        '--snapshot_interval',
+        help='Min seconds between the snapshot files, a file is only written when the data changed.',
+        type=float,
+        default=DEFAULT_SNAPSHOT_INTERVAL
+    )
+    parser.add_argument(
+        '--processes',
+        help='Number of worker processes, a single worker retrieves the data and shares it through the store.',
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        '--threads',
+        help='Number of threads used by the server, each open event stream holds a thread.',
+        type=int,
+        default=16
+    )
 
     args = parser.parse_args()
 
-    getLogger().setLevel({
-        "WARNING": WARNING,
-        "ERROR": ERROR,
-        "CRITICAL": CRITICAL,
-        "INFO": INFO,
-        "DEBUG": DEBUG
-    }.get(args.log_level, WARNING))
+    getLogger().setLevel(LOG_LEVELS.get(args.log_level, WARNING))
 
     def handle_shutdown(*_, has_shutdown=False):
         log.debug("Stopping database ...")
@@ -53,16 +265,15 @@ def main():
     # only handle the Ctrl-C 
     signal(SIGINT, handle_shutdown)
     
-    # Start the database that will run in the background
-    NauticalDatabase().run()
-    app = Flask("nautical_rest_api")
-    api = Api(app)
+    set_backend(args.json_backend)
 
-    # Add all resources to the api
-    api.add_resource(AllSourcesGetter(), "/sources")
-    api.add_resource(SpecificSourceGetter(), "/sources/<string:source_id>")
-    api.add_resource(AllBuoysGetter(), "/buoys")
-    api.add_resource(SpecificBuoyGetter(), "/buoys/<string:buoy_id>")
+    if args.processes > 1:
+        serve_processes(args)
+        return
+
+    # Start the database that will run in the background
+    start_database(args)
+    app = create_app()
 
     port = environ.get("NAUTICAL_REST_API_PORT", args.port)
 
@@ -75,7 +286,116 @@ def main():
         # name localhost is not support, causing OSError with sockets. use 0.0.0.0 in
         # place of localhost
         host = args.host if args.host.lower() != "localhost" else "0.0.0.0"
-        serve(app, host=host, port=args.port)
+        serve(app, host=host, port=args.port, threads=args.threads)
+
+
+def start_database(args, **kwargs):
+    """
+    Start the database that will run in the background.
+
+    :param args: Parsed arguments of the application, see `main`
+    :param kwargs: Arguments of the NauticalDatabase that replace the arguments of the application
+    :return: NauticalDatabase
+    """
+    options = dict(
+        prefetch=not args.no_prefetch,
+        prefetch_workers=args.prefetch_workers,
+        prefetch_sources=args.prefetch_sources,
+        fetch_workers=args.fetch_workers,
+        engine=args.engine,
+        store=args.store,
+        history_size=args.history_size,
+        source_interval=args.source_interval,
+        hot_size=args.hot_size,
+        prefetch_hot_only=args.prefetch_hot_only,
+        cache_entries=args.cache_entries,
+        cache_bytes=args.cache_bytes,
+        cache_ttl=args.cache_ttl,
+        fetch_retries=args.fetch_retries,
+        retry_delay=args.retry_delay,
+        negative_ttl=args.negative_ttl,
+        breaker_threshold=args.breaker_threshold,
+        breaker_cooldown=args.breaker_cooldown,
+        snapshot_dir=args.snapshot_dir,
+        snapshot_keep=args.snapshot_keep,
+        snapshot_interval=args.snapshot_interval
+    )
+    options.update(kwargs)
+
+    # the server starts while the first pull runs in the background, see `/readyz`
+    db = NauticalDatabase(**options)
+    db.run(block=False)
+    return db
+
+
+def _serve_worker(args, sock, store, leader_lock):
+    """
+    Entry point of a worker process, see `serve_processes`.
+    """
+    # the worker is spawned, the settings of the parent process are applied again
+    getLogger().setLevel(LOG_LEVELS.get(args.log_level, WARNING))
+    set_backend(args.json_backend)
+
+    def handle_shutdown(*_):
+        NauticalDatabase().stop()
+        exit(0)
+
+    signal(SIGINT, handle_shutdown)
+    signal(SIGTERM, handle_shutdown)
+
+    from waitress import serve
+
+    start_database(args, store=store, leader_lock=leader_lock)
+    serve(create_app(), sockets=[sock], threads=args.threads)
+
+
+def serve_processes(args):
+    """
+    Serve the application from `args.processes` worker processes that share a listening socket.
+    A single worker retrieves the data from NOAA, the other workers load the data from the store,
+    see `nautical_api.cluster`. Workers that exit are replaced until the application is stopped.
+
+    :param args: Parsed arguments of the application, see `main`
+    """
+    host = args.host if args.host.lower() != "localhost" else "0.0.0.0"
+    store = args.store or path.join(gettempdir(), "nautical_api_{}.db".format(args.port))
+    leader_lock = store + ".lock"
+
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind((host, int(args.port)))
+    sock.listen(1024)
+
+    # spawn the workers (forking a process that runs threads is not safe), the socket
+    # is passed to each worker
+    context = get_context("spawn")
+    stopping = Event()
+
+    def _start_worker():
+        worker = context.Process(target=_serve_worker, args=(args, sock, store, leader_lock))
+        worker.start()
+        return worker
+
+    def handle_shutdown(*_):
+        stopping.set()
+
+    signal(SIGINT, handle_shutdown)
+    signal(SIGTERM, handle_shutdown)
+
+    log.info("Starting {} workers on {}:{} sharing {}".format(args.processes, host, args.port, store))
+    workers = [_start_worker() for _ in range(args.processes)]
+    while not stopping.wait(1.0):
+        for index, worker in enumerate(workers):
+            if not worker.is_alive():
+                log.warning("Worker {} exited with {}, restarting".format(worker.pid, worker.exitcode))
+                workers[index] = _start_worker()
+
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join(10)
+    sock.close()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,151 @@
+"""
+Circuit breakers for the stations that fail to be retrieved. Each failure is cached
+(negatively) for a short time so the requests for the station do not retry the failing
+fetch. When a station keeps failing its breaker opens and no fetch is attempted until
+the cooldown ends, the next fetch is then a trial (half open) that closes the breaker
+when it succeeds or opens it again, with a longer cooldown, when it fails.
+"""
+from threading import Lock
+from time import time
+from typing import NamedTuple
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Seconds that a failure is cached
+DEFAULT_NEGATIVE_TTL = 60.0
+# Consecutive failures that open the breaker
+DEFAULT_THRESHOLD = 5
+# Seconds that the breaker stays open the first time, doubled each time the trial fails
+DEFAULT_COOLDOWN = 5 * 60.0
+MAX_COOLDOWN = 6 * 60 * 60.0
+
+
+class BreakerState(NamedTuple):
+    """State of the breaker of a single station.
+    """
+
+    station: str
+    state: str = CLOSED
+    failures: int = 0
+    trips: int = 0
+    retry_at: float = 0.0
+    error: str = None
+
+
+class CircuitBreakers:
+
+    """
+    Negative cache and circuit breaker of each station. Only the stations that failed
+    are tracked, a success removes the station.
+    """
+
+    def __init__(
+        self,
+        negative_ttl=DEFAULT_NEGATIVE_TTL,
+        threshold=DEFAULT_THRESHOLD,
+        cooldown=DEFAULT_COOLDOWN,
+        max_cooldown=MAX_COOLDOWN
+    ):
+        """
+        :param negative_ttl: Seconds that a failure is cached, no fetch is attempted meanwhile
+        :param threshold: Consecutive failures that open the breaker
+        :param cooldown: Seconds that the breaker stays open the first time it opens
+        :param max_cooldown: Max seconds that the breaker stays open
+        """
+        self.negative_ttl = float(negative_ttl)
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self.max_cooldown = float(max_cooldown)
+
+        self._states = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def allow(self, station, now=None):
+        """
+        Check if the station can be fetched. When the cooldown of an open breaker has ended
+        a single trial fetch is allowed (half open).
+
+        :param station: ID of the station
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: True when the station can be fetched
+        """
+        state = self._states.get(station)
+        if state is None:
+            return True
+
+        now = time() if now is None else now
+        with self._lock:
+            state = self._states.get(station)
+            if state is None:
+                return True
+            if now < state.retry_at:
+                return False
+            if state.state != CLOSED:
+                # another trial is allowed when the result of the trial does not arrive in time
+                self._states[station] = state._replace(state=HALF_OPEN, retry_at=now + self.negative_ttl)
+            return True
+
+    def success(self, station):
+        """
+        Record a successful fetch, the breaker of the station is closed.
+
+        :param station: ID of the station
+        """
+        if station in self._states:
+            with self._lock:
+                self._states.pop(station, None)
+
+    def failure(self, station, error=None, now=None):
+        """
+        Record a failed fetch. The failure is cached for `negative_ttl` seconds, the breaker
+        opens after `threshold` consecutive failures or when the trial fetch fails.
+
+        :param station: ID of the station
+        :param error: Reason of the failure
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: BreakerState of the station
+        """
+        now = time() if now is None else now
+        with self._lock:
+            state = self._states.get(station) or BreakerState(station)
+            failures = state.failures + 1
+            if state.state == HALF_OPEN or failures >= self.threshold:
+                trips = state.trips + 1
+                cooldown = min(self.max_cooldown, self.cooldown * 2 ** min(trips - 1, 32))
+                state = state._replace(state=OPEN, failures=failures, trips=trips, retry_at=now + cooldown, error=error)
+            else:
+                state = state._replace(failures=failures, retry_at=now + self.negative_ttl, error=error)
+            self._states[station] = state
+            return state
+
+    def get(self, station):
+        """
+        :param station: ID of the station
+        :return: BreakerState of the station, None when the station has not failed
+        """
+        return self._states.get(station)
+
+    def states(self):
+        """
+        :return: list of the BreakerState of the stations that failed, sorted by station
+        """
+        with self._lock:
+            states = list(self._states.values())
+        return sorted(states, key=lambda x: x.station)
+
+    def retain(self, stations):
+        """
+        Remove the stations that are not in `stations`.
+
+        :param stations: IDs of the stations to keep
+        """
+        stations = set(stations)
+        with self._lock:
+            for station in [x for x in self._states if x not in stations]:
+                del self._states[station]
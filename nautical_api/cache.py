@@ -0,0 +1,178 @@
+"""
+Bounded cache of the buoy readings. The cache keeps the order in which the readings were
+used, when the cache holds more readings (or bytes) than its budget the least recently used
+readings are evicted. Each reading expires `ttl` seconds after the observation (not after
+the time it was fetched), so old observations are not served because they were fetched
+recently. A reading is still kept at least `min_ttl` seconds after it was fetched, so a
+station that stopped reporting is not fetched again on every request.
+
+The cache only tracks the order, the sizes and the expiry of the readings. The readings
+are stored by the `NauticalDatabase`, the evicted buoys are returned to the database so
+it can drop their readings.
+"""
+from collections import OrderedDict
+from sys import getsizeof
+from time import time
+from .serializer import FIELDS
+from .metrics import CACHE_EVICTIONS
+
+
+# Reasons that a reading is evicted
+EVICT_SIZE = "size"
+EVICT_EXPIRED = "expired"
+# Min seconds after the fetch that a reading is kept (at most `ttl`)
+MIN_TTL = 60.0
+
+
+def reading_size(reading):
+    """
+    Estimate the number of bytes used by a reading, the reading, the buoy information
+    and the values of its fields are included.
+
+    :param reading: nautical_api.connector.Reading
+    :return: number of bytes
+    """
+    data = reading.data
+    size = getsizeof(reading) + getsizeof(data)
+    for field in FIELDS:
+        value = getattr(data, field, None)
+        if value is not None:
+            size += getsizeof(value)
+    return size
+
+
+def observed_time(reading):
+    """
+    :param reading: nautical_api.connector.Reading
+    :return: time (seconds since the epoch) of the observation, the time the reading
+    was fetched when the observation time is not known
+    """
+    return getattr(reading.data, "epoch_time", 0) or reading.fetched
+
+
+class ReadingCache:
+
+    """
+    Least recently used order, sizes and expiry of the cached readings. The cache is not
+    thread safe, the database calls it while holding its lock.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None, min_ttl=MIN_TTL):
+        """
+        :param max_entries: Max number of readings, unlimited when `None`
+        :param max_bytes: Max number of bytes used by the readings (estimated), unlimited when `None`
+        :param ttl: Seconds after the observation that a reading expires, never when `None`
+        :param min_ttl: Min seconds after the fetch that a reading is kept, limited to `ttl`
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+
+        # buoy mapped to the tuple of the size and the expiry of its reading
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.evictions = {EVICT_SIZE: 0, EVICT_EXPIRED: 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _evict(self, key, reason):
+        size, _ = self._entries.pop(key)
+        self.nbytes -= size
+        self.evictions[reason] += 1
+        CACHE_EVICTIONS.labels(reason).inc()
+
+    def add(self, key, reading):
+        """
+        Add (or replace) the reading of a buoy, the least recently used readings are
+        evicted until the cache is within its budget. The new reading is never evicted. A
+        replaced reading keeps its place in the order, the order only follows the uses.
+
+        :param key: ID of the buoy
+        :param reading: Reading of the buoy
+        :return: list of the IDs of the evicted buoys
+        """
+        previous = self._entries.get(key)
+        if previous is not None:
+            self.nbytes -= previous[0]
+
+        size = reading_size(reading)
+        expires = None
+        if self.ttl is not None:
+            expires = max(observed_time(reading) + self.ttl, reading.fetched + min(self.ttl, self.min_ttl))
+        self._entries[key] = (size, expires)
+        self.nbytes += size
+
+        evicted = []
+        while len(self._entries) > 1 and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries) or
+            (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            oldest = next(x for x in self._entries if x != key)
+            self._evict(oldest, EVICT_SIZE)
+            evicted.append(oldest)
+        return evicted
+
+    def touch(self, key, now=None, used=True):
+        """
+        Mark the reading of the buoy as used. An expired reading is evicted.
+
+        :param key: ID of the buoy
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :param used: When False (lookups in the background, such as the warm up) the order
+        of the readings is not changed
+        :return: True when the reading is cached, False when it is not cached or it expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+
+        if entry[1] is not None and (time() if now is None else now) >= entry[1]:
+            self._evict(key, EVICT_EXPIRED)
+            return False
+
+        if used:
+            self._entries.move_to_end(key)
+        return True
+
+    def expired(self, key, now=None):
+        """
+        Check if the reading of the buoy expired, the order of the readings is not changed.
+
+        :param key: ID of the buoy
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: True when the reading is cached and it expired
+        """
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] is not None and (time() if now is None else now) >= entry[1]
+
+    def remove(self, key):
+        """
+        Remove the reading of the buoy, the removal is not counted as an eviction.
+
+        :param key: ID of the buoy
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[0]
+
+    def retain(self, keys):
+        """
+        Remove the readings of the buoys that are not in `keys`.
+
+        :param keys: IDs of the buoys to keep
+        """
+        keys = set(keys)
+        for key in [x for x in self._entries if x not in keys]:
+            self.remove(key)
+
+    def stats(self):
+        """
+        :return: dictionary with the number of `entries` and `bytes` and the number of
+        `evictions` by reason
+        """
+        return {"entries": len(self._entries), "bytes": self.nbytes, "evictions": dict(self.evictions)}
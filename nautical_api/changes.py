@@ -0,0 +1,125 @@
+"""
+Log of the changes to the sources and buoys so that clients can request only what
+changed since their last request. Each change is stamped with a generation, the
+generations increase monotonically, including across restarts of the process (the
+first generation is the time, in milliseconds, when the log was created).
+
+Removed sources and buoys leave a tombstone in the log. The number of tombstones is
+bounded, when the oldest tombstones are compacted clients that last synced before
+them are told to reset (resync everything).
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import List, NamedTuple, Tuple
+
+
+DEFAULT_MAX_TOMBSTONES = 10000
+# kinds of the keys in the log
+SOURCE = "source"
+BUOY = "buoy"
+
+
+class ChangeSet(NamedTuple):
+    """Keys that changed or were removed after a generation. When `reset` is set the
+    client must discard everything it has, `changed` contains all current keys.
+    """
+
+    generation: int
+    reset: bool
+    changed: List[Tuple[str, str]]
+    removed: List[Tuple[str, str]]
+
+
+class ChangeLog:
+
+    """
+    Ordered log of the latest generation of each key. The keys are tuples of the kind
+    (such as `buoy`) and the identifier.
+    """
+
+    def __init__(self, max_tombstones=DEFAULT_MAX_TOMBSTONES, start=None):
+        """
+        :param max_tombstones: Max number of tombstones kept in the log
+        :param start: First generation of the log, defaults to the current time in milliseconds
+        """
+        self.max_tombstones = max(0, int(max_tombstones))
+        self._generation = int(time() * 1000) if start is None else int(start)
+        # clients that synced before the horizon must reset
+        self._horizon = self._generation
+        # keys mapped to their generation, ordered by generation
+        self._entries = OrderedDict()
+        self._tombstones = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def generation(self):
+        """
+        :return: Generation of the most recent change
+        """
+        return self._generation
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, keys):
+        """
+        Stamp the keys as changed with a new generation.
+
+        :param keys: Keys that changed
+        :return: Generation of the change
+        """
+        return self._stamp(keys, False)
+
+    def remove(self, keys):
+        """
+        Stamp the keys as removed (tombstones) with a new generation.
+
+        :param keys: Keys that were removed
+        :return: Generation of the change
+        """
+        return self._stamp(keys, True)
+
+    def _stamp(self, keys, removed):
+        keys = list(keys)
+        with self._lock:
+            if not keys:
+                return self._generation
+
+            self._generation += 1
+            for key in keys:
+                self._entries[key] = self._generation
+                self._entries.move_to_end(key)
+                self._tombstones.pop(key, None)
+                if removed:
+                    self._tombstones[key] = self._generation
+
+            # compact the oldest tombstones
+            while len(self._tombstones) > self.max_tombstones:
+                key, generation = self._tombstones.popitem(last=False)
+                self._entries.pop(key)
+                self._horizon = max(self._horizon, generation)
+
+            return self._generation
+
+    def since(self, generation):
+        """
+        Get the keys that changed after the generation. The keys are found starting from the
+        most recent change, so the cost depends on the number of changes returned.
+
+        :param generation: Generation of the last sync of the client, `None` for all keys
+        :return: ChangeSet
+        """
+        with self._lock:
+            reset = generation is None or generation < self._horizon or generation > self._generation
+            changed, removed = [], []
+            for key in reversed(self._entries):
+                stamp = self._entries[key]
+                if not reset and stamp <= generation:
+                    break
+                if key in self._tombstones:
+                    if not reset:
+                        removed.append(key)
+                else:
+                    changed.append(key)
+            return ChangeSet(self._generation, reset, changed, removed)
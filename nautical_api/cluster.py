@@ -0,0 +1,81 @@
+"""
+Multi-process mode of the application. Several worker processes serve the requests
+from a socket shared by all workers, a single worker (the leader) pulls the sources
+and retrieves the buoys from NOAA, the other workers (followers) load the data that
+the leader saves to the persistent (SQLite) store, see `nautical_api.store`.
+
+The leader is elected with an exclusive lock (`flock`) on a lock file. The operating
+system releases the lock when the leader exits, one of the followers then acquires the
+lock and becomes the leader. The lock requires a POSIX system.
+"""
+import os
+from logging import getLogger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+log = getLogger()
+
+# Seconds between the checks for the data published by the leader
+DEFAULT_SYNC_INTERVAL = 0.5
+# Seconds that a follower waits for the leader to retrieve a buoy
+DEFAULT_SHARED_TIMEOUT = 10.0
+
+
+class LeaderLock:
+
+    """
+    Exclusive, non-blocking lock on a file. Only one open lock (in any process) can
+    hold the lock at a time.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to the lock file, created when it does not exist
+        :raises RuntimeError: when file locks are not supported on this system
+        """
+        if fcntl is None:
+            raise RuntimeError("{} requires fcntl (POSIX)".format(self.__class__.__name__))
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        """
+        :return: True when the lock is held
+        """
+        return self._fd is not None
+
+    def acquire(self):
+        """
+        Try to acquire the lock without blocking.
+
+        :return: True when the lock is held
+        """
+        if self._fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("utf-8"))
+        self._fd = fd
+        log.info("{} acquired {} (pid {})".format(self.__class__.__name__, self.path, os.getpid()))
+        return True
+
+    def release(self):
+        """
+        Release the lock if it is held.
+        """
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,172 @@
+"""
+Columnar snapshot files of the sources and the current information of every buoy. Each file
+is an Arrow IPC file (one row per buoy) that local consumers can memory map and read without
+copying or parsing, for example with `pyarrow.ipc.open_file(pyarrow.memory_map(path))`.
+
+Each row contains the station, the aliases of the sources that include it, its location, the
+time of the observation and of the retrieval, and the numeric fields of its reading (NaN when
+not set). The names and descriptions of the sources and the generation of the data are saved
+in the metadata of the schema.
+
+The files are written to a temporary file and renamed, so a reader never sees a partial file.
+Only the latest files are kept. The files require `pyarrow` (`pip install nautical_api[arrow]`),
+without it no file is written.
+"""
+import os
+from json import dumps
+from logging import getLogger
+from time import time
+from .history import NUMERIC_FIELDS
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+log = getLogger()
+
+PREFIX = "snapshot-"
+SUFFIX = ".arrow"
+MIMETYPE = "application/vnd.apache.arrow.file"
+# Number of files that are kept
+DEFAULT_SNAPSHOT_KEEP = 3
+# Min seconds between the files
+DEFAULT_SNAPSHOT_INTERVAL = 60.0
+
+
+def _memberships(snapshot):
+    """
+    :param snapshot: nautical_api.connector.Snapshot
+    :return: tuple of the dictionary of the stations mapped to the aliases of their sources, and
+    the dictionary of the stations mapped to their location (latitude, longitude)
+    """
+    members = {}
+    locations = {}
+    for alias, name in snapshot.aliases.items():
+        for buoy in snapshot.sources[name].buoys.values():
+            station = str(buoy.station)
+            members.setdefault(station, []).append(alias)
+            if station not in locations:
+                location = buoy.location
+                if location is not None and location.latitude is not None and location.longitude is not None:
+                    locations[station] = (float(location.latitude), float(location.longitude))
+    return members, locations
+
+
+def build_table(generation, snapshot, readings, stations, columns):
+    """
+    Create the table of the snapshot. The numeric columns are not copied, the arrays are
+    used as the buffers of the table.
+
+    :param generation: Generation of the data (see `nautical_api.changes`)
+    :param snapshot: nautical_api.connector.Snapshot of the sources
+    :param readings: dictionary of the buoy IDs mapped to their Reading or None
+    :param stations: Buoy IDs in the order of the rows of the columns
+    :param columns: dictionary of the numeric fields mapped to their column (array of doubles),
+    see `nautical_api.table.ReadingTable.columns`
+    :return: pyarrow.Table
+    """
+    members, locations = _memberships(snapshot)
+    rows = len(stations)
+
+    observed, fetched, stale = [], [], []
+    for station in stations:
+        reading = readings.get(station)
+        if reading is None:
+            observed.append(None)
+            fetched.append(None)
+            stale.append(None)
+        else:
+            observed.append(getattr(reading.data, "epoch_time", 0) or None)
+            fetched.append(reading.fetched)
+            stale.append(reading.stale)
+
+    arrays = {
+        "station": pyarrow.array(stations, pyarrow.string()),
+        "sources": pyarrow.array([members.get(x, []) for x in stations], pyarrow.list_(pyarrow.string())),
+        "latitude": pyarrow.array([locations.get(x, (None, None))[0] for x in stations], pyarrow.float64()),
+        "longitude": pyarrow.array([locations.get(x, (None, None))[1] for x in stations], pyarrow.float64()),
+        "observed": pyarrow.array(observed, pyarrow.int64()),
+        "fetched": pyarrow.array(fetched, pyarrow.float64()),
+        "stale": pyarrow.array(stale, pyarrow.bool_()),
+    }
+    for field in NUMERIC_FIELDS:
+        arrays[field] = pyarrow.Array.from_buffers(
+            pyarrow.float64(), rows, [None, pyarrow.py_buffer(columns[field])]
+        )
+
+    sources = [
+        {"name": name, "alias": alias, "description": snapshot.sources[name].description}
+        for alias, name in snapshot.aliases.items()
+    ]
+    metadata = {
+        "generation": str(generation),
+        "written": str(time()),
+        "sources": dumps(sources, default=str)
+    }
+    return pyarrow.table(arrays).replace_schema_metadata(metadata)
+
+
+class SnapshotFiles:
+
+    """
+    Directory of the snapshot files, the files are named after the generation of their data
+    so the latest file is last in the order of the names.
+    """
+
+    def __init__(self, directory, keep=DEFAULT_SNAPSHOT_KEEP):
+        """
+        :param directory: Directory of the files, created when it does not exist
+        :param keep: Number of files that are kept
+        :raises RuntimeError: when pyarrow is not installed
+        """
+        if pyarrow is None:
+            raise RuntimeError("{} requires pyarrow".format(self.__class__.__name__))
+        self.directory = directory
+        self.keep = max(1, int(keep))
+        os.makedirs(directory, exist_ok=True)
+
+    def files(self):
+        """
+        :return: list of the paths of the files, the latest file last
+        """
+        names = sorted(
+            x for x in os.listdir(self.directory) if x.startswith(PREFIX) and x.endswith(SUFFIX)
+        )
+        return [os.path.join(self.directory, x) for x in names]
+
+    def latest(self):
+        """
+        :return: path of the latest file, None when no file was written
+        """
+        files = self.files()
+        return files[-1] if files else None
+
+    def write(self, generation, table):
+        """
+        Write the table to a new file, the file is renamed once it is complete. The oldest
+        files are removed so only `keep` files remain.
+
+        :param generation: Generation of the data, the name of the file
+        :param table: pyarrow.Table, see `build_table`
+        :return: path of the file
+        """
+        path = os.path.join(self.directory, "{}{:020d}{}".format(PREFIX, int(generation), SUFFIX))
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with pyarrow.OSFile(temporary, "wb") as sink:
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+        for old in self.files()[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError as e:
+                log.warning("{} failed to remove {}: {}".format(self.__class__.__name__, old, e))
+        return path
@@ -4,44 +4,109 @@ of the data using the nautical library and put the information into
 a database
 
 """
-from nautical.io.sources import get_buoy_sources
-from nautical.io.buoy import create_buoy
 from nautical.noaa.buoy.buoy_data import BuoyData
 from nautical.noaa.buoy.source import Source
-from json import dumps
-from typing import List, Dict, Union, Any
+from types import MappingProxyType
+from typing import List, Dict, Union, Mapping, NamedTuple, Tuple
 from datetime import datetime
-from threading import Event, Timer, Lock
+from time import perf_counter, time
+from threading import Event, Lock, Thread, current_thread
 from uuid import uuid4
+from itertools import count
 from logging import getLogger
 from singleton_decorator import singleton
 from copy import copy
-from urllib.error import HTTPError
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from inspect import signature
+from urllib.error import HTTPError, URLError
+from socket import timeout as SocketTimeout
+from random import uniform
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, as_completed, wait
+from .engine import ENGINES, EngineStopped
+from .store import SnapshotStore
+from .history import History, DEFAULT_HISTORY_SIZE
+from .table import ReadingTable
+from .spatial import SpatialIndex, buoy_locations
+from .changes import ChangeLog, SOURCE, BUOY
+from .diff import EMPTY_INDEX, index_sources, diff_sources
+from .serializer import buoy_fields
+from .scheduler import RefreshScheduler
+from .frequency import AccessFrequency, DEFAULT_HOT_SIZE
+from .cache import ReadingCache
+from .breaker import CircuitBreakers, DEFAULT_NEGATIVE_TTL, DEFAULT_THRESHOLD, DEFAULT_COOLDOWN
+from .cluster import LeaderLock, DEFAULT_SYNC_INTERVAL, DEFAULT_SHARED_TIMEOUT
+from . import columnar
+from .columnar import SnapshotFiles, build_table, DEFAULT_SNAPSHOT_KEEP, DEFAULT_SNAPSHOT_INTERVAL
+from .metrics import (
+    TimedLock, PULL_SECONDS, FETCH_SECONDS, FETCH_FAILURES, FETCH_RETRIES, CACHE_REQUESTS, STARTUP_SECONDS
+)
+from . import STARTED
 
 
 log = getLogger()
 SOURCE_INDEX = "source_index"
 BUOY_INDEX = "buoy_index"
+DEFAULT_PREFETCH_WORKERS = 8
+DEFAULT_FETCH_WORKERS = 16
+# Seconds between the pulls of the sources, the buoys are refreshed on their own schedule
+DEFAULT_SOURCE_INTERVAL = 30 * 60
+# Bounds (seconds) of the wait between two runs of the schedule
+MIN_TICK = 1.0
+MAX_TICK = 60.0
+# Number of times a transient error is retried, and the seconds before the first retry
+DEFAULT_FETCH_RETRIES = 2
+DEFAULT_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 10.0
+
+# Errors raised while retrieving a buoy that are handled as failed fetches
+NETWORK_ERRORS = (HTTPError, URLError, SocketTimeout, TimeoutError, ConnectionError)
 
 
 def jsonify_buoy_data(data: Union[List[BuoyData], BuoyData]):
     """
+    Convert the buoy information to JSON data, see `nautical_api.serializer.buoy_fields`.
 
+    :param data: nautical.noaa.buoy.BuoyData object or a list of objects
+    :return: dictionary of the fields that are set (a list of dictionaries for a list)
     """
-    def _jsonify(_data):
-        output = {}
-        for x, y in _data:
-            if isinstance(y, (int, float, str)):
-                output[x] = y
-            else:
-                output[x] = str(y)
-        return output
-
     if isinstance(data, list):
-        return [_jsonify(bd) for bd in data]
+        return [buoy_fields(bd) for bd in data]
     elif data is not None:
-        return _jsonify(data)
+        return buoy_fields(data)
+
+    
+def get_buoy_sources():
+    """
+    Retrieve all sources from NOAA, see `nautical.io.sources.get_buoy_sources`. The
+    nautical io modules (and their parsers) are slow to import, they are imported on
+    the first pull rather than at the start of the application.
+
+    :return: dictionary of source names mapped to their respective source
+    """
+    from nautical.io.sources import get_buoy_sources as _get_buoy_sources
+    return _get_buoy_sources()
+
+
+def create_buoy(station):
+    """
+    Retrieve a buoy from NOAA, see `nautical.io.buoy.create_buoy`. The import is
+    deferred, see `get_buoy_sources`.
+
+    :param station: ID of the buoy
+    :return: nautical.noaa.buoy.Buoy
+    """
+    from nautical.io.buoy import create_buoy as _create_buoy
+    return _create_buoy(station)
+
+
+def is_transient(error):
+    """
+    :param error: Error raised while retrieving a buoy, see `NETWORK_ERRORS`
+    :return: True when the error is transient and the fetch should be retried (timeouts,
+    connection errors, HTTP 429 and 5xx)
+    """
+    if isinstance(error, HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, NETWORK_ERRORS)
 
     
 def find_wait_time(t=None):
@@ -62,45 +127,326 @@ def find_wait_time(t=None):
     if m == 0:
         return 30
     return m
+
+
+class Snapshot(NamedTuple):
+    """Immutable view of the sources, aliases and buoy IDs from a single pull. A new
+    snapshot is built off to the side during each pull and swapped in atomically.
+    """
+
+    generation: int
+    sources: Mapping[str, Source]
+    aliases: Mapping[str, str]
+    buoys: Tuple[str, ...]
+
+
+class Reading(NamedTuple):
+    """Present data for a buoy along with the time it was fetched. Stale readings
+    are from a previous pull, they are served until the new reading arrives.
+    """
+
+    data: BuoyData
+    fetched: float
+    stale: bool = False
+    version: int = 0
+
+    @property
+    def age(self):
+        """
+        :return: Number of seconds since the reading was fetched
+        """
+        return max(0.0, time() - self.fetched)
+
+
+class Update(NamedTuple):
+    """Notification passed to the subscribed callbacks. A `pull` update is sent when a
+    new snapshot is swapped in, a `reading` update is sent when the reading of a buoy changes.
+    The generation is the generation of the change log (see `nautical_api.changes`), it can
+    be passed to `get_changes`.
+    """
+
+    kind: str
+    generation: int
+    buoy: str = None
+    reading: Reading = None
+
+
+PULL_UPDATE = "pull"
+READING_UPDATE = "reading"
+EMPTY_SNAPSHOT = Snapshot(0, MappingProxyType({}), MappingProxyType({}), ())
+
+# Future of the fetches that are not attempted (the failure is cached or the breaker is open)
+UNAVAILABLE = Future()
+UNAVAILABLE.set_result(None)
+
+
+def source_members(snapshot):
+    """
+    :param snapshot: Snapshot of the sources
+    :return: dictionary of the source aliases mapped to a tuple of the IDs of their buoys
+    """
+    return {
+        alias: tuple(str(b.station) for b in snapshot.sources[name])
+        for alias, name in snapshot.aliases.items()
+    }
+
+
+def source_alias(name):
+    """
+    :param name: Name of the source
+    :return: alias of the source that can be used in a URL
+    """
+    return str(name).replace("/", "_").replace(" ", "_")
+
+
+def make_snapshot(generation, sources, aliases=None, buoys=None):
+    """
+    Create a snapshot from the sources. The aliases and the flat list of buoy IDs are
+    created from the sources.
+
+    :param generation: Generation of the snapshot
+    :param sources: dictionary of source names mapped to their respective source
+    :param aliases: Aliases of a previous snapshot that are kept when the sources did not
+    change, created from the sources when None
+    :param buoys: Buoy IDs of a previous snapshot that are kept when the buoys did not
+    change, created from the sources when None
+    :return: Snapshot
+    """
+    if aliases is None:
+        aliases = MappingProxyType({source_alias(s): str(s) for s in sources})
+
+    if buoys is None:
+        # get the flat list of buoy ids
+        buoy_ids = []
+        for source in sources.values():
+            buoy_ids.extend([str(b.station) for b in list(source.buoys.values())])
+        buoys = tuple(buoy_ids)
+
+    return Snapshot(generation, MappingProxyType(sources), aliases, buoys)
+
     
-    
+def _takes_update(callback):
+    """
+    :param callback: Callback of a subscription, see `NauticalDatabase.subscribe`
+    :return: True when the callback accepts the update as its argument, callbacks written
+    as `func()` are called without the update.
+    """
+    try:
+        signature(callback).bind(None)
+    except TypeError:
+        return False
+    except ValueError:
+        # the signature of some builtins is not available
+        pass
+    return True
+
+
 @singleton
 class NauticalDatabase:
     """Singleton class that will hold the current nautical
     information retrieved through the nautical library.
     """
 
-    def __init__(self):
-        self._sources: Dict[str, Any] = {}
-        self._buoys: Dict[str, Any] = {}
-        self._pull_lock = Lock()
-        self._retrieve_lock = Lock()
+    def __init__(
+        self,
+        prefetch=True,
+        prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+        prefetch_sources=None,
+        fetch_workers=DEFAULT_FETCH_WORKERS,
+        engine="thread",
+        sources_fn=None,
+        buoy_fn=None,
+        store=None,
+        history_size=DEFAULT_HISTORY_SIZE,
+        source_interval=DEFAULT_SOURCE_INTERVAL,
+        hot_size=DEFAULT_HOT_SIZE,
+        prefetch_hot_only=False,
+        cache_entries=None,
+        cache_bytes=None,
+        cache_ttl=None,
+        fetch_retries=DEFAULT_FETCH_RETRIES,
+        retry_delay=DEFAULT_RETRY_DELAY,
+        negative_ttl=DEFAULT_NEGATIVE_TTL,
+        breaker_threshold=DEFAULT_THRESHOLD,
+        breaker_cooldown=DEFAULT_COOLDOWN,
+        leader_lock=None,
+        sync_interval=DEFAULT_SYNC_INTERVAL,
+        snapshot_dir=None,
+        snapshot_keep=DEFAULT_SNAPSHOT_KEEP,
+        snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL
+    ):
+        """
+        :param prefetch: When True, all buoys are fetched (warmed) in the background
+        after each pull so that requests are served from memory.
+        :param prefetch_workers: Max number of buoys that are fetched concurrently during warm up.
+        :param prefetch_sources: Names or aliases of the sources whose buoys are warmed. When
+        `None` the buoys of all sources are warmed.
+        :param fetch_workers: Max number of buoys that are fetched concurrently in the background
+        for stale readings and batch requests. For the asyncio engine, this is the max number of
+        fetches in flight.
+        :param engine: Name of the engine that schedules the pulls and runs the fetches, see
+        `nautical_api.engine.ENGINES`.
+        :param sources_fn: Function in the form of `func()` that returns all sources, defaults
+        to `nautical.io.sources.get_buoy_sources`.
+        :param buoy_fn: Function in the form of `func(buoy)` that returns a buoy with present
+        data, defaults to `nautical.io.buoy.create_buoy`.
+        :param store: Path to the persistent (SQLite) store. When provided, the sources and
+        readings are saved as they arrive and the last saved data is served after a restart.
+        :param history_size: Max number of readings kept in the history of each buoy, 0 to
+        disable the history.
+        :param source_interval: Seconds between the pulls of the sources. The buoys are refreshed
+        on the schedule learned for each buoy, see `nautical_api.scheduler`.
+        :param hot_size: Max number of the most frequently requested buoys (the hot set), the
+        buoys of the hot set are warmed and refreshed first.
+        :param prefetch_hot_only: When True, only the buoys of the hot set are warmed and refreshed
+        in the background once buoys have been requested, the other buoys are fetched on request.
+        :param cache_entries: Max number of buoy readings kept in memory, the least recently used
+        readings are evicted. Unlimited when `None`.
+        :param cache_bytes: Max number of bytes (estimated) used by the buoy readings kept in memory,
+        unlimited when `None`.
+        :param cache_ttl: Seconds after the observation that a reading expires, an expired reading
+        is evicted and fetched again on request. Never when `None`.
+        :param fetch_retries: Number of times a fetch is retried after a transient error, see `is_transient`.
+        :param retry_delay: Seconds before the first retry, the delay is doubled (with a random
+        jitter) for each retry.
+        :param negative_ttl: Seconds that a failed fetch is cached, the buoy is not fetched again
+        meanwhile. See `nautical_api.breaker`.
+        :param breaker_threshold: Consecutive failed fetches of a buoy that open its circuit breaker.
+        :param breaker_cooldown: Seconds that the circuit breaker of a buoy stays open the first time.
+        :param leader_lock: Path to the lock file shared by the processes that share the `store`, see
+        `nautical_api.cluster`. The process that holds the lock (the leader) retrieves the data from
+        NOAA and saves it to the store, the other processes (followers) load the data from the store.
+        :param sync_interval: Seconds between the loads of the store by a follower, and between the
+        checks of the buoys requested by the followers by the leader.
+        :param snapshot_dir: Directory of the columnar snapshot files (Arrow IPC) of the sources and
+        the current readings, see `nautical_api.columnar`. No files are written when `None` or when
+        pyarrow is not installed.
+        :param snapshot_keep: Number of snapshot files that are kept.
+        :param snapshot_interval: Min seconds between the snapshot files, a file is only written when
+        the data changed.
+        """
+        if leader_lock is not None and store is None:
+            raise ValueError("{} requires a store to share the data between processes".format(
+                self.__class__.__name__
+            ))
+
+        self._snapshot: Snapshot = EMPTY_SNAPSHOT
+        self._buoys: Dict[str, Reading] = {}
+        # summary of the sources of the snapshot, compared with each pull (see `nautical_api.diff`)
+        self._source_index = EMPTY_INDEX
+        # set once a snapshot of the sources was loaded (pulled or restored from the store)
+        self._ready = Event()
+        self._readiness = {"ready": False, "origin": None, "seconds": None}
+        self._pull_lock = TimedLock("pull")
+        self._retrieve_lock = TimedLock("retrieve")
+
+        # order (least recently used), sizes and expiry of the readings in `_buoys`. The
+        # readings are only evicted from `_buoys` (set to None), the buoys remain.
+        self._cache = ReadingCache(cache_entries, cache_bytes, cache_ttl)
+
+        # failed fetches and the circuit breaker of each buoy
+        self._breakers = CircuitBreakers(negative_ttl, breaker_threshold, breaker_cooldown)
+        self._fetch_retries = max(0, int(fetch_retries))
+        self._retry_delay = max(0.0, float(retry_delay))
+
+        # multi-process mode, only the leader retrieves the data. A follower loads the data
+        # saved after the `_sync_cursor` (sequence number of the store).
+        self._leader_lock = LeaderLock(leader_lock) if leader_lock is not None else None
+        self._sync_interval = max(0.01, float(sync_interval))
+        self._following = False
+        self._sync_cursor = 0
+        self._sources_sequence = None
+        self._cluster_thread = None
+
+        # buoys that are currently being fetched mapped to the future of the fetch.
+        # Concurrent requests for the same buoy share the single fetch.
+        self._inflight: Dict[str, Future] = {}
+
+        # engine used to schedule the pulls and run the fetches in the background
+        self._engine = ENGINES[engine](fetch_workers)
+        self._sources_fn = sources_fn
+        self._buoy_fn = buoy_fn
+
+        # persistent store of the sources and readings
+        self._store = SnapshotStore(store) if store else None
+
+        # bounded history of the readings for each buoy
+        self._history = History(history_size) if history_size > 0 else None
+
+        # columnar table of the current readings of all buoys
+        self._table = ReadingTable()
+
+        # columnar snapshot files, written by the process that retrieves the data
+        self._snapshot_files = None
+        if snapshot_dir is not None:
+            if columnar.pyarrow is None:
+                log.warning("{} pyarrow is not installed, the snapshot files are disabled".format(
+                    self.__class__.__name__
+                ))
+            else:
+                self._snapshot_files = SnapshotFiles(snapshot_dir, snapshot_keep)
+        self._snapshot_interval = max(0.0, float(snapshot_interval))
+        self._snapshot_written = None
+        self._snapshot_due = 0.0
+        self._snapshot_lock = Lock()
+
+        # spatial index of the buoy locations, rebuilt when the locations change
+        self._spatial = SpatialIndex()
 
-        self._aliases = {}
+        # log of the changes to the sources and buoys, see `get_changes`
+        self._changes = ChangeLog()
+
+        # refresh schedule of the buoys, learned from the time of their observations
+        self._scheduler = RefreshScheduler()
+        self._source_interval = max(MIN_TICK, float(source_interval))
+
+        # decaying access frequency of the buoys, see `get_hot_set`
+        self._frequency = AccessFrequency(hot_size=hot_size)
+        self._prefetch_hot_only = prefetch_hot_only
+
+        # each new reading receives a unique (increasing) version
+        self._versions = count(1)
+        self._next_pull = None
+        # consecutive runs of the schedule that failed, see `_run`
+        self._run_failures = 0
         
         self._stop_event = Event()
         self._stop_event.clear()  # force clear the event (if it's set we have a bg problem)
-        self._timer = None
 
         # dict containing the callbacks associated with the hash 
         self._callbacks = {}
         self._callback_lock = Lock()
 
-    def subscribe(self, callback, hsh = str(uuid4())):
+        # warm up (prefetch) of the buoys that runs after each pull
+        self._prefetch = prefetch
+        self._prefetch_workers = max(1, int(prefetch_workers))
+        self._prefetch_sources = prefetch_sources
+        self._prefetch_thread = None
+        self._prefetch_cycle = 0
+        self._prefetch_status = {}
+        self._prefetch_lock = Lock()
+
+    def subscribe(self, callback, hsh=None):
         """
         If hash (hsh) does not already exist in the updated callback, the callback will be 
         added assuming it is a function. When an instance of this class updates the information
         stored in the instance, then the registered callbacks will be triggered, notifying a
         reciever to grab the new data.
 
-        :param callback: Callable function in the form of `func()`.
-        :param hsh: Hash or unique identifier that is used for this callback
+        The callbacks are called from the thread that updated the information (the pull or
+        a fetch), callbacks must return quickly and should hand the update off to a queue.
+
+        :param callback: Callable function in the form of `func(update)` where update is an `Update`,
+        or `func()` for callbacks that only need to know that the information changed.
+        :param hsh: Hash or unique identifier that is used for this callback, a unique
+        identifier is created when `None`.
         :return: The hash or unique identifier for the callback, None on failure.
         """
+        hsh = str(uuid4()) if hsh is None else hsh
         with self._callback_lock:
             if hsh not in self._callbacks and callable(callback):
                 log.debug("{} adding callback with ID {}".format(self.__class__.__name__, hsh))
-                self._callbacks[hsh] = callback
+                self._callbacks[hsh] = (callback, _takes_update(callback))
                 return hsh
         return None
 
@@ -119,98 +465,833 @@ class NauticalDatabase:
             
         return False
         
-    
+
+    def _notify(self, update):
+        """
+        Call all subscribed callbacks with the update. A failing callback does not
+        prevent the other callbacks from being called.
+
+        :param update: Update passed to the callbacks
+        """
+        with self._callback_lock:
+            callbacks = list(self._callbacks.items())
+
+        for hsh, (callback, takes_update) in callbacks:
+            try:
+                if takes_update:
+                    callback(update)
+                else:
+                    callback()
+            except Exception as e:
+                log.error("{} callback with ID {} failed: {}".format(self.__class__.__name__, hsh, e))
+
     def stop(self):
         """
         Stopp the execution of the singleton
         """
         log.debug("Stopping {}".format(self.__class__.__name__))
         self._stop_event.set()
-
-        if self._timer is not None:
-            if self._timer.is_alive():
-                self._timer.cancel()
-
-            self._timer = None
+        self._engine.stop()
+        if self._leader_lock is not None:
+            if self._cluster_thread is not None and self._cluster_thread is not current_thread():
+                self._cluster_thread.join(self._sync_interval * 10)
+            self._leader_lock.release()
 
     def _run(self):
         """
-        Internal execution interval for the singleton
+        Internal execution interval for the singleton. The sources are pulled every
+        `source_interval` seconds and the buoys that are due are refreshed, the function is
+        then scheduled for the next pull or refresh (whichever is first). When the pull or
+        the refresh fails, the pull is retried with an exponential backoff (up to
+        `source_interval` seconds), the function is always scheduled again.
         """
         if self._stop_event.is_set():
             log.debug("{} should be stopped, not executing ...".format(self.__class__.__name__))
-        else:
-            self._pull_all()
-            
-            # find the next time to run this function
-            num_seconds = find_wait_time() * 60.0
+            return
+
+        try:
+            if self._next_pull is None or time() >= self._next_pull:
+                # the readings are refreshed on their own schedule, they are not
+                # marked as stale by the pull
+                self._pull_all(stale=False)
+                self._next_pull = time() + self._source_interval
 
-            self._timer = Timer(num_seconds, self._run)
-            self._timer.start()
+            self._refresh_due()
+            self._run_failures = 0
+        except Exception as e:
+            self._run_failures += 1
+            delay = min(self._source_interval, MIN_TICK * 2 ** min(self._run_failures - 1, 32))
+            self._next_pull = time() + delay
+            log.error("{} failed to pull the sources (retry in {:.0f}s): {}".format(
+                self.__class__.__name__, delay, e
+            ))
+
+        try:
+            self._write_snapshot()
+        except Exception as e:
+            log.error("{} failed to write the snapshot file: {}".format(self.__class__.__name__, e))
+
+        # find the next time to run this function
+        next_run = min(self._next_pull, self._scheduler.next_due() or self._next_pull)
+        num_seconds = min(MAX_TICK, max(MIN_TICK, next_run - time()))
+        self._engine.schedule(num_seconds, self._run)
+
+    def _refresh_due(self):
+        """
+        Refresh the buoys that are due, see `nautical_api.scheduler.RefreshScheduler`, the
+        most frequently requested buoys first. The readings of the buoys are marked as stale,
+        they are served until the new reading arrives. When the database does not prefetch (or
+        the buoy is not in the hot set with `prefetch_hot_only`), the buoy is refreshed on the
+        next request.
+
+        :return: list of the IDs of the buoys that were due
+        """
+        buoys = self._frequency.order(self._scheduler.due())
+        self._refresh_buoys(buoys)
+        if buoys:
+            log.debug("{} refreshing {} buoys".format(self.__class__.__name__, len(buoys)))
+        return buoys
+
+    def _refresh_buoys(self, buoys, missing=False):
+        """
+        Mark the readings of the buoys as stale, the buoys are refreshed in the background
+        when the database prefetches (and the buoy is in the hot set with `prefetch_hot_only`).
+
+        The buoys that are not fetched (by this call or a fetch in flight) are put back on
+        the schedule, see `RefreshScheduler.defer`.
+
+        :param buoys: IDs of the buoys
+        :param missing: When True, the buoys without a reading are retrieved as well
+        """
+        hot = self._hot_buoys()
+        for buoy in buoys:
+            fetching = False
+            try:
+                with self._retrieve_lock:
+                    if buoy not in self._buoys:
+                        continue
+                    reading = self._buoys[buoy]
+                    if reading is not None:
+                        self._buoys[buoy] = reading._replace(stale=True)
+                    elif not missing:
+                        continue
+
+                if self._prefetch and (hot is None or buoy in hot):
+                    reading, future, owner = self._claim_buoy(buoy, requested=False)
+                    if owner:
+                        self._submit(self._load_buoy, buoy, future)
+                    elif future is UNAVAILABLE:
+                        self._scheduler.failed(buoy)
+                    # the result of the fetch (or the failure) is recorded in the schedule
+                    fetching = future is not None
+            finally:
+                if not fetching:
+                    self._scheduler.defer(buoy)
         
-    def run(self):
+    def run(self, block=True):
         """
         Start and run the Database that will pull the nautical information. The 
         database should run asynchronously.
+
+        :param block: When True, the first pull of the sources is completed before the
+        function returns. Otherwise the first pull runs in the background, see `is_ready`.
         """
         log.debug("Starting {}".format(self.__class__.__name__))
         if self._stop_event.is_set():
            log.warning("{} is already running ...".format(self.__class__.__name__))
-        else:
+        elif self._leader_lock is not None and not self._leader_lock.acquire():
+            # another process retrieves the data, load the data it saves to the store
+            log.info("{} following the data saved to {}".format(self.__class__.__name__, self._store.path))
+            self._following = True
+            self._sync()
+            self._start_cluster_thread(self._follow)
+        elif self._restore():
+            # serve the restored (stale) data immediately, pull in the background
+            self._engine.schedule(0, self._run)
+            if self._prefetch:
+                self._start_prefetch()
+            self._start_leading()
+        elif block:
             self._run()
+            self._start_leading()
+        else:
+            self._engine.schedule(0, self._run)
+            self._start_leading()
+
+    def _set_ready(self, origin):
+        """
+        Mark the database as ready once the first snapshot of the sources is loaded, the
+        time since the start of the process is recorded.
+
+        :param origin: Where the snapshot was loaded from (`pull` or `store`)
+        """
+        if self._ready.is_set():
+            return
+
+        seconds = time() - STARTED
+        self._readiness = {"ready": True, "origin": origin, "seconds": seconds}
+        self._ready.set()
+        STARTUP_SECONDS.labels("ready").set(seconds)
+        log.info("{} ready {:.3f} seconds after the start ({})".format(self.__class__.__name__, seconds, origin))
+
+    def is_ready(self):
+        """
+        :return: True once a snapshot of the sources was pulled or loaded from the store
+        """
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait for the first snapshot of the sources, see `is_ready`.
+
+        :param timeout: Max number of seconds to wait, no limit when None
+        :return: True when the database is ready
+        """
+        return self._ready.wait(timeout)
+
+    def get_readiness(self):
+        """
+        :return: dictionary with `ready`, the `origin` of the first snapshot (pull or store), the
+        `seconds` from the start of the process until it was loaded and the current `generation`
+        """
+        readiness = dict(self._readiness)
+        readiness["generation"] = self._changes.generation
+        return readiness
+
+    def _start_cluster_thread(self, target):
+        """
+        Run the function of the multi-process mode (`_follow` or `_lead`) in the background.
+        """
+        self._cluster_thread = Thread(target=target, daemon=True)
+        self._cluster_thread.start()
+
+    def _start_leading(self):
+        """
+        Serve the buoys requested by the followers when running in multi-process mode.
+        """
+        if self._leader_lock is not None:
+            self._start_cluster_thread(self._lead)
+
+    def _lead(self):
+        """
+        Retrieve the buoys requested by the followers (see `_request_shared`) until the
+        database is stopped. A reading that is already fresh is saved again so the follower
+        loads it.
+        """
+        while not self._stop_event.wait(self._sync_interval):
+            for buoy in self._store.take_requests():
+                reading, future, owner = self._claim_buoy(buoy, requested=False)
+                if owner:
+                    self._submit(self._load_buoy, buoy, future)
+                elif future is None and reading is not None:
+                    self._store.save_reading(buoy, reading.data, reading.fetched)
+
+    def _follow(self):
+        """
+        Load the data saved by the leader until the database is stopped. When the leader
+        exits, the lock is acquired and this process becomes the leader.
+        """
+        while not self._stop_event.wait(self._sync_interval):
+            if self._leader_lock.acquire():
+                log.info("{} is the leader".format(self.__class__.__name__))
+                self._sync()
+                with self._retrieve_lock:
+                    # refresh the readings loaded from the store, they are not scheduled
+                    self._buoys = {
+                        buoy: reading._replace(stale=True) if reading is not None else None
+                        for buoy, reading in self._buoys.items()
+                    }
+                    self._following = False
+                self._engine.schedule(0, self._run)
+                if self._prefetch:
+                    self._start_prefetch()
+                self._lead()
+                return
+
+            try:
+                self._sync()
+            except Exception as e:
+                log.error("{} failed to load the store: {}".format(self.__class__.__name__, e))
+
+    def _sync(self):
+        """
+        Load the sources (when they were saved again) and the readings saved to the store
+        after the previous load.
+        """
+        sequence = self._store.sources_sequence()
+        if sequence != self._sources_sequence:
+            sources = self._store.load_sources()
+            if sources:
+                self._swap_sources(sources)
+            self._sources_sequence = sequence
+
+        updates, self._sync_cursor = self._store.load_updates(self._sync_cursor)
+        for buoy, data, fetched in updates:
+            self._set_reading(buoy, Reading(data, fetched))
+
+    def _swap_sources(self, sources):
+        """
+        Swap in a snapshot of the sources loaded from the store, the readings of the buoys
+        that remain are kept.
+
+        :param sources: dictionary of source names mapped to their respective source
+        """
+        with self._pull_lock:
+            snapshot = make_snapshot(self._snapshot.generation + 1, sources)
+            self._source_index = index_sources(sources)
+            self._update_spatial(snapshot)
+
+            with self._retrieve_lock:
+                previous = self._snapshot
+                self._snapshot = snapshot
+                self._buoys = {buoy: self._buoys.get(buoy) for buoy in snapshot.buoys}
+                self._cache.retain(snapshot.buoys)
+
+            self._stamp_changes(previous, snapshot)
+            if self._history is not None:
+                self._history.retain(snapshot.buoys)
+            self._table.reset(snapshot.buoys)
+            self._set_ready("store")
 
-    def _pull_all(self):
+        self._notify(Update(PULL_UPDATE, self._changes.generation))
+
+    def _request_shared(self, buoy, future):
+        """
+        Ask the leader to retrieve the buoy and wait for the reading to be loaded from
+        the store (see `_sync`), the reading is set on the future by `_sync`.
+
+        :param buoy: ID of the buoy
+        :param future: Future that is shared by all requests for the buoy
+        """
+        self._store.request_readings([buoy])
+        try:
+            future.result(DEFAULT_SHARED_TIMEOUT)
+        except FutureTimeoutError:
+            with self._retrieve_lock:
+                expired = self._inflight.get(buoy) is future
+                if expired:
+                    self._inflight.pop(buoy)
+            if expired:
+                self._breakers.failure(buoy, "timeout")
+                future.set_result(None)
+
+    def _restore(self):
+        """
+        Load the sources and readings saved in the persistent store. The restored readings are
+        marked as stale, they are served until they are refreshed.
+
+        :return: True when a snapshot was restored from the store
+        """
+        if self._store is None:
+            return False
+
+        start = time()
+        sources = self._store.load_sources()
+        if not sources:
+            return False
+
+        snapshot = make_snapshot(self._snapshot.generation + 1, sources)
+        saved = self._store.load_readings()
+        buoys = {}
+        for buoy in snapshot.buoys:
+            if buoy in saved:
+                data, fetched = saved[buoy]
+                buoys[buoy] = Reading(data, fetched, True, next(self._versions))
+                if self._history is not None:
+                    self._history.record(buoy, data)
+            else:
+                buoys[buoy] = None
+
+        self._update_spatial(snapshot)
+
+        with self._pull_lock, self._retrieve_lock:
+            for buoy, reading in list(buoys.items()):
+                if reading is not None:
+                    for evicted in self._cache.add(buoy, reading):
+                        buoys[evicted] = None
+            self._snapshot = snapshot
+            self._buoys = buoys
+            self._source_index = index_sources(sources)
+
+        self._table.reset(snapshot.buoys)
+        for buoy, reading in buoys.items():
+            if reading is not None:
+                self._table.update(buoy, reading.data)
+
+        self._stamp_changes(EMPTY_SNAPSHOT, snapshot)
+        self._set_ready("store")
+
+        log.info("{} restored {} sources and {} readings in {:.3f} seconds".format(
+            self.__class__.__name__, len(sources), len(saved), time() - start
+        ))
+        return True
+
+    def _pull_all(self, stale=True):
         """ 
-        Convenience function, see `_pull_sources` and `_pull_buoys` for more information.
+        Convenience function, see `_pull_sources`, `_pull_buoys` and `_start_prefetch`
+        for more information. The new snapshot and readings are swapped in together, readers
+        will never see an empty or partially built state.
+
+        The sources are compared with the sources of the previous pull (see `nautical_api.diff`)
+        and only the changes are applied. When nothing changed the snapshot is kept, the aliases
+        and the indexes of the buoys are only rebuilt when the sources or buoys changed.
+
+        :param stale: When True, the readings from the previous pull are marked as stale, a new
+        snapshot is swapped in and all buoys are warmed again. Otherwise only the added buoys and
+        the buoys with a newer observation in the listing of the sources are retrieved.
         """
-        self._pull_sources()
-        self._pull_buoys()
+        start = perf_counter()
+        with self._pull_lock:
+            with PULL_SECONDS.labels("sources").time():
+                sources = self._pull_sources()
+            if sources is None:
+                return
+
+            with PULL_SECONDS.labels("diff").time():
+                index = index_sources(sources)
+                diff = diff_sources(self._source_index, index)
+
+            previous = self._snapshot
+            full = stale or not previous.buoys
+            snapshot = None
+            if full or diff.changed:
+                renamed = bool(diff.added_sources or diff.removed_sources)
+                snapshot = make_snapshot(
+                    previous.generation + 1,
+                    sources,
+                    aliases=previous.aliases if not renamed else None,
+                    buoys=previous.buoys if not (renamed or diff.changed_sources) else None
+                )
+
+                buoys = None
+                if stale or diff.members_changed:
+                    with PULL_SECONDS.labels("buoys").time():
+                        buoys = self._pull_buoys(snapshot, stale)
+                if diff.members_changed or diff.moved:
+                    self._update_spatial(snapshot)
+
+                with self._retrieve_lock:
+                    self._snapshot = snapshot
+                    if buoys is not None:
+                        self._buoys = buoys
+                    if diff.removed:
+                        self._cache.retain(snapshot.buoys)
+
+                self._stamp_diff(diff)
+
+                log.debug("{} Swapped in snapshot {}".format(self.__class__.__name__, snapshot.generation))
+
+                if self._store is not None and diff.changed:
+                    self._store.save_sources(snapshot.sources)
+
+                if diff.removed:
+                    if self._history is not None:
+                        self._history.retain(snapshot.buoys)
+                    self._scheduler.retain(snapshot.buoys)
+                    self._frequency.retain(snapshot.buoys)
+                    self._breakers.retain(snapshot.buoys)
+                if diff.members_changed:
+                    self._table.reset(snapshot.buoys)
+
+            self._source_index = index
+
+            # the buoys with a newer observation than their reading are refreshed
+            with self._retrieve_lock:
+                outdated = [
+                    x for x in diff.advanced
+                    if self._buoys.get(x) is not None and
+                    (self._buoys[x].data.epoch_time or 0) < index.stations[x][2]
+                ]
+
+        elapsed = perf_counter() - start
+        PULL_SECONDS.labels("all").observe(elapsed)
+        log.info("{} pulled {} sources in {:.3f} seconds, changes {}".format(
+            self.__class__.__name__, len(sources), elapsed, diff.stats()
+        ))
+
+        if snapshot is not None:
+            if snapshot.sources:
+                self._set_ready("pull")
+            self._notify(Update(PULL_UPDATE, self._changes.generation))
+
+        if self._prefetch and full:
+            self._start_prefetch()
+        else:
+            if self._prefetch and diff.added:
+                added = set(diff.added)
+                self._refresh_buoys([x for x in self._prefetch_buoy_ids() if x in added], missing=True)
+            self._refresh_buoys(outdated)
     
+    def _stamp_diff(self, diff):
+        """
+        Record the sources and buoys that were added, changed or removed by a pull in the
+        change log.
+
+        :param diff: nautical_api.diff.SourceDiff of the pull
+        """
+        changed = [(SOURCE, source_alias(x)) for x in diff.added_sources + diff.changed_sources]
+        changed.extend((BUOY, x) for x in diff.added)
+        removed = [(SOURCE, source_alias(x)) for x in diff.removed_sources]
+        removed.extend((BUOY, x) for x in diff.removed)
+
+        self._changes.remove(removed)
+        self._changes.update(changed)
+
+    def _stamp_changes(self, previous, snapshot):
+        """
+        Record the sources and buoys that were added, changed (members of a source) or
+        removed between the snapshots in the change log.
+
+        :param previous: Snapshot that was replaced
+        :param snapshot: New snapshot
+        """
+        old, new = source_members(previous), source_members(snapshot)
+        old_buoys = set(previous.buoys)
+        new_buoys = set(snapshot.buoys)
+
+        changed = [(SOURCE, x) for x, members in new.items() if old.get(x) != members]
+        changed.extend((BUOY, x) for x in snapshot.buoys if x not in old_buoys)
+        removed = [(SOURCE, x) for x in old if x not in new]
+        removed.extend((BUOY, x) for x in previous.buoys if x not in new_buoys)
+
+        self._changes.remove(removed)
+        self._changes.update(changed)
+        log.debug("{} stamped {} changed and {} removed sources/buoys".format(
+            self.__class__.__name__, len(changed), len(removed)
+        ))
+
+    def _update_spatial(self, snapshot):
+        """
+        Rebuild the spatial index when the buoys or their locations in the snapshot
+        differ from the buoys in the current index.
+
+        :param snapshot: New snapshot of the sources
+        :return: True when the index was rebuilt
+        """
+        locations = buoy_locations(snapshot.sources)
+        if locations == self._spatial.locations:
+            return False
+
+        start = time()
+        self._spatial = SpatialIndex(locations)
+        log.debug("{} Built spatial index of {} buoys in {:.6f} seconds".format(
+            self.__class__.__name__, len(locations), time() - start
+        ))
+        return True
+
     def _pull_sources(self):
         """
         Pull all source data using the nautical library. The sources
-        will NOT include 'SHIPS'.
+        will NOT include 'SHIPS'. 
+
+        :return: dictionary of source names mapped to their respective source, None when
+        no sources were found and the current snapshot should be kept.
         """
         log.debug("{} Updating sources".format(self.__class__.__name__))
 
-        sources = get_buoy_sources()
+        sources = (self._sources_fn or get_buoy_sources)()
         if "Ships" in sources:
             sources.pop("Ships")
-        
-        with self._pull_lock:
-            log.debug("{} deleting current source data".format(self.__class__.__name__))
-            self._sources.clear()
-            self._aliases.clear()
-            self._sources = sources
-
-            for s in self._sources.keys():
-                alias = str(s).replace("/", "_").replace(" ", "_")
-                self._aliases[alias] = str(s)
-            
-            log.debug("{} Updated sources -> {}".format(self.__class__.__name__, self._sources.keys()))
 
-    def _pull_buoys(self):
+        current = self._snapshot
+        if not sources and current.sources:
+            log.warning("{} No sources found, keeping snapshot {}".format(
+                self.__class__.__name__, current.generation
+            ))
+            return None
+
+        log.debug("{} Updated sources -> {}".format(self.__class__.__name__, sources.keys()))
+
+        return sources
+
+    def _pull_buoys(self, snapshot, stale=True):
+        """
+        Create the buoy readings for the buoys in the snapshot. The readings from the
+        previous pull are kept, when `stale` is set they are marked as stale so they are
+        refreshed while they continue to be served.
+
+        :param snapshot: Snapshot that the readings are created for
+        :param stale: When True, the readings are marked as stale
+        :return: dictionary of buoy IDs mapped to their (stale) reading or None
         """
-        Pull all buoy information from the database and add the
-        information to the databsae.
-        """        
         log.debug("{} Updating buoys".format(self.__class__.__name__))
-        if not self._sources:
-            self._pull_sources
 
-        with self._pull_lock:
-            sources = self._sources.values()
+        with self._retrieve_lock:
+            current = self._buoys
 
-        buoy_ids = []
-        # get the flat list of buoy ids
-        for s in sources:
-            buoy_ids.extend([str(b.station) for b in list(s.buoys.values())])
+        buoys = {}
+        for buoy in snapshot.buoys:
+            reading = current.get(buoy)
+            buoys[buoy] = reading._replace(stale=True) if reading is not None and stale else reading
 
-        with self._pull_lock:
-            # this will clear the dict, this will cause us to loose cache which is intended
-            self._buoys = dict.fromkeys(buoy_ids, None)
-        
         log.debug("{} Updated buoys".format(self.__class__.__name__))
+        return buoys
+
+    def _prefetch_buoy_ids(self):
+        """
+        Find the buoys that should be warmed. When `prefetch_sources` was provided only
+        the buoys of the matching sources (name or alias) are included. With `prefetch_hot_only`
+        only the buoys of the hot set are included once buoys have been requested. The number of
+        buoys is limited to `cache_entries`, the buoys over the limit would be evicted by the warm up.
+
+        :return: List of buoy IDs to warm, the most frequently requested buoys first
+        """
+        snapshot = self._snapshot
+        if self._prefetch_sources is None:
+            buoy_ids = list(snapshot.buoys)
+        else:
+            names = set(snapshot.aliases.get(s, s) for s in self._prefetch_sources)
+            buoy_ids = []
+            for name, source in snapshot.sources.items():
+                if name in names:
+                    buoy_ids.extend([str(b.station) for b in list(source.buoys.values())])
+
+        hot = self._hot_buoys()
+        if hot is not None:
+            buoy_ids = [x for x in buoy_ids if x in hot]
+        buoy_ids = self._frequency.order(buoy_ids)
+        if self._cache.max_entries is not None:
+            buoy_ids = buoy_ids[:max(0, self._cache.max_entries)]
+        return buoy_ids
+
+    def _hot_buoys(self):
+        """
+        :return: set of the buoys in the hot set when only the hot set is refreshed in the
+        background, None when all buoys are refreshed (or no buoy has been requested)
+        """
+        if not self._prefetch_hot_only or not len(self._frequency):
+            return None
+        return set(self._frequency.hot())
+
+    def _start_prefetch(self):
+        """
+        Start warming the buoys in the background. A warm up that is still running
+        from a previous pull is abandoned in favor of the new one.
+        """
+        buoy_ids = self._prefetch_buoy_ids()
+
+        with self._prefetch_lock:
+            self._prefetch_cycle += 1
+            self._prefetch_thread = Thread(
+                target=self._prefetch_buoys, args=(buoy_ids, self._prefetch_cycle), daemon=True
+            )
+            self._prefetch_thread.start()
+
+    def _prefetch_buoys(self, buoy_ids, cycle):
+        """
+        Fetch all `buoy_ids` concurrently (bounded by `prefetch_workers`) and store the
+        results so that `get_buoy` can serve them from memory.
+
+        :param buoy_ids: IDs of the buoys to warm
+        :param cycle: Warm up cycle, the warm up is abandoned when a newer cycle starts
+        """
+        total = len(buoy_ids)
+        start = time()
+        completed = 0
+        failed = 0
+        report_every = max(1, total // 10)
+
+        def _warm(buoy):
+            # Never wait on a fetch owned by another request here, the future of the
+            # fetch is returned and waited on by the warm up instead.
+            if self._stop_event.is_set() or cycle != self._prefetch_cycle:
+                return None
+            reading, future, owner = self._claim_buoy(buoy, requested=False)
+            if future is None:
+                return reading
+            if owner:
+                self._load_buoy(buoy, future)
+            return future
+
+        def _done(future):
+            nonlocal completed, failed
+            completed += 1
+            try:
+                if future.result() is None:
+                    failed += 1
+            except Exception:
+                failed += 1
+
+            self._set_prefetch_status(cycle, total, completed, failed, start, completed < total)
+            if completed % report_every == 0 or completed == total:
+                log.info("{} warmed {}/{} buoys ({} failed)".format(
+                    self.__class__.__name__, completed, total, failed
+                ))
+
+        log.info("{} warming {} buoys".format(self.__class__.__name__, total))
+        self._set_prefetch_status(cycle, total, completed, failed, start, total > 0)
+
+        waiting = []
+        with self._engine.pool(self._prefetch_workers) as executor:
+            futures = [executor.submit(_warm, buoy) for buoy in buoy_ids]
+            for future in as_completed(futures):
+                if future.exception() is None and isinstance(future.result(), Future):
+                    waiting.append(future.result())
+                else:
+                    _done(future)
+
+        for future in as_completed(waiting):
+            _done(future)
+
+        log.info("{} warm up of {} buoys finished in {:.2f} seconds".format(
+            self.__class__.__name__, total, time() - start
+        ))
+        if cycle == self._prefetch_cycle:
+            try:
+                self._write_snapshot(force=True)
+            except Exception as e:
+                log.error("{} failed to write the snapshot file: {}".format(self.__class__.__name__, e))
+
+    def _write_snapshot(self, force=False):
+        """
+        Write the columnar snapshot file of the sources and the current readings (see
+        `nautical_api.columnar`) when the data changed since the previous file. Followers
+        do not write the files, they serve the files of the leader.
+
+        :param force: When True, the file is written before `snapshot_interval` seconds passed
+        :return: path of the file, None when no file was written
+        """
+        if self._snapshot_files is None or self._following:
+            return None
+
+        with self._snapshot_lock:
+            generation = self._changes.generation
+            now = time()
+            if generation == self._snapshot_written or (not force and now < self._snapshot_due):
+                return None
+
+            with self._retrieve_lock:
+                snapshot, buoys = self._snapshot, self._buoys
+            if not snapshot.sources:
+                return None
+
+            start = perf_counter()
+            stations, columns = self._table.columns()
+            table = build_table(generation, snapshot, buoys, stations, columns)
+            path = self._snapshot_files.write(generation, table)
+            self._snapshot_written = generation
+            self._snapshot_due = now + self._snapshot_interval
+
+        log.info("{} wrote the snapshot file {} ({} buoys) in {:.3f} seconds".format(
+            self.__class__.__name__, path, len(stations), perf_counter() - start
+        ))
+        return path
+
+    def get_snapshot_file(self):
+        """
+        :return: path of the latest columnar snapshot file, None when the files are disabled
+        or no file was written
+        """
+        if self._snapshot_files is None:
+            return None
+        return self._snapshot_files.latest()
+
+    def _set_prefetch_status(self, cycle, total, completed, failed, start, running):
+        """
+        Update the status of the warm up, see `get_prefetch_status`.
+        """
+        with self._prefetch_lock:
+            if cycle == self._prefetch_cycle:
+                self._prefetch_status = {
+                    "total": total,
+                    "completed": completed,
+                    "failed": failed,
+                    "running": running,
+                    "elapsed": time() - start
+                }
+
+    def get_prefetch_status(self):
+        """
+        Get the progress of the most recent warm up.
+
+        :return: Dictionary containing the total number of buoys to warm, the number
+        completed and failed, whether the warm up is running and the elapsed seconds.
+        """
+        with self._prefetch_lock:
+            return copy(self._prefetch_status)
+
+    def _fetch_buoy(self, buoy):
+        """
+        Retrieve the present data for a buoy using the nautical library. Transient errors
+        are retried with a jittered exponential backoff, see `is_transient`. The result is
+        recorded by the circuit breaker of the buoy.
+
+        :param buoy: ID of the buoy
+        :return: nautical.noaa.buoy.BuoyData object, None on failure
+        """
+        data = None
+        error = "no data"
+        start = perf_counter()
+        try:
+            for attempt in range(self._fetch_retries + 1):
+                try:
+                    b = (self._buoy_fn or create_buoy)(buoy)
+                    if b is not None:
+                        data = b.present
+                    break
+                except NETWORK_ERRORS as e:
+                    log.warning("{} failed to retrieve buoy {}: {}".format(self.__class__.__name__, buoy, e))
+                    error = str(e)
+                    if not is_transient(e) or attempt == self._fetch_retries:
+                        break
+
+                delay = min(MAX_RETRY_DELAY, self._retry_delay * 2 ** attempt) * uniform(0.5, 1.5)
+                FETCH_RETRIES.inc()
+                if self._stop_event.wait(delay):
+                    break
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            FETCH_SECONDS.observe(perf_counter() - start)
+            if data is None:
+                FETCH_FAILURES.inc()
+                self._breakers.failure(buoy, error)
+            else:
+                self._breakers.success(buoy)
+        return data
+
+    def get_snapshot(self):
+        """
+        Get the current snapshot, the snapshot is immutable so the sources, aliases
+        and buoy IDs are always consistent with each other and the generation.
+
+        :return: Current Snapshot
+        """
+        return self._snapshot
+
+    def get_next_pull(self):
+        """
+        Get the time of the next pull. When the database is not running the time is
+        estimated using `find_wait_time`.
+
+        :return: Seconds since the epoch of the next pull
+        """
+        if self._next_pull is None:
+            return time() + find_wait_time() * 60.0
+        return self._next_pull
+
+    def get_next_refresh(self, buoy):
+        """
+        Get the time of the next refresh of a buoy. When the buoy is not scheduled (or it
+        is being refreshed) the time of the next pull is returned.
+
+        :param buoy: ID of the buoy
+        :return: Seconds since the epoch of the next refresh
+        """
+        state = self._scheduler.get(buoy)
+        if state is None or state.due is None:
+            return self.get_next_pull()
+        return state.due
+
+    def get_schedule(self, limit=None):
+        """
+        Get the upcoming refreshes of the buoys, see `nautical_api.scheduler.RefreshScheduler`.
+
+        :param limit: Max number of buoys, all buoys when `None`
+        :return: list of StationSchedule sorted by the time of the next refresh
+        """
+        return self._scheduler.entries(limit)
 
     def get_all_source_ids(self):
         """
@@ -218,8 +1299,7 @@ class NauticalDatabase:
 
         :return: List of all source IDs
         """
-        with self._retrieve_lock:
-            return list(self._sources.keys())
+        return list(self._snapshot.sources.keys())
 
     def get_aliases(self):
         """
@@ -229,8 +1309,7 @@ class NauticalDatabase:
 
         :return: Aliases which include the endpoint name with the source original name
         """
-        with self._retrieve_lock:
-            return copy(self._aliases)
+        return dict(self._snapshot.aliases)
             
     def get_source(self, source):
         """
@@ -240,9 +1319,7 @@ class NauticalDatabase:
         :param source: ID of the source to retrieve the information from.        
         :return: List of all buoy IDs in the source.
         """
-        if source in self._sources:
-            with self._retrieve_lock:
-                return self._sources[source]
+        return self._snapshot.sources.get(source)
 
     def get_all_buoy_ids(self):
         """
@@ -250,8 +1327,7 @@ class NauticalDatabase:
 
         :return: List of all buoy IDs
         """
-        with self._retrieve_lock:
-            return list(self._buoys.keys())
+        return list(self._snapshot.buoys)
 
     def get_buoy(self, buoy):
         """
@@ -261,17 +1337,412 @@ class NauticalDatabase:
         :param buoy: ID of the buoy
         :return: nautical.noaa.buoy.BuoyData object
         """
-        if buoy in self._buoys:
+        reading = self.get_buoy_reading(buoy)
+        if reading is not None:
+            return reading.data
+        return None
+
+    def get_buoy_reading(self, buoy):
+        """
+        Get the reading for a specific buoy. A stale reading (from a previous pull) is 
+        returned immediately while the buoy is refreshed in the background. 
+
+        :param buoy: ID of the buoy
+        :return: Reading for the buoy, None if the buoy does not exist or could not be retrieved
+        """
+        reading, future, owner = self._claim_buoy(buoy)
+        if reading is not None or future is not None:
+            self._frequency.touch(buoy, reading is not None)
+
+        if future is None:
+            CACHE_REQUESTS.labels("hit" if reading is not None else "not_found").inc()
+            return reading
+
+        if reading is not None:
+            # stale while revalidate
+            CACHE_REQUESTS.labels("stale").inc()
+            if owner:
+                self._submit(self._load_buoy, buoy, future)
+            return reading
+
+        # The lock is not held during the fetch, requests for other buoys are never
+        # blocked, requests for this buoy wait on the result of the single fetch.
+        CACHE_REQUESTS.labels("miss").inc()
+        if owner:
+            self._execute(self._load_buoy, buoy, future)
+
+        try:
+            reading = future.result()
+        except Exception:
+            CACHE_REQUESTS.labels("error").inc()
+            raise
+        if reading is None:
+            CACHE_REQUESTS.labels("error").inc()
+        return reading
+
+    def iter_readings(self, sources=None):
+        """
+        Iterate over the current reading of each buoy. The buoys are not retrieved and the
+        accesses are not counted (hot set, least recently used order). The readings are read
+        one at a time from the buoys of the snapshot when the iteration starts, the memory used
+        does not depend on the number of buoys.
+
+        :param sources: Names of the sources, only the buoys of the sources are included. All
+        buoys when None.
+        :return: generator of tuples (buoy ID, Reading or None when the buoy has not been
+        retrieved or its reading expired)
+        """
+        with self._retrieve_lock:
+            snapshot, buoys = self._snapshot, self._buoys
+
+        def _reading(buoy):
+            reading = buoys.get(buoy)
+            return reading if reading is None or not self._cache.expired(buoy) else None
+
+        if sources is None:
+            # the buoys of the dictionary only change when a pull replaces the dictionary
+            for buoy in buoys:
+                yield buoy, _reading(buoy)
+            return
+
+        seen = set()
+        for name in sources:
+            source = snapshot.sources.get(name)
+            for b in (source.buoys.values() if source is not None else ()):
+                buoy = str(b.station)
+                if buoy not in seen:
+                    seen.add(buoy)
+                    yield buoy, _reading(buoy)
+
+    def get_cache_stats(self):
+        """
+        Get the state of the cached readings. The readings are counted without holding
+        the lock, the counts may be off by the readings that change while counting.
+
+        :return: dictionary with the number of `fresh`, `stale` and `missing` readings, the
+        `oldest` and `mean` age (seconds) of the readings, the number of buoys being fetched
+        (`inflight`), the number of bytes used by the history (`history_bytes`) and by the
+        readings (`cache_bytes`, estimated) and the number of readings evicted by reason (`evictions`).
+        """
+        now = time()
+        fresh = stale = missing = 0
+        ages = []
+        for reading in list(self._buoys.values()):
+            if reading is None:
+                missing += 1
+                continue
+            if reading.stale:
+                stale += 1
+            else:
+                fresh += 1
+            ages.append(max(0.0, now - reading.fetched))
+
+        return {
+            "fresh": fresh,
+            "stale": stale,
+            "missing": missing,
+            "oldest": max(ages) if ages else 0.0,
+            "mean": sum(ages) / len(ages) if ages else 0.0,
+            "inflight": len(self._inflight),
+            "history_bytes": self._history.nbytes if self._history is not None else 0,
+            "cache_bytes": self._cache.nbytes,
+            "evictions": dict(self._cache.evictions)
+        }
+
+    def get_breakers(self):
+        """
+        Get the buoys that failed to be retrieved, see `nautical_api.breaker.CircuitBreakers`.
+
+        :return: list of the BreakerState of the buoys, sorted by buoy ID
+        """
+        return self._breakers.states()
+
+    def get_hot_set(self, limit=None):
+        """
+        Get the most frequently requested buoys, see `nautical_api.frequency.AccessFrequency.stats`.
+
+        :param limit: Max number of buoys in the hot set, defaults to `hot_size`
+        :return: dictionary describing the hot set, its coverage of the requests and its hit rate
+        """
+        return self._frequency.stats(limit)
+
+    def get_buoy_history(self, buoy, since=None, fields=None):
+        """
+        Get the history of the readings for a buoy, see `nautical_api.history.History`.
+
+        :param buoy: ID of the buoy
+        :param since: Only include readings observed after this time (seconds since the epoch)
+        :param fields: Names of the fields to include, all fields when `None`
+        :return: List of readings (oldest first), None when the buoy does not exist
+        """
+        if buoy not in self._buoys:
+            return None
+        if self._history is None:
+            return []
+        return self._history.query(buoy, since, fields) or []
+
+    def get_buoys_near(self, lat, lon, radius_km, limit=None):
+        """
+        Find the buoys within a distance of a point, see `nautical_api.spatial.SpatialIndex.near`.
+
+        :param lat: Latitude (degrees) of the point
+        :param lon: Longitude (degrees) of the point
+        :param radius_km: Max distance (kilometers) from the point
+        :param limit: Max number of buoys returned
+        :return: list of (buoy ID, latitude, longitude, distance), the closest buoy is first
+        """
+        return self._spatial.near(lat, lon, radius_km, limit)
+
+    def get_buoys_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Find the buoys inside a bounding box, see `nautical_api.spatial.SpatialIndex.bbox`.
+
+        :return: list of (buoy ID, latitude, longitude) sorted by buoy ID
+        """
+        return self._spatial.bbox(min_lat, min_lon, max_lat, max_lon)
+
+    def get_changes(self, since=None):
+        """
+        Get the sources and buoys that changed after a generation, see `nautical_api.changes`.
+        A buoy changed when it was added or its information changed, a source changed when it
+        was added or its buoys changed.
+
+        :param since: Generation of the last sync, `None` for everything
+        :return: dictionary containing the current `generation`, `reset` (when set the client
+        must discard everything it has), the changed `sources` (aliases mapped to the list of buoy
+        IDs), the changed `buoys` (IDs mapped to the Reading, None when not retrieved) and the
+        `removed_sources` and `removed_buoys`.
+        """
+        changes = self._changes.since(since)
+        with self._retrieve_lock:
+            snapshot, buoys = self._snapshot, self._buoys
+
+        output = {
+            "generation": changes.generation,
+            "reset": changes.reset,
+            "sources": {},
+            "buoys": {},
+            "removed_sources": [x for kind, x in changes.removed if kind == SOURCE],
+            "removed_buoys": [x for kind, x in changes.removed if kind == BUOY]
+        }
+        for kind, key in changes.changed:
+            if kind == SOURCE and key in snapshot.aliases:
+                output["sources"][key] = [str(b.station) for b in snapshot.sources[snapshot.aliases[key]]]
+            elif kind == BUOY and key in buoys:
+                output["buoys"][key] = buoys[key]
+        return output
+
+    def query_buoys(self, predicates, fields=None):
+        """
+        Find the buoys whose current reading matches all predicates, see
+        `nautical_api.table.ReadingTable.query`. Only the readings that have been
+        retrieved are considered.
+
+        :param predicates: List of tuples (field, operator name, value)
+        :param fields: Names of the fields included for the matching buoys
+        :return: dictionary of the matching buoy IDs mapped to a dictionary of their fields
+        """
+        return self._table.query(predicates, fields)
+
+    def get_buoy_readings(self, buoys, timeout=None):
+        """
+        Get the readings for many buoys. The missing buoys are fetched concurrently in the
+        background, see `get_buoy_reading` for more information.
+
+        :param buoys: IDs of the buoys
+        :param timeout: Max number of seconds to wait for the missing buoys. The buoys that
+        are not retrieved in time continue to be fetched in the background. When `None` wait
+        for all buoys.
+        :return: Tuple of the dictionary of buoy IDs mapped to their readings, and the dictionary
+        of buoy IDs mapped to the reason that the reading could not be provided.
+        """
+        readings = {}
+        errors = {}
+        pending = {}
+        requested = set()
+
+        for buoy in buoys:
+            if buoy in requested:
+                continue
+            requested.add(buoy)
+
+            reading, future, owner = self._claim_buoy(buoy)
+            if owner:
+                self._submit(self._load_buoy, buoy, future)
+            if reading is not None or future is not None:
+                self._frequency.touch(buoy, reading is not None)
+
+            if reading is not None:
+                readings[buoy] = reading  # fresh, or stale while revalidate
+                CACHE_REQUESTS.labels("hit" if future is None else "stale").inc()
+            elif future is None:
+                errors[buoy] = "not found"
+                CACHE_REQUESTS.labels("not_found").inc()
+            else:
+                pending[future] = buoy
+                CACHE_REQUESTS.labels("miss").inc()
+
+        done, not_done = wait(pending.keys(), timeout=timeout)
+        for future in done:
+            buoy = pending[future]
+            try:
+                reading = future.result()
+            except Exception as e:
+                errors[buoy] = str(e)
+                CACHE_REQUESTS.labels("error").inc()
+                continue
+
+            if reading is None:
+                errors[buoy] = "unavailable"
+                CACHE_REQUESTS.labels("error").inc()
+            else:
+                readings[buoy] = reading
+
+        for future in not_done:
+            errors[pending[future]] = "timeout"
+
+        return readings, errors
+
+    def _claim_buoy(self, buoy, requested=True):
+        """
+        Find the current reading of the buoy. When the reading is missing or stale the future
+        of the fetch for the buoy is returned, only one fetch will run for each buoy at a time.
+
+        :param buoy: ID of the buoy
+        :param requested: True when a client requested the buoy, False for the fetches in
+        the background (warm up, refresh) that do not change the order of the cache
+        :return: Tuple of the current reading, the future of the fetch (None when the reading
+        is fresh or the buoy does not exist, `UNAVAILABLE` when the buoy is not fetched because of
+        a recent failure), and True when the caller owns (must run) the fetch.
+        """
+        with self._retrieve_lock:
+            if buoy not in self._buoys:
+                return None, None, False  # Buoy does not exist
+
+            # This will be a reading (which could be cached if looked up more than once in a time period)
+            reading = self._buoys[buoy]
+            if reading is not None and not self._cache.touch(buoy, used=requested):
+                # the reading expired
+                reading = self._buoys[buoy] = None
+                self._table.clear(buoy)
+            if reading is not None and not reading.stale:
+                return reading, None, False
+
+            future = self._inflight.get(buoy)
+            owner = future is None
+            if owner:
+                if not self._breakers.allow(buoy):
+                    # the failure is cached or the breaker is open, the buoy is not fetched
+                    return reading, UNAVAILABLE, False
+                future = Future()
+                self._inflight[buoy] = future
+
+        return reading, future, owner
+
+    def _submit(self, fn, *args):
+        """
+        Run the function in the background using the engine. Once the database has been
+        stopped, the function is run in the calling thread.
+        """
+        if not self._stop_event.is_set():
+            try:
+                return self._engine.submit(fn, *args)
+            except EngineStopped:
+                pass
+
+        fn(*args)
+        return None
+
+    def _execute(self, fn, *args):
+        """
+        Run the function (a fetch) using the engine and wait for the result. Once the database
+        has been stopped, the function is run in the calling thread.
+        """
+        if not self._stop_event.is_set():
+            try:
+                return self._engine.execute(fn, *args)
+            except EngineStopped:
+                pass
+
+        return fn(*args)
+
+    def _load_buoy(self, buoy, future):
+        """
+        Fetch the buoy and store the result, the result (or failure) is set on the
+        `future` that is shared by all requests waiting on this buoy.
+
+        :param buoy: ID of the buoy
+        :param future: Future that is shared by all requests for the buoy
+        """
+        if self._following:
+            self._request_shared(buoy, future)
+            return
+
+        try:
+            data = self._fetch_buoy(buoy)
+        except BaseException as e:
             with self._retrieve_lock:
-                if self._buoys[buoy] is None:
-
-                    try:
-                        b = create_buoy(buoy)
-                        self._buoys[buoy] = b.present
-                    except HTTPError as e:
-                        log.warning(e)
-
-                # This will either be None, a buoy (which could be cached
-                # if looked up more than once in a time period)
-                return self._buoys[buoy]
-        return None  # Buoy does not exist
+                self._inflight.pop(buoy, None)
+                exists = buoy in self._buoys
+            future.set_exception(e)
+            # unexpected errors (such as parse errors) are retried with a backoff
+            if exists:
+                self._scheduler.failed(buoy)
+            raise
+
+        reading = Reading(data, time()) if data is not None else None
+        stored, exists = self._set_reading(buoy, reading, future)
+        if stored:
+            self._scheduler.observed(buoy, reading.data.epoch_time, reading.fetched)
+        elif exists:
+            self._scheduler.failed(buoy)
+
+    def _set_reading(self, buoy, reading, future=None):
+        """
+        Store the reading of a buoy, the reading is set on the `future` (by default the
+        future of the fetch of the buoy) that is shared by all requests waiting on this buoy.
+        The reading receives a new version when its information changed, otherwise it keeps
+        the version of the previous reading.
+
+        :param buoy: ID of the buoy
+        :param reading: New reading, None when the fetch failed
+        :param future: Future that is shared by all requests for the buoy
+        :return: Tuple of True when the reading was stored, and True when the buoy exists
+        """
+        stored, changed = False, False
+        with self._retrieve_lock:
+            # The buoy may have been removed by a pull while it was fetched. When the
+            # fetch failed, the stale reading is kept.
+            exists = buoy in self._buoys
+            if reading is not None and exists:
+                stored, previous = True, self._buoys[buoy]
+                # the same observation fetched again keeps the version, so the encoded
+                # bodies and ETags of the buoy remain valid
+                changed = previous is None or jsonify_buoy_data(previous.data) != jsonify_buoy_data(reading.data)
+                reading = reading._replace(version=next(self._versions) if changed else previous.version)
+                self._buoys[buoy] = reading
+                for evicted in self._cache.add(buoy, reading):
+                    if evicted in self._buoys:
+                        self._buoys[evicted] = None
+                        self._table.clear(evicted)
+            inflight = self._inflight.pop(buoy, None)
+
+        if future is None:
+            future = inflight
+        if future is not None:
+            future.set_result(reading)
+
+        # only notify when the information changed, not when the same observation is fetched again
+        if changed:
+            generation = self._changes.update([(BUOY, buoy)])
+            self._notify(Update(READING_UPDATE, generation, buoy, reading))
+
+        # the reading of a buoy that was removed while it was fetched is not kept
+        if stored:
+            self._table.update(buoy, reading.data)
+            if self._history is not None:
+                self._history.record(buoy, reading.data)
+            if self._store is not None and not self._following:
+                self._store.save_reading(buoy, reading.data, reading.fetched)
+
+        return stored, exists
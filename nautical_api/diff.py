@@ -0,0 +1,150 @@
+"""
+Differences between two pulls of the sources. The sources and their buoys rarely change
+between pulls, each pull is summarized in an index (the members of each source and the
+location of each buoy) that is compared with the index of the previous pull, so only the
+sources and buoys that changed are applied to the database.
+
+The listing of the sources does not include the observations of most buoys. When a buoy
+of the listing includes an observation, the time of the observation is part of the index
+and the buoy is reported as `advanced` when a newer observation is listed.
+"""
+from typing import Mapping, NamedTuple, Tuple
+
+
+class SourceIndex(NamedTuple):
+    """Summary of the sources from a single pull. Each source name is mapped to a tuple
+    of its description and its members (station, latitude, longitude), each station is
+    mapped to a tuple of its latitude, longitude and the time of its listed observation.
+    """
+
+    sources: Mapping[str, tuple]
+    stations: Mapping[str, tuple]
+
+
+class SourceDiff(NamedTuple):
+    """Sources and buoys that changed between two pulls. A source is changed when its
+    description, its buoys or their locations changed.
+    """
+
+    added_sources: Tuple[str, ...] = ()
+    removed_sources: Tuple[str, ...] = ()
+    changed_sources: Tuple[str, ...] = ()
+    added: Tuple[str, ...] = ()
+    removed: Tuple[str, ...] = ()
+    moved: Tuple[str, ...] = ()
+    advanced: Tuple[str, ...] = ()
+    unchanged: int = 0
+
+    @property
+    def changed(self):
+        """
+        :return: True when the sources or the buoys (or their locations) changed
+        """
+        return bool(
+            self.added_sources or self.removed_sources or self.changed_sources or
+            self.added or self.removed or self.moved
+        )
+
+    @property
+    def members_changed(self):
+        """
+        :return: True when buoys were added or removed
+        """
+        return bool(self.added or self.removed)
+
+    def stats(self):
+        """
+        :return: dictionary of the number of sources and buoys for each kind of change
+        """
+        return {
+            "added_sources": len(self.added_sources),
+            "removed_sources": len(self.removed_sources),
+            "changed_sources": len(self.changed_sources),
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "moved": len(self.moved),
+            "advanced": len(self.advanced),
+            "unchanged": self.unchanged
+        }
+
+
+EMPTY_INDEX = SourceIndex({}, {})
+
+
+def _location(buoy):
+    """
+    :return: tuple of the latitude and longitude of the buoy, (None, None) when unknown
+    """
+    location = buoy.location
+    if location is None or location.latitude is None or location.longitude is None:
+        return None, None
+    return float(location.latitude), float(location.longitude)
+
+
+def index_sources(sources):
+    """
+    Summarize the sources, buoys that are part of multiple sources are indexed once.
+
+    :param sources: dictionary of source names mapped to their respective source
+    :return: SourceIndex
+    """
+    indexed = {}
+    stations = {}
+    for name, source in sources.items():
+        members = []
+        for buoy in source.buoys.values():
+            station = str(buoy.station)
+            lat, lon = _location(buoy)
+            members.append((station, lat, lon))
+            if station not in stations:
+                epoch = getattr(buoy.present, "epoch_time", None) or None
+                stations[station] = (lat, lon, epoch)
+
+        description = source.description
+        indexed[name] = (str(description) if description is not None else None, tuple(members))
+
+    return SourceIndex(indexed, stations)
+
+
+def diff_sources(previous, current):
+    """
+    Find the sources and buoys that changed between two pulls.
+
+    :param previous: SourceIndex of the previous pull
+    :param current: SourceIndex of the new pull
+    :return: SourceDiff
+    """
+    added_sources = removed_sources = changed_sources = ()
+    if previous.sources != current.sources:
+        old, new = previous.sources, current.sources
+        added_sources = tuple(x for x in new if x not in old)
+        removed_sources = tuple(x for x in old if x not in new)
+        changed_sources = tuple(x for x, value in new.items() if x in old and old[x] != value)
+
+    old, new = previous.stations, current.stations
+    if old == new:
+        return SourceDiff(added_sources, removed_sources, changed_sources, unchanged=len(new))
+
+    added = tuple(x for x in new if x not in old)
+    removed = tuple(x for x in old if x not in new)
+    moved = []
+    advanced = []
+    for station, (lat, lon, epoch) in new.items():
+        before = old.get(station)
+        if before is None or before == (lat, lon, epoch):
+            continue
+        if before[0] != lat or before[1] != lon:
+            moved.append(station)
+        if epoch is not None and (before[2] is None or epoch > before[2]):
+            advanced.append(station)
+
+    return SourceDiff(
+        added_sources,
+        removed_sources,
+        changed_sources,
+        added,
+        removed,
+        tuple(moved),
+        tuple(advanced),
+        len(new) - len(added) - len(moved)
+    )
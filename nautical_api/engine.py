@@ -0,0 +1,311 @@
+"""
+The engines control how the connector schedules the pulls and runs the fetches
+for the buoys. The threaded engine uses a chain of `threading.Timer` objects and a
+pool of threads. The asyncio engine runs the schedule and the fetches on a single
+event loop where a semaphore limits the number of fetches in flight.
+
+The nautical library is blocking, so the asyncio engine still runs each call to the
+nautical library in an executor, the event loop controls when and how many run.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import getLogger
+from threading import Event, Lock, Thread, Timer
+
+
+log = getLogger()
+# Seconds before a scheduled function that failed is run again, doubled for each
+# consecutive failure
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+def _retry_delay(failures):
+    """
+    :param failures: Number of consecutive failures of the scheduled function
+    :return: Seconds before the function is run again
+    """
+    return min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** min(failures - 1, 32))
+
+
+class EngineStopped(RuntimeError):
+    """Raised when a function is submitted to an engine that has been stopped."""
+
+
+class ThreadedEngine:
+
+    """
+    Engine that schedules the pulls with `threading.Timer` and runs the fetches
+    in a pool of threads.
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: Max number of fetches that are run concurrently in the background
+        """
+        self._workers = max(1, int(workers))
+        self._executor = None
+        self._timer = None
+        self._failures = 0
+        self._lock = Lock()
+        self._stopped = False
+
+    def schedule(self, delay, fn):
+        """
+        Run the function after the delay. Only a single function is scheduled at a time,
+        the previously scheduled function is cancelled. When the function fails, it is
+        scheduled again with an exponential backoff.
+
+        :param delay: Number of seconds to wait before running the function
+        :param fn: Function in the form of `fn()`
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = Timer(delay, self._scheduled, args=(fn,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _scheduled(self, fn):
+        try:
+            fn()
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            delay = _retry_delay(self._failures)
+            log.error("{} scheduled function failed (retry in {:.0f}s): {}".format(
+                self.__class__.__name__, delay, e
+            ))
+            self.schedule(delay, fn)
+
+    def submit(self, fn, *args):
+        """
+        Run the function in the background.
+
+        :param fn: Function to run
+        :return: concurrent.futures.Future of the function
+        :raises EngineStopped: when the engine has been stopped
+        """
+        with self._lock:
+            if self._stopped:
+                raise EngineStopped("{} has been stopped".format(self.__class__.__name__))
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers)
+            return self._executor.submit(fn, *args)
+
+    def execute(self, fn, *args):
+        """
+        Run the function (a fetch) and wait for the result. The function is run in
+        the calling thread.
+
+        :param fn: Function to run
+        :return: result of the function
+        """
+        return fn(*args)
+
+    def pool(self, workers):
+        """
+        :param workers: Max number of functions run concurrently by the pool
+        :return: Executor used to run a group of functions, such as warming the buoys
+        """
+        return ThreadPoolExecutor(max_workers=max(1, int(workers)))
+
+    def stop(self):
+        """
+        Cancel the scheduled function and stop accepting functions.
+        """
+        with self._lock:
+            self._stopped = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+class _LoopPool:
+
+    """
+    Executor like object for a group of functions run by the asyncio engine. The
+    number of functions run concurrently is limited by the semaphore of the engine.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._futures = []
+
+    def submit(self, fn, *args):
+        future = self._engine.submit(fn, *args)
+        self._futures.append(future)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        wait(self._futures)
+        return False
+
+
+class AsyncioEngine:
+
+    """
+    Engine that runs the schedule and the fetches on a single asyncio event loop. The
+    loop runs in a background (daemon) thread that is started on first use.
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: Max number of fetches in flight, this is the size of the semaphore
+        """
+        self._workers = max(1, int(workers))
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._executor = None
+        self._handle = None
+        self._failures = 0
+        self._tasks = set()
+        self._lock = Lock()
+        self._stopped = False
+
+    def _start(self):
+        """
+        Start the event loop in the background if it is not running.
+
+        :raises EngineStopped: when the engine has been stopped
+        """
+        if self._stopped:
+            raise EngineStopped("{} has been stopped".format(self.__class__.__name__))
+
+        if self._loop is None:
+            started = Event()
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+
+            def _run_loop():
+                asyncio.set_event_loop(self._loop)
+                self._semaphore = asyncio.Semaphore(self._workers)
+                started.set()
+                self._loop.run_forever()
+                self._loop.close()
+
+            self._thread = Thread(target=_run_loop, daemon=True)
+            self._thread.start()
+            started.wait()
+
+        return self._loop
+
+    async def _bounded(self, fn, *args):
+        """
+        Run the function in the executor once the semaphore is acquired.
+        """
+        async with self._semaphore:
+            return await self._loop.run_in_executor(self._executor, fn, *args)
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule(self, delay, fn):
+        """
+        Run the function after the delay. Only a single function is scheduled at a time,
+        the previously scheduled function is cancelled. When the function fails, it is
+        scheduled again with an exponential backoff.
+
+        :param delay: Number of seconds to wait before running the function
+        :param fn: Function in the form of `fn()`
+        """
+        def _schedule():
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = self._loop.call_later(
+                delay, lambda: self._track(self._loop.create_task(self._scheduled(fn)))
+            )
+
+        with self._lock:
+            if self._stopped:
+                return
+            self._start().call_soon_threadsafe(_schedule)
+
+    async def _scheduled(self, fn):
+        """
+        Scheduled functions (pulls) are not limited by the semaphore. When the function
+        fails, it is scheduled again with an exponential backoff.
+        """
+        try:
+            await self._loop.run_in_executor(None, fn)
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            delay = _retry_delay(self._failures)
+            log.error("{} scheduled function failed (retry in {:.0f}s): {}".format(
+                self.__class__.__name__, delay, e
+            ))
+            self.schedule(delay, fn)
+
+    def submit(self, fn, *args):
+        """
+        Run the function on the event loop (in the executor) once the semaphore is acquired.
+
+        :param fn: Function to run
+        :return: concurrent.futures.Future of the function
+        :raises EngineStopped: when the engine has been stopped
+        """
+        with self._lock:
+            loop = self._start()
+
+            async def _submitted():
+                task = asyncio.ensure_future(self._bounded(fn, *args))
+                self._track(task)
+                return await task
+
+            return asyncio.run_coroutine_threadsafe(_submitted(), loop)
+
+    def execute(self, fn, *args):
+        """
+        Run the function (a fetch) on the event loop and wait for the result.
+
+        :param fn: Function to run
+        :return: result of the function
+        """
+        return self.submit(fn, *args).result()
+
+    def pool(self, workers):
+        """
+        :param workers: Unused, the number of functions run concurrently is limited
+        by the semaphore of the engine.
+        :return: Executor used to run a group of functions, such as warming the buoys
+        """
+        return _LoopPool(self)
+
+    def stop(self):
+        """
+        Cancel the scheduled function and stop accepting functions. The functions that
+        are running are allowed to finish before the event loop is stopped.
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            if self._loop is None:
+                return
+
+            async def _shutdown():
+                if self._handle is not None:
+                    self._handle.cancel()
+                if self._tasks:
+                    await asyncio.wait(list(self._tasks))
+                self._loop.stop()
+                self._executor.shutdown(wait=False)
+
+            asyncio.run_coroutine_threadsafe(_shutdown(), self._loop)
+
+
+ENGINES = {
+    "thread": ThreadedEngine,
+    "asyncio": AsyncioEngine
+}
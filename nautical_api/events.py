@@ -0,0 +1,119 @@
+"""
+Delivery of the updates of the connector to clients (Server-Sent Events). Each client
+is a subscriber of the connector with its own bounded queue. The connector only places
+the updates in the queue, so a slow client never blocks a pull or a fetch. When the
+queue of a client is full the updates are dropped and the client is told how many
+updates were dropped.
+"""
+from json import dumps
+from queue import Queue, Empty, Full
+from threading import Lock
+from .connector import PULL_UPDATE, jsonify_buoy_data
+
+
+# Max number of updates waiting to be sent to a single client
+DEFAULT_QUEUE_SIZE = 256
+# Seconds between the comments sent to keep an idle stream open
+HEARTBEAT_INTERVAL = 15.0
+
+
+class Subscriber:
+
+    """
+    Callback for `NauticalDatabase.subscribe` that keeps the updates for a single client.
+    """
+
+    def __init__(self, buoys=None, maxsize=DEFAULT_QUEUE_SIZE):
+        """
+        :param buoys: IDs of the buoys the client receives updates for, all buoys when `None`.
+        Pull updates are always received.
+        :param maxsize: Max number of updates waiting in the queue
+        """
+        self.buoys = None if buoys is None else frozenset(buoys)
+        self.dropped = 0
+        self._queue = Queue(maxsize=max(1, int(maxsize)))
+        self._lock = Lock()
+
+    def __call__(self, update):
+        """
+        Place the update in the queue when the client receives updates for the buoy.
+
+        :param update: nautical_api.connector.Update
+        """
+        if update.kind != PULL_UPDATE and self.buoys is not None and update.buoy not in self.buoys:
+            return
+        try:
+            self._queue.put_nowait(update)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+
+    def get(self, timeout=None):
+        """
+        Wait for the next update.
+
+        :param timeout: Max number of seconds to wait
+        :return: next Update, None when no update arrived before the timeout
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def take_dropped(self):
+        """
+        :return: Number of updates dropped since the last call
+        """
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+def format_event(event, data):
+    """
+    :param event: Name of the event
+    :param data: JSON data of the event
+    :return: Server-Sent Event
+    """
+    return "event: {}\ndata: {}\n\n".format(event, dumps(data))
+
+
+def format_update(update):
+    """
+    :param update: nautical_api.connector.Update
+    :return: Server-Sent Event for the update
+    """
+    if update.kind == PULL_UPDATE:
+        return format_event(update.kind, {"generation": update.generation})
+    return format_event(update.kind, {
+        "buoy": update.buoy,
+        "generation": update.generation,
+        "version": update.reading.version,
+        "data": jsonify_buoy_data(update.reading.data)
+    })
+
+
+def stream(subscriber, subscribe, unsubscribe, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    Generator of the Server-Sent Events for a subscriber. The subscriber is added when
+    the stream starts and removed when the stream is closed (the client disconnects).
+
+    :param subscriber: Subscriber of the client
+    :param subscribe: Function in the form of `func(callback)` that returns the identifier of the callback
+    :param unsubscribe: Function in the form of `func(identifier)`
+    :param heartbeat: Seconds between the comments sent when there are no updates
+    :return: Generator of the events (strings)
+    """
+    hsh = subscribe(subscriber)
+    try:
+        yield ": connected\n\n"
+        while True:
+            update = subscriber.get(timeout=heartbeat)
+
+            dropped = subscriber.take_dropped()
+            if dropped:
+                yield format_event("dropped", {"dropped": dropped})
+
+            yield ": heartbeat\n\n" if update is None else format_update(update)
+    finally:
+        unsubscribe(hsh)
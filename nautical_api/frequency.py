@@ -0,0 +1,172 @@
+"""
+Access frequency of the buoys. Each access adds to the score of the buoy and the scores
+decay exponentially (halved every `half_life` seconds), so the score combines how often
+(LFU) and how recently (LRU) a buoy was requested. The buoys with the highest scores are
+the hot set, they are refreshed first.
+
+The scores are not decayed on each access, each access adds `2 ** ((now - start) / half_life)`
+where `start` is a reference time. All scores grow at the same rate so they can be compared
+directly, the scores are rescaled when the reference time becomes too old.
+"""
+from heapq import nlargest
+from threading import Lock
+from time import time
+
+
+DEFAULT_HALF_LIFE = 60 * 60
+DEFAULT_HOT_SIZE = 500
+# Max exponent of the weight of an access before the scores are rescaled
+MAX_EXPONENT = 512.0
+# Decayed scores below this value are forgotten when the scores are rescaled
+MIN_SCORE = 1e-3
+
+
+class AccessFrequency:
+
+    """
+    Decaying count of the accesses (and the accesses served from memory, hits) of each key.
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE, hot_size=DEFAULT_HOT_SIZE, start=None):
+        """
+        :param half_life: Seconds for the score of an access to be halved
+        :param hot_size: Max number of keys in the hot set
+        :param start: Reference time of the scores, defaults to the current time
+        """
+        self.half_life = float(half_life)
+        self.hot_size = max(0, int(hot_size))
+        self._start = time() if start is None else start
+
+        # key mapped to a list of the score and the hits (weighted in the same manner)
+        self._scores = {}
+        self._total = [0.0, 0.0]
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def _weight(self, now):
+        """
+        :return: weight of an access at `now`
+        """
+        return 2.0 ** ((now - self._start) / self.half_life)
+
+    def _rescale(self, now):
+        """
+        Move the reference time to `now`, the scores are divided by the weight of `now`.
+        The keys whose score decayed below `MIN_SCORE` are removed.
+        """
+        factor = 1.0 / self._weight(now)
+        for key in list(self._scores):
+            values = self._scores[key]
+            values[0] *= factor
+            values[1] *= factor
+            if values[0] < MIN_SCORE:
+                del self._scores[key]
+        self._total = [x * factor for x in self._total]
+        self._start = now
+
+    def touch(self, key, hit=True, now=None):
+        """
+        Record an access of the key.
+
+        :param key: Key that was accessed (ID of the buoy)
+        :param hit: True when the access was served from memory
+        :param now: Time of the access (seconds since the epoch), defaults to the current time
+        """
+        now = time() if now is None else now
+        with self._lock:
+            if (now - self._start) / self.half_life > MAX_EXPONENT:
+                self._rescale(now)
+
+            weight = self._weight(now)
+            values = self._scores.get(key)
+            if values is None:
+                values = self._scores[key] = [0.0, 0.0]
+            values[0] += weight
+            self._total[0] += weight
+            if hit:
+                values[1] += weight
+                self._total[1] += weight
+
+    def score(self, key, now=None):
+        """
+        :param key: Key
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: decayed number of accesses of the key
+        """
+        now = time() if now is None else now
+        values = self._scores.get(key)
+        return values[0] / self._weight(now) if values is not None else 0.0
+
+    def hot(self, limit=None):
+        """
+        :param limit: Max number of keys, defaults to `hot_size`
+        :return: list of the hot keys, the most frequently accessed first
+        """
+        limit = self.hot_size if limit is None else limit
+        with self._lock:
+            items = list(self._scores.items())
+        return [key for key, _ in nlargest(limit, items, key=lambda x: x[1][0])]
+
+    def order(self, keys):
+        """
+        :param keys: Keys to order
+        :return: list of the keys, the most frequently accessed first. The keys that
+        were not accessed keep their order.
+        """
+        scores = self._scores
+
+        def _key(key):
+            values = scores.get(key)
+            return -values[0] if values is not None else 0.0
+
+        return sorted(keys, key=_key)
+
+    def retain(self, keys):
+        """
+        Remove the keys that are not in `keys`.
+
+        :param keys: Keys to keep
+        """
+        keys = set(keys)
+        with self._lock:
+            for key in [x for x in self._scores if x not in keys]:
+                values = self._scores.pop(key)
+                self._total[0] -= values[0]
+                self._total[1] -= values[1]
+
+    def stats(self, limit=None, now=None):
+        """
+        Get the hot set along with the share of the accesses that it receives (`coverage`)
+        and the share of its accesses served from memory (`hit_rate`).
+
+        :param limit: Max number of keys in the hot set, defaults to `hot_size`
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: dictionary with the `size` of the hot set, the number of keys `tracked`, the
+        decayed number of `accesses`, the `coverage` and `hit_rate` of the hot set, the
+        `overall_hit_rate` of all keys and the list of `keys` as tuples (key, score, hit rate)
+        """
+        now = time() if now is None else now
+        limit = self.hot_size if limit is None else limit
+        with self._lock:
+            items = list(self._scores.items())
+            total, hits = self._total
+            factor = 1.0 / self._weight(now)
+
+        hot = nlargest(limit, items, key=lambda x: x[1][0])
+        hot_total = sum(values[0] for _, values in hot)
+        hot_hits = sum(values[1] for _, values in hot)
+
+        def _ratio(a, b):
+            return min(1.0, a / b) if b > 0 else 0.0
+
+        return {
+            "size": limit,
+            "tracked": len(items),
+            "accesses": total * factor,
+            "coverage": _ratio(hot_total, total),
+            "hit_rate": _ratio(hot_hits, hot_total),
+            "overall_hit_rate": _ratio(hits, total),
+            "keys": [(key, values[0] * factor, _ratio(values[1], values[0])) for key, values in hot]
+        }
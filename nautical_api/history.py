@@ -0,0 +1,179 @@
+"""
+Bounded history of the readings for each buoy. The numeric fields of the readings are
+kept in typed arrays (ring buffers) so the memory used by each buoy is fixed by the
+number of readings kept, see `StationHistory.nbytes`.
+"""
+from nautical.noaa.buoy.buoy_data import BuoyData
+from array import array
+from math import isnan
+from threading import Lock
+
+
+# Fields of the readings that are kept as numbers, the date/time fields are
+# replaced by the epoch time of the reading
+NUMERIC_FIELDS = tuple(x for x in BuoyData.__slots__ if x not in ("year", "mm", "dd", "time"))
+DEFAULT_HISTORY_SIZE = 48
+NAN = float("nan")
+
+
+def to_float(value):
+    """
+    :return: value as a float, NaN when the value is not set or is not numeric
+    """
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class StationHistory:
+
+    """
+    Ring buffer of the readings for a single buoy. The arrays are allocated to the
+    full size when the buffer is created.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: Max number of readings kept, the oldest reading is replaced when full
+        """
+        self.size = size
+        self._times = array("d", [NAN]) * size
+        self._columns = {field: array("d", [NAN]) * size for field in NUMERIC_FIELDS}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        """
+        :return: Number of bytes used by the arrays of the buffer
+        """
+        return self._times.itemsize * self.size * (len(self._columns) + 1)
+
+    @property
+    def latest(self):
+        """
+        :return: epoch time of the most recent reading, None when empty
+        """
+        if self._count == 0:
+            return None
+        return self._times[(self._next - 1) % self.size]
+
+    def append(self, epoch, data):
+        """
+        Add a reading to the buffer. Readings that are not newer than the most recent
+        reading (the same observation) are ignored.
+
+        :param epoch: Epoch time of the observation
+        :param data: nautical.noaa.buoy.BuoyData object
+        :return: True when the reading was added
+        """
+        latest = self.latest
+        if latest is not None and epoch <= latest:
+            return False
+
+        index = self._next
+        self._times[index] = epoch
+        for field, column in self._columns.items():
+            column[index] = to_float(getattr(data, field, None))
+
+        self._next = (index + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+        return True
+
+    def query(self, since=None, fields=None):
+        """
+        Get the readings in the buffer, the oldest reading is first.
+
+        :param since: Only include readings with an epoch time after this time
+        :param fields: Names of the fields to include, all fields when `None`
+        :return: List of dictionaries containing the `time` and the fields that are set
+        """
+        fields = NUMERIC_FIELDS if fields is None else fields
+        columns = [(field, self._columns[field]) for field in fields]
+
+        output = []
+        start = (self._next - self._count) % self.size
+        for i in range(self._count):
+            index = (start + i) % self.size
+            epoch = self._times[index]
+            if since is not None and epoch <= since:
+                continue
+
+            entry = {"time": int(epoch)}
+            for field, column in columns:
+                value = column[index]
+                if not isnan(value):
+                    entry[field] = value
+            output.append(entry)
+        return output
+
+
+class History:
+
+    """
+    History of the readings for all buoys. The buffer for a buoy is created when the
+    first reading for the buoy is recorded.
+    """
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        """
+        :param size: Max number of readings kept for each buoy
+        """
+        self.size = max(1, int(size))
+        self._stations = {}
+        self._lock = Lock()
+
+    def record(self, station, data):
+        """
+        Record a reading for a buoy.
+
+        :param station: ID of the buoy
+        :param data: nautical.noaa.buoy.BuoyData object
+        :return: True when the reading was added (it is a new observation)
+        """
+        with self._lock:
+            history = self._stations.get(station)
+            if history is None:
+                history = self._stations[station] = StationHistory(self.size)
+            return history.append(data.epoch_time, data)
+
+    def query(self, station, since=None, fields=None):
+        """
+        Get the readings for a buoy, see `StationHistory.query`.
+
+        :return: List of readings, None when there is no history for the buoy
+        """
+        with self._lock:
+            history = self._stations.get(station)
+            if history is None:
+                return None
+            return history.query(since, fields)
+
+    def retain(self, stations):
+        """
+        Remove the history of all buoys that are not in `stations`.
+
+        :param stations: IDs of the buoys to keep
+        """
+        stations = set(stations)
+        with self._lock:
+            for station in [x for x in self._stations if x not in stations]:
+                self._stations.pop(station)
+
+    @property
+    def nbytes(self):
+        """
+        :return: Number of bytes used by the arrays of all buoys
+        """
+        with self._lock:
+            return sum(x.nbytes for x in self._stations.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._stations)
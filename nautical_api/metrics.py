@@ -0,0 +1,327 @@
+"""
+Metrics of the application in the Prometheus text format. The metrics are kept in
+memory by the process, recording a value costs a dictionary lookup and an uncontended
+lock, so the metrics are always enabled.
+
+Counters and histograms are updated as the events happen, gauges are set when the
+metrics are collected (see `nautical_api.resources.MetricsGetter`).
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+
+# Buckets (seconds) for the latency of requests, pulls and fetches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Buckets (seconds) for the time spent waiting on locks
+LOCK_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+
+    """
+    Collection of the metrics that are rendered together.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return "".join(x.render() for x in metrics)
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names, values):
+    pairs = list(zip(names, values))
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+
+    """
+    Metric with an optional set of labels, each combination of label values is a child
+    that holds the value(s).
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        """
+        :param name: Name of the metric
+        :param documentation: Help text of the metric
+        :param labels: Names of the labels
+        :param registry: Registry the metric is added to, None to not register the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = Lock()
+        if not self.label_names:
+            self._default = self.labels()
+        if registry is not None:
+            registry.register(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        :param values: Values of the labels, in the order of the label names
+        :return: child of the metric for the label values
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError("{} expects labels {}".format(self.name, self.label_names))
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def clear(self):
+        """
+        Remove all children of a metric with labels.
+        """
+        with self._lock:
+            if self.label_names:
+                self._children.clear()
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.kind)]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, _format_labels(self.label_names, values)))
+        return "\n".join(lines) + "\n"
+
+
+class _Value:
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labels):
+        return ["{}{} {}".format(name, labels, _format_value(self.value))]
+
+
+class Counter(_Metric):
+
+    """
+    Value that only increases, such as the number of requests.
+    """
+
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+
+    """
+    Value that is set, such as the number of buoys in the cache.
+    """
+
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _HistogramValue:
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Observe the number of seconds spent in the context.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def render(self, name, labels):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+
+        lines = []
+        cumulative = 0
+        names = [] if not labels else [labels[1:-1]]
+        for bound, count in zip(self._buckets + (float("inf"), ), counts):
+            cumulative += count
+            le = ",".join(names + ['le="{}"'.format(_format_value(bound))])
+            lines.append("{}_bucket{{{}}} {}".format(name, le, cumulative))
+        lines.append("{}_sum{} {}".format(name, labels, repr(total)))
+        lines.append("{}_count{} {}".format(name, labels, cumulative))
+        return lines
+
+
+class Histogram(_Metric):
+
+    """
+    Distribution of observed values, such as the latency of the requests.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class TimedLock:
+
+    """
+    Lock that observes the time spent waiting to acquire the lock. The lock is used in the
+    same manner as `threading.Lock`.
+    """
+
+    def __init__(self, name, histogram=None):
+        """
+        :param name: Name of the lock, the label of the histogram
+        :param histogram: Histogram of the wait times, defaults to `LOCK_WAIT_SECONDS`
+        """
+        self._lock = Lock()
+        self._wait = (histogram or LOCK_WAIT_SECONDS).labels(name)
+
+    def acquire(self, blocking=True, timeout=-1):
+        # the wait is only measured when the lock is not free
+        if self._lock.acquire(False):
+            self._wait.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        self._wait.observe(perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+REQUEST_SECONDS = Histogram(
+    "nautical_request_duration_seconds", "Time spent handling a request.", ["endpoint"]
+)
+RESPONSES = Counter(
+    "nautical_responses_total", "Number of responses.", ["endpoint", "code"]
+)
+PULL_SECONDS = Histogram(
+    "nautical_pull_duration_seconds", "Time spent pulling the sources and buoys.", ["stage"]
+)
+FETCH_SECONDS = Histogram(
+    "nautical_fetch_duration_seconds", "Time spent retrieving a buoy from NOAA."
+)
+FETCH_FAILURES = Counter(
+    "nautical_fetch_failures_total", "Number of buoys that could not be retrieved from NOAA."
+)
+FETCH_RETRIES = Counter(
+    "nautical_fetch_retries_total", "Number of times a buoy was retrieved again after a transient error."
+)
+CACHE_REQUESTS = Counter(
+    "nautical_cache_requests_total", "Number of buoy readings requested by result (hit, stale, miss, error, not_found).",
+    ["result"]
+)
+CACHE_EVICTIONS = Counter(
+    "nautical_cache_evictions_total", "Number of buoy readings evicted from the cache by reason (size, expired).",
+    ["reason"]
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "nautical_lock_wait_seconds", "Time spent waiting to acquire a lock.", ["lock"], buckets=LOCK_BUCKETS
+)
+CACHE_BUOYS = Gauge(
+    "nautical_cache_buoys", "Number of buoys by the state of their reading (fresh, stale, missing).", ["state"]
+)
+CACHE_AGE_SECONDS = Gauge(
+    "nautical_cache_age_seconds", "Age of the readings in the cache (oldest, mean).", ["stat"]
+)
+FETCHES_IN_FLIGHT = Gauge(
+    "nautical_fetches_in_flight", "Number of buoys that are being retrieved from NOAA."
+)
+CACHE_BYTES = Gauge(
+    "nautical_cache_bytes", "Number of bytes used by the cached buoy readings (estimated)."
+)
+BREAKERS = Gauge(
+    "nautical_breakers", "Number of buoys that failed to be retrieved by the state of their breaker.", ["state"]
+)
+HISTORY_BYTES = Gauge(
+    "nautical_history_bytes", "Number of bytes used by the history of the readings."
+)
+STARTUP_SECONDS = Gauge(
+    "nautical_startup_seconds", "Seconds from the start of the process until the data was ready and until the first response.",
+    ["stage"]
+)
+COMPRESSION_BYTES_SAVED = Gauge(
+    "nautical_compression_bytes_saved", "Number of bytes saved by compressing the responses.", ["encoding"]
+)
@@ -1,12 +1,142 @@
-from flask_restful import Resource
+from flask import Response, request, send_file
+from flask_restful import Resource, abort
 from .connector import NauticalDatabase, jsonify_buoy_data
+from .responses import BodyCache, EncodedBody, Payload, cached_payload, compression_stats
+from .serializer import buoy_fields, dumps, encode_buoy, encode_object
+from .history import NUMERIC_FIELDS
+from .table import OPERATORS
+from .events import Subscriber, stream
+from .breaker import CLOSED, OPEN, HALF_OPEN
+from .columnar import MIMETYPE as SNAPSHOT_MIMETYPE
+from . import metrics
 from logging import getLogger
-from threading import Lock
-from copy import copy
+from threading import BoundedSemaphore
 
 
 log = getLogger()
 
+# Max number of encoded bodies that are kept, the least recently used bodies are removed
+MAX_CACHED_BODIES = 4096
+
+# The encoded bodies of the responses, the bodies are only created (encoded) once for
+# each version of the data. See `nautical_api.responses`.
+_bodies = BodyCache(MAX_CACHED_BODIES)
+
+# Max number of buoys in a single batch request
+MAX_BATCH_SIZE = 500
+# Max number of seconds a batch request waits on buoys that are not cached
+BATCH_TIMEOUT = 10.0
+# Default and max number of buoys returned by a nearest buoy request
+NEAR_LIMIT = 10
+MAX_NEAR_LIMIT = 500
+# Default radius (kilometers) of a nearest buoy request
+NEAR_RADIUS_KM = 100.0
+# Max number of event streams open at a time, each stream holds a thread of the server
+MAX_EVENT_STREAMS = 8
+# Slots of the open event streams. Flask-RESTful creates a resource for each request, the
+# slots are shared by all requests.
+_event_streams = BoundedSemaphore(MAX_EVENT_STREAMS)
+# Number of times the latest snapshot file is looked up when the file was removed before it was sent
+SNAPSHOT_ATTEMPTS = 3
+# Default number of buoys in the schedule response
+SCHEDULE_LIMIT = 100
+# Number of characters of the export that are sent at once
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _number_arg(name, low, high, default=None, cast=float):
+    """
+    Get a numeric query parameter of the current request.
+
+    :param name: Name of the parameter
+    :param low: Min value of the parameter
+    :param high: Max value of the parameter
+    :param default: Value when the parameter is not provided, the parameter is required when `None`
+    :param cast: Type of the parameter
+    :return: value of the parameter
+    """
+    value = request.args.get(name)
+    if value is None:
+        if default is None:
+            abort(400, message="{} is required".format(name))
+        return default
+    try:
+        value = cast(value)
+    except ValueError:
+        abort(400, message="{} must be a number".format(name))
+    if value != value or not low <= value <= high:
+        abort(400, message="{} must be between {} and {}".format(name, low, high))
+    return value
+
+
+class BuoyBody(EncodedBody):
+
+    """
+    Body of the information for a single buoy. The information is encoded once and
+    shared by the responses for the buoy and the batch responses, see `nautical_api.serializer`.
+    """
+
+    def __init__(self, buoy_id, reading):
+        """
+        :param buoy_id: ID of the buoy
+        :param reading: Reading for the buoy
+        """
+        super().__init__({buoy_id: buoy_fields(reading.data)}, reading.version)
+        self.buoy_id = buoy_id
+        self._reading = reading
+        self._fragment = None
+
+    def fragment(self):
+        """
+        :return: JSON text of the buoy information
+        """
+        if self._fragment is None:
+            self._fragment = encode_buoy(self._reading.data)
+        return self._fragment
+
+    def text(self, settings):
+        if settings:
+            return super().text(settings)
+        return encode_object([(self.buoy_id, self.fragment())])
+
+
+class BatchBody(EncodedBody):
+
+    """
+    Body of a batch response, the body is only used for a single response. The buoy
+    information is joined from the encoded information of each buoy.
+    """
+
+    def __init__(self, bodies, errors):
+        """
+        :param bodies: List of the BuoyBody for each buoy
+        :param errors: dictionary of buoy IDs mapped to the reason they could not be provided
+        """
+        super().__init__({
+            "buoys": {body.buoy_id: body.data[body.buoy_id] for body in bodies},
+            "errors": errors
+        }, None)
+        self._bodies = bodies
+
+    def text(self, settings):
+        if settings:
+            return super().text(settings)
+        return encode_object([
+            ("buoys", encode_object([(body.buoy_id, body.fragment()) for body in self._bodies])),
+            ("errors", dumps(self.data["errors"]))
+        ])
+
+
+def _buoy_body(buoy_id, reading):
+    """
+    Get the (cached) body of the buoy information, see `SpecificBuoyGetter`.
+
+    :param buoy_id: ID of the buoy
+    :param reading: Reading for the buoy
+    :return: BuoyBody for the version of the reading
+    """
+    return _bodies.get("buoys/{}".format(buoy_id), reading.version, lambda: BuoyBody(buoy_id, reading))
+
 
 class AllSourcesGetter(Resource):
 
@@ -24,8 +154,14 @@ class AllSourcesGetter(Resource):
                                                                      
         :return: JSON object including all sources and their endpoints
         """
-        data = NauticalDatabase().get_aliases()
-        return {"sources": [{"id": str(value), "endpoint": str(key)} for key, value in data.items()]}
+        db = NauticalDatabase()
+        snapshot = db.get_snapshot()
+
+        def _build():
+            data = snapshot.aliases
+            return {"sources": [{"id": str(value), "endpoint": str(key)} for key, value in data.items()]}
+
+        return cached_payload(_bodies, "sources", snapshot.generation, db.get_next_pull(), _build)
 
 
 class SpecificSourceGetter(Resource):
@@ -45,13 +181,21 @@ class SpecificSourceGetter(Resource):
         :param source_id: Source to retrieve the information about.
         :return: JSON object including all sources.
         """
-        data = NauticalDatabase().get_aliases()
+        db = NauticalDatabase()
+        snapshot = db.get_snapshot()
+        data = snapshot.aliases
         if source_id not in data:
             log.warning("Specific source queried, no matching data ...")
             return {source_id: []}
         else:
-            s = NauticalDatabase().get_source(data[source_id])
-            return {str(s): [str(buoy.station) for buoy in s]}
+            s = snapshot.sources[data[source_id]]
+
+            def _build():
+                return {str(s): [str(buoy.station) for buoy in s]}
+
+            return cached_payload(
+                _bodies, "sources/{}".format(source_id), snapshot.generation, db.get_next_pull(), _build
+            )
 
 class AllBuoysGetter(Resource):
 
@@ -71,8 +215,13 @@ class AllBuoysGetter(Resource):
 
         :return: JSON object including all buoy ids.
         """
-        data = NauticalDatabase().get_all_buoy_ids()
-        return {"buoys": [bid for bid in data]}
+        db = NauticalDatabase()
+        snapshot = db.get_snapshot()
+
+        def _build():
+            return {"buoys": [bid for bid in snapshot.buoys]}
+
+        return cached_payload(_bodies, "buoys", snapshot.generation, db.get_next_pull(), _build)
 
 
 class SpecificBuoyGetter(Resource):
@@ -92,11 +241,591 @@ class SpecificBuoyGetter(Resource):
         Get the IDs of all buoys that have been retrievedfrom NOAA.
 
         :param buoy_id: ID of the buoy to retrieve information about.
-        :return: JSON object with all buoy information for a buoy
+        :return: JSON object with all buoy information for a buoy. The `Age` header
+        contains the number of seconds since the information was retrieved.
         """
-        data = NauticalDatabase().get_buoy(buoy_id)
-        if data is None:
+        db = NauticalDatabase()
+        reading = db.get_buoy_reading(buoy_id)
+        if reading is None:
             return {buoy_id: {}}
+
+        headers = {"Age": str(int(reading.age))}
+        expires = db.get_next_refresh(buoy_id)
+        if reading.stale:
+            # the reading is refreshed in the background
+            headers["Warning"] = '110 - "Response is Stale"'
+            expires = 0
+
+        return cached_payload(
+            _bodies,
+            "buoys/{}".format(buoy_id),
+            reading.version,
+            expires,
+            lambda: BuoyBody(buoy_id, reading),
+            headers
+        )
+
+
+class BatchBuoyGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the information for
+    many buoys in a single request. The buoys that are not cached are retrieved
+    concurrently. The buoys that cannot be retrieved (in time) are reported as errors
+    so that a single buoy cannot hold up the entire response.
+    """
+
+    __name__ = "batch_buoys"
+
+    def get(self):
+        """
+        Get the information for the buoys in the `ids` query parameter (comma separated).
+        The optional `timeout` parameter is the max number of seconds to wait for the buoys.
+
+        :return: JSON object with the information for each buoy and the errors for each buoy
+        """
+        ids = [x for x in request.args.get("ids", "").split(",") if x]
+        return self._batch(ids, request.args.get("timeout"))
+
+    def post(self):
+        """
+        Get the information for the buoys in the `ids` list of the JSON body. The optional
+        `timeout` value is the max number of seconds to wait for the buoys.
+
+        :return: JSON object with the information for each buoy and the errors for each buoy
+        """
+        body = request.get_json(silent=True) or {}
+        ids = body.get("ids", [])
+        if not isinstance(ids, list):
+            abort(400, message="ids must be a list of buoy ids")
+        return self._batch([str(x) for x in ids], body.get("timeout"))
+
+    @staticmethod
+    def _batch(ids, timeout):
+        """
+        :param ids: IDs of the buoys
+        :param timeout: Max number of seconds to wait for the buoys, limited to `BATCH_TIMEOUT`
+        :return: JSON object with the information for each buoy and the errors for each buoy
+        """
+        if len(ids) > MAX_BATCH_SIZE:
+            abort(400, message="batch size {} exceeds the max of {}".format(len(ids), MAX_BATCH_SIZE))
+
+        try:
+            timeout = BATCH_TIMEOUT if timeout is None else min(float(timeout), BATCH_TIMEOUT)
+        except (TypeError, ValueError):
+            abort(400, message="timeout must be a number")
+
+        readings, errors = NauticalDatabase().get_buoy_readings(ids, timeout=max(0.0, timeout))
+        body = BatchBody([_buoy_body(buoy_id, reading) for buoy_id, reading in readings.items()], errors)
+        return Payload(body.data, body=body)
+
+
+
+class BuoyHistoryGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the history of a buoy.
+    The history contains the numeric information of the most recent readings of the
+    buoy, the number of readings kept is limited.
+    """
+
+    __name__ = "buoy_history"
+
+    def get(self, buoy_id):
+        """
+        Get the history of a buoy. The optional `since` parameter (seconds since the epoch)
+        limits the readings to those observed after the time. The optional `fields` parameter
+        (comma separated) limits the information included for each reading.
+
+        :param buoy_id: ID of the buoy to retrieve the history about.
+        :return: JSON object with the list of readings (oldest first) for the buoy
+        """
+        fields = None
+        if request.args.get("fields"):
+            fields = [x for x in request.args["fields"].split(",") if x]
+            unknown = [x for x in fields if x not in NUMERIC_FIELDS]
+            if unknown:
+                abort(400, message="unknown fields: {}".format(", ".join(unknown)))
+
+        since = request.args.get("since")
+        try:
+            since = float(since) if since is not None else None
+        except ValueError:
+            abort(400, message="since must be the number of seconds since the epoch")
+
+        history = NauticalDatabase().get_buoy_history(buoy_id, since, fields)
+        return {buoy_id: history or []}
+
+
+class BuoyQueryGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the buoys whose current
+    information matches a set of filters, such as `wvht_gt=3`. The filters are evaluated
+    for all buoys at once, see `nautical_api.table`.
+    """
+
+    __name__ = "buoy_query"
+
+    def get(self):
+        """
+        Get the buoys that match all filters. Each filter is a query parameter in the form
+        `<field>_<operator>=<value>` where the operator is one of gt, ge, lt, le, eq or ne. The
+        optional `fields` parameter (comma separated) sets the information included for each buoy.
+
+        :return: JSON object with the matching buoys and their information
+        """
+        predicates = []
+        fields = None
+        for key, value in request.args.items():
+            if key == "fields":
+                fields = [x for x in value.split(",") if x]
+                continue
+
+            field, _, op = key.rpartition("_")
+            if field not in NUMERIC_FIELDS or op not in OPERATORS:
+                abort(400, message="invalid filter: {}".format(key))
+            try:
+                predicates.append((field, op, float(value)))
+            except ValueError:
+                abort(400, message="invalid value for {}: {}".format(key, value))
+
+        if fields is not None:
+            unknown = [x for x in fields if x not in NUMERIC_FIELDS]
+            if unknown:
+                abort(400, message="unknown fields: {}".format(", ".join(unknown)))
+
+        if not predicates:
+            abort(400, message="at least one filter is required")
+
+        return {"buoys": NauticalDatabase().query_buoys(predicates, fields)}
+
+
+class NearBuoysGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the buoys closest to
+    a location, see `nautical_api.spatial`.
+    """
+
+    __name__ = "near_buoys"
+
+    def get(self):
+        """
+        Get the buoys within `radius_km` (default 100) kilometers of the location `lat`, `lon`.
+        The closest buoy is first, at most `limit` (default 10) buoys are returned.
+
+        :return: JSON object with the list of buoys, their location and distance (kilometers)
+        """
+        lat = _number_arg("lat", -90.0, 90.0)
+        lon = _number_arg("lon", -180.0, 180.0)
+        radius_km = _number_arg("radius_km", 0.0, 20016.0, NEAR_RADIUS_KM)
+        limit = _number_arg("limit", 1, MAX_NEAR_LIMIT, NEAR_LIMIT, int)
+
+        buoys = NauticalDatabase().get_buoys_near(lat, lon, radius_km, limit)
+        return {"buoys": [
+            {"id": station, "latitude": b_lat, "longitude": b_lon, "distance_km": round(distance, 3)}
+            for station, b_lat, b_lon, distance in buoys
+        ]}
+
+
+class BoundingBoxBuoysGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the buoys inside a
+    bounding box, see `nautical_api.spatial`.
+    """
+
+    __name__ = "bbox_buoys"
+
+    def get(self):
+        """
+        Get the buoys inside the box from `min_lat`, `min_lon` to `max_lat`, `max_lon`. The
+        box crosses the antimeridian when `min_lon` is greater than `max_lon`.
+
+        :return: JSON object with the list of buoys and their location
+        """
+        min_lat = _number_arg("min_lat", -90.0, 90.0)
+        min_lon = _number_arg("min_lon", -180.0, 180.0)
+        max_lat = _number_arg("max_lat", -90.0, 90.0)
+        max_lon = _number_arg("max_lon", -180.0, 180.0)
+        if min_lat > max_lat:
+            abort(400, message="min_lat must not be greater than max_lat")
+
+        buoys = NauticalDatabase().get_buoys_in_bbox(min_lat, min_lon, max_lat, max_lon)
+        return {"buoys": [
+            {"id": station, "latitude": lat, "longitude": lon} for station, lat, lon in buoys
+        ]}
+
+
+class EventStreamGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET a stream (Server-Sent Events)
+    of the updates, see `nautical_api.events`. A `pull` event is sent when the sources are
+    pulled and a `reading` event is sent when the information of a buoy changes.
+    """
+
+    __name__ = "events"
+
+    def get(self):
+        """
+        Open a stream of the updates. The optional `buoys` (comma separated IDs) and `sources`
+        (comma separated endpoints) parameters limit the reading events to those buoys, the
+        buoys of the sources are found when the stream is opened.
+
+        :return: Response streaming the events
+        """
+        db = NauticalDatabase()
+        buoys = None
+        if request.args.get("buoys") or request.args.get("sources"):
+            buoys = set(x for x in request.args.get("buoys", "").split(",") if x)
+
+            snapshot = db.get_snapshot()
+            for source_id in [x for x in request.args.get("sources", "").split(",") if x]:
+                if source_id not in snapshot.aliases:
+                    abort(400, message="unknown source: {}".format(source_id))
+                buoys.update(str(buoy.station) for buoy in snapshot.sources[snapshot.aliases[source_id]])
+
+        if not _event_streams.acquire(blocking=False):
+            abort(503, message="too many event streams")
+
+        try:
+            resp = Response(stream(Subscriber(buoys), db.subscribe, db.unsubscribe), mimetype="text/event-stream")
+            resp.headers["Cache-Control"] = "no-cache"
+            resp.headers["X-Accel-Buffering"] = "no"
+            resp.call_on_close(_event_streams.release)
+        except BaseException:
+            _event_streams.release()
+            raise
+        return resp
+
+
+class ChangesGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the sources and buoys that
+    changed after a generation, so a client can keep a copy of the data in sync with a
+    single request, see `nautical_api.changes`.
+    """
+
+    __name__ = "changes"
+
+    def get(self):
+        """
+        Get the changes after the `since` generation (the `generation` of the previous response).
+        Without `since`, or when `reset` is set in the response, everything is returned and
+        the client must discard the data it has.
+
+        :return: JSON object with the generation, the changed sources and buoys and the
+        removed sources and buoys
+        """
+        since = request.args.get("since")
+        try:
+            since = int(since) if since is not None else None
+        except ValueError:
+            abort(400, message="since must be a generation returned by this endpoint")
+
+        changes = NauticalDatabase().get_changes(since)
+        changes["buoys"] = {
+            buoy_id: jsonify_buoy_data(reading.data) if reading is not None else None
+            for buoy_id, reading in changes["buoys"].items()
+        }
+        return changes
+
+
+def export_lines(readings, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generator of the newline delimited JSON of the readings, see `BuoyExportGetter`. The
+    lines are joined into chunks of about `chunk_size` characters, the first line is sent
+    on its own so the response starts immediately.
+
+    :param readings: Iterable of tuples (buoy ID, Reading or None)
+    :param chunk_size: Number of characters that are sent at once
+    :return: Generator of the chunks (strings)
+    """
+    chunk = []
+    size = 0
+    first = True
+    for buoy_id, reading in readings:
+        if reading is None:
+            items = [("id", dumps(buoy_id)), ("fetched", "null"), ("stale", "false"), ("data", "null")]
         else:
-            return {buoy_id: jsonify_buoy_data(data)}
+            items = [
+                ("id", dumps(buoy_id)),
+                ("fetched", dumps(reading.fetched)),
+                ("stale", "true" if reading.stale else "false"),
+                ("data", encode_buoy(reading.data))
+            ]
+        line = encode_object(items) + "\n"
+        chunk.append(line)
+        size += len(line)
+
+        if first or size >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+            first = False
+
+    if chunk:
+        yield "".join(chunk)
+
+
+class BuoyExportGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the current information of
+    all buoys as newline delimited JSON (one buoy for each line). The response is streamed,
+    the buoys are not retrieved from NOAA.
+    """
+
+    __name__ = "export"
+
+    def get(self):
+        """
+        Export the current information of the buoys. The optional `sources` parameter (comma
+        separated endpoints) limits the export to the buoys of those sources.
+
+        :return: Response streaming a JSON object for each buoy with its `id`, the time its
+        information was retrieved (`fetched`), `stale` and its `data` (null when the buoy has
+        not been retrieved)
+        """
+        db = NauticalDatabase()
+        sources = None
+        if request.args.get("sources"):
+            aliases = db.get_aliases()
+            sources = []
+            for source_id in [x for x in request.args["sources"].split(",") if x]:
+                if source_id not in aliases:
+                    abort(400, message="unknown source: {}".format(source_id))
+                sources.append(aliases[source_id])
+
+        resp = Response(export_lines(db.iter_readings(sources)), mimetype="application/x-ndjson")
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
+
+
+class SnapshotFileGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the latest columnar snapshot
+    file (Arrow IPC) of the sources and the current information of the buoys, see
+    `nautical_api.columnar`.
+    """
+
+    __name__ = "snapshot"
+
+    def get(self):
+        """
+        :return: Response with the latest snapshot file, conditional and range requests are supported
+        """
+        # the file can be removed (a newer file was written) before it is opened, the
+        # newer file is served instead
+        for _ in range(SNAPSHOT_ATTEMPTS):
+            path = NauticalDatabase().get_snapshot_file()
+            if path is None:
+                abort(404, message="no snapshot file, the files are disabled or not written yet")
+
+            try:
+                resp = send_file(path, mimetype=SNAPSHOT_MIMETYPE, conditional=True)
+            except FileNotFoundError:
+                continue
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+
+        abort(404, message="the snapshot file was removed, retry the request")
+
+
+class ScheduleGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the upcoming refreshes
+    of the buoys, see `nautical_api.scheduler`.
+    """
+
+    __name__ = "schedule"
+
+    def get(self):
+        """
+        Get the time of the next pull of the sources and the next refresh of each buoy, the
+        soonest first. The `limit` parameter is the max number of buoys (default 100), the
+        optional `buoys` parameter (comma separated IDs) limits the schedule to those buoys.
+
+        :return: JSON object with the next pull and the schedule of the buoys, including the
+        learned interval (seconds) between observations and the consecutive refreshes without
+        a new observation (`misses`)
+        """
+        db = NauticalDatabase()
+        buoys = set(x for x in request.args.get("buoys", "").split(",") if x)
+        limit = _number_arg("limit", 1, 100000, SCHEDULE_LIMIT, int)
+
+        entries = db.get_schedule()
+        if buoys:
+            entries = [x for x in entries if x.station in buoys]
+
+        return {
+            "next_pull": db.get_next_pull(),
+            "buoys": [{
+                "id": x.station,
+                "due": x.due,
+                "interval": x.interval,
+                "observed": x.observed,
+                "misses": x.misses
+            } for x in entries[:limit]]
+        }
+
+
+class BreakersGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the buoys that failed
+    to be retrieved and the state of their circuit breaker, see `nautical_api.breaker`.
+    """
+
+    __name__ = "breakers"
+
+    def get(self):
+        """
+        Get the buoys that failed to be retrieved. A `closed` breaker has failed recently (the
+        failure is cached until `retry_at`), an `open` breaker is not retried until `retry_at` and
+        a `half_open` breaker is retrying. The optional `state` parameter limits the buoys to a state.
+
+        :return: JSON object with the number of buoys in each state and the list of buoys
+        """
+        state = request.args.get("state")
+        if state is not None and state not in (CLOSED, OPEN, HALF_OPEN):
+            abort(400, message="state must be one of {}, {}, {}".format(CLOSED, OPEN, HALF_OPEN))
+
+        breakers = NauticalDatabase().get_breakers()
+        counts = {x: 0 for x in (CLOSED, OPEN, HALF_OPEN)}
+        for breaker in breakers:
+            counts[breaker.state] += 1
+
+        return {
+            "counts": counts,
+            "buoys": [{
+                "id": x.station,
+                "state": x.state,
+                "failures": x.failures,
+                "trips": x.trips,
+                "retry_at": x.retry_at,
+                "error": x.error
+            } for x in breakers if state is None or x.state == state]
+        }
+
+
+class HotSetGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the most frequently
+    requested buoys (the hot set), see `nautical_api.frequency`.
+    """
+
+    __name__ = "hotset"
+
+    def get(self):
+        """
+        Get the hot set, the `limit` parameter is the size of the hot set (defaults to the
+        size used by the database) so the coverage of other sizes can be compared.
+
+        :return: JSON object with the size of the hot set, the share of the requests for the
+        buoys of the hot set (`coverage`), the share of those requests served from memory
+        (`hit_rate`) and the buoys with their decayed number of requests and hit rate
+        """
+        db = NauticalDatabase()
+        limit = request.args.get("limit")
+        if limit is not None:
+            limit = _number_arg("limit", 0, 100000, cast=int)
+
+        stats = db.get_hot_set(limit)
+        stats["buoys"] = [
+            {"id": buoy_id, "score": score, "hit_rate": hit_rate} for buoy_id, score, hit_rate in stats.pop("keys")
+        ]
+        return stats
+
+
+class HealthGetter(Resource):
+
+    """
+    The class implements the liveness check of the application. The application is
+    alive as soon as it accepts requests, before the data is ready.
+    """
+
+    __name__ = "health"
+
+    def get(self):
+        """
+        :return: JSON object with the status of the application
+        """
+        return {"status": "ok"}
+
+
+class ReadyGetter(Resource):
+
+    """
+    The class implements the readiness check of the application. The application is
+    ready once the first snapshot of the sources was pulled or loaded from the store.
+    """
+
+    __name__ = "ready"
+
+    def get(self):
+        """
+        :return: JSON object with `ready`, the `origin` of the first snapshot (pull or store),
+        the `seconds` from the start until it was loaded and the current `generation`. The
+        status is 503 until the application is ready.
+        """
+        readiness = NauticalDatabase().get_readiness()
+        return readiness, 200 if readiness["ready"] else 503
+
+
+class CompressionStatsGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the compression
+    statistics of the responses, see `nautical_api.responses.CompressionStats`.
+    """
+
+    __name__ = "compression_stats"
+
+    def get(self):
+        """
+        Get the number of bodies compressed, the time spent compressing, the compression
+        ratio, the number of compressed responses and the bytes saved for each encoding.
+
+        :return: JSON object with the statistics for each encoding
+        """
+        return {"encodings": compression_stats.to_json()}
+
+
+class MetricsGetter(Resource):
+
+    """
+    The class implements the ability or resource that will GET the metrics of the
+    application in the Prometheus text format, see `nautical_api.metrics`.
+    """
+
+    __name__ = "metrics"
+
+    def get(self):
+        """
+        Get the metrics, the gauges of the cache are set before the metrics are rendered.
+
+        :return: Response with the metrics in the Prometheus text format
+        """
+        stats = NauticalDatabase().get_cache_stats()
+        for state in ("fresh", "stale", "missing"):
+            metrics.CACHE_BUOYS.labels(state).set(stats[state])
+        for stat in ("oldest", "mean"):
+            metrics.CACHE_AGE_SECONDS.labels(stat).set(stats[stat])
+        metrics.FETCHES_IN_FLIGHT.set(stats["inflight"])
+        metrics.HISTORY_BYTES.set(stats["history_bytes"])
+        metrics.CACHE_BYTES.set(stats["cache_bytes"])
+        states = [x.state for x in NauticalDatabase().get_breakers()]
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            metrics.BREAKERS.labels(state).set(states.count(state))
+        for encoding, values in compression_stats.to_json().items():
+            metrics.COMPRESSION_BYTES_SAVED.labels(encoding).set(values["bytes_saved"])
 
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
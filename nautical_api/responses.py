@@ -0,0 +1,411 @@
+from collections import OrderedDict
+from flask import current_app, has_app_context, has_request_context, make_response, request
+from gzip import GzipFile
+from hashlib import blake2b
+from io import BytesIO
+from threading import Lock
+from time import perf_counter, time
+from .serializer import dumps
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies smaller than this (bytes) are not compressed
+MIN_COMPRESS_SIZE = 512
+
+
+def gzip_compress(data, compresslevel):
+    """
+    Compress the data without the time in the header, the same data always results in
+    the same bytes. `gzip.compress` only accepts `mtime` on python 3.8+.
+
+    :param data: bytes to compress
+    :param compresslevel: Level of the compression (1-9)
+    :return: compressed bytes
+    """
+    buffer = BytesIO()
+    with GzipFile(fileobj=buffer, mode="wb", compresslevel=compresslevel, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def _compressors(level):
+    """
+    :param level: `cached` for bodies that are compressed once and kept, `dynamic` for
+    bodies compressed for a single response.
+    :return: dictionary of the available encodings mapped to their compress function,
+    the preferred encoding is first.
+    """
+    compressors = {}
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=19 if level == "cached" else 3)
+        compressors["zstd"] = compressor.compress
+    compresslevel = 9 if level == "cached" else 5
+    compressors["gzip"] = lambda data: gzip_compress(data, compresslevel)
+    return compressors
+
+
+CACHED_COMPRESSORS = _compressors("cached")
+DYNAMIC_COMPRESSORS = _compressors("dynamic")
+
+
+class CompressionStats:
+
+    """
+    Counters of the time spent compressing, the compression ratio and the bytes saved
+    for each encoding.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def _get(self, encoding):
+        return self._stats.setdefault(encoding, {
+            "compressed": 0, "compress_seconds": 0.0, "raw_bytes": 0, "compressed_bytes": 0,
+            "responses": 0, "bytes_saved": 0
+        })
+
+    def compressed(self, encoding, raw, compressed, seconds):
+        """
+        Record a body that was compressed.
+
+        :param encoding: Name of the encoding
+        :param raw: Size (bytes) of the body
+        :param compressed: Size (bytes) of the compressed body
+        :param seconds: Time spent compressing the body
+        """
+        with self._lock:
+            stats = self._get(encoding)
+            stats["compressed"] += 1
+            stats["compress_seconds"] += seconds
+            stats["raw_bytes"] += raw
+            stats["compressed_bytes"] += compressed
+
+    def served(self, encoding, raw, sent):
+        """
+        Record a response that was sent compressed.
+
+        :param encoding: Name of the encoding
+        :param raw: Size (bytes) of the body
+        :param sent: Size (bytes) of the body that was sent
+        """
+        with self._lock:
+            stats = self._get(encoding)
+            stats["responses"] += 1
+            stats["bytes_saved"] += raw - sent
+
+    def to_json(self):
+        """
+        :return: dictionary of the encodings mapped to their counters and compression ratio
+        """
+        with self._lock:
+            output = {}
+            for encoding, stats in self._stats.items():
+                output[encoding] = dict(stats)
+                output[encoding]["ratio"] = (
+                    stats["raw_bytes"] / stats["compressed_bytes"] if stats["compressed_bytes"] else None
+                )
+            return output
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+compression_stats = CompressionStats()
+
+
+def compress(encoding, data, compressors=DYNAMIC_COMPRESSORS):
+    """
+    Compress the data and record the compression in `compression_stats`.
+
+    :param encoding: Name of the encoding
+    :param data: Bytes to compress
+    :param compressors: Compress functions of the encodings
+    :return: compressed bytes
+    """
+    start = perf_counter()
+    output = compressors[encoding](data)
+    compression_stats.compressed(encoding, len(data), len(output), perf_counter() - start)
+    return output
+
+
+def choose_encoding():
+    """
+    Choose the encoding of the response from the Accept-Encoding header of the current request.
+
+    :return: Name of the encoding, None when the response should not be compressed
+    """
+    if not has_request_context():
+        return None
+    accepted = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in DYNAMIC_COMPRESSORS:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _json_settings():
+    """
+    :return: Arguments of `json.dumps` set for the application, in the same manner as `flask_restful`.
+    The default settings outside of an application (resources called directly).
+    """
+    if not has_app_context():
+        return {}
+    settings = current_app.config.get('RESTFUL_JSON', {})
+    if current_app.debug:
+        settings.setdefault('indent', 4)
+    return settings
+
+
+class EncodedBody:
+
+    """
+    JSON body that is encoded once and shared by all responses for the same
+    version of the data.
+    """
+
+    def __init__(self, data, version):
+        """
+        :param data: JSON body of the response
+        :param version: Version of the data that the body was created from
+        """
+        self.data = data
+        self.version = version
+        self._encoded = None
+        self._digest = None
+        self._compressed = {}
+
+    def text(self, settings):
+        """
+        :param settings: Arguments of `json.dumps` set for the application
+        :return: JSON text of the body
+        """
+        return dumps(self.data, **settings)
+
+    def encoded(self):
+        """
+        Encode the body in the same manner as `flask_restful`. The body is only
+        encoded the first time, the encoded bytes are returned after that.
+
+        :return: Encoded body
+        """
+        if self._encoded is None:
+            self._encoded = (self.text(_json_settings()) + "\n").encode("utf-8")
+        return self._encoded
+
+    def digest(self):
+        """
+        Hash of the encoded body, the hash is the same in every process (and after a
+        restart) for the same body.
+
+        :return: hex digest of the encoded body
+        """
+        if self._digest is None:
+            self._digest = blake2b(self.encoded(), digest_size=12).hexdigest()
+        return self._digest
+
+    def compressed(self, encoding):
+        """
+        Compress the encoded body. The body is only compressed the first time for each
+        encoding, the compressed bytes are returned after that.
+
+        :param encoding: Name of the encoding, see `choose_encoding`
+        :return: Compressed body
+        """
+        body = self._compressed.get(encoding)
+        if body is None:
+            body = self._compressed[encoding] = compress(encoding, self.encoded(), CACHED_COMPRESSORS)
+        return body
+
+
+class BodyCache:
+
+    """
+    Keep the encoded body for each key (endpoint), the body is replaced when the
+    version of the data changes. When the cache is full, the least recently used body
+    is removed.
+    """
+
+    def __init__(self, max_entries=None):
+        """
+        :param max_entries: Max number of bodies, unlimited when `None`
+        """
+        self._bodies = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get(self, key, version, build):
+        """
+        Get the body for a key and version of the data.
+
+        :param key: Unique key for the body, generally the endpoint
+        :param version: Version of the data
+        :param build: Function in the form of `build()` that creates the JSON body
+        (or the EncodedBody) on a cache miss.
+        :return: EncodedBody
+        """
+        body = self._bodies.get(key)
+        if body is None or body.version != version:
+            body = build()
+            if not isinstance(body, EncodedBody):
+                body = EncodedBody(body, version)
+            with self._lock:
+                self._bodies[key] = body
+                self._bodies.move_to_end(key)
+                if self._max_entries is not None:
+                    while len(self._bodies) > self._max_entries:
+                        self._bodies.popitem(last=False)
+        elif self._max_entries is not None:
+            with self._lock:
+                if key in self._bodies:
+                    self._bodies.move_to_end(key)
+        return body
+
+    def clear(self):
+        """
+        Remove all bodies from the cache.
+        """
+        with self._lock:
+            self._bodies.clear()
+
+
+def etag(body):
+    """
+    Create a strong ETag for a body. The ETag is created from the content of the body, so
+    every worker process returns the same ETag for the same body.
+
+    :param body: EncodedBody
+    :return: quoted ETag
+    """
+    return '"{}"'.format(body.digest())
+
+
+def cache_headers(tag, expires):
+    """
+    :param tag: Quoted ETag of the body
+    :param expires: Seconds since the epoch when the data is expected to change
+    :return: Dictionary of the ETag and Cache-Control headers
+    """
+    return {
+        "ETag": tag,
+        "Cache-Control": "max-age={}".format(max(0, int(expires - time())))
+    }
+
+
+def not_modified(tag, headers):
+    """
+    Check the If-None-Match header of the current request against the ETag.
+
+    :param tag: Quoted ETag of the body
+    :param headers: Headers added to the response
+    :return: 304 response when the client has the current body, otherwise None
+    """
+    if not has_request_context():
+        return None
+    value = tag.strip('"')
+    # compressed responses have a separate ETag for each encoding, see `output_json`
+    if any(request.if_none_match.contains_weak(x) for x in
+           [value] + ["{}-{}".format(value, encoding) for encoding in DYNAMIC_COMPRESSORS]):
+        resp = make_response("", 304)
+        resp.headers.extend(headers)
+        resp.vary.add("Accept-Encoding")
+        return resp
+    return None
+
+
+class Payload(dict):
+
+    """
+    JSON body of a response along with the headers that should be added to the
+    response. The payload is a dictionary, so resources that return a payload
+    are used in the same manner as resources that return a dictionary.
+    """
+
+    def __init__(self, data, headers=None, body=None):
+        """
+        :param data: JSON body of the response
+        :param headers: Dictionary of headers added to the response
+        :param body: EncodedBody of the data, when provided the encoded body is
+        used instead of encoding the data.
+        """
+        super().__init__(data)
+        self.headers = headers or {}
+        self.body = body
+
+
+def compress_response(resp, body=None):
+    """
+    Compress the body of the response with the encoding accepted by the client. The bodies
+    of cached responses are compressed once, other bodies are compressed for each response.
+
+    :param resp: Flask response
+    :param body: EncodedBody of the response, when the body is cached
+    :return: the response
+    """
+    resp.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    raw = resp.get_data()
+    if encoding is None or len(raw) < MIN_COMPRESS_SIZE or "Content-Encoding" in resp.headers:
+        return resp
+
+    compressed = body.compressed(encoding) if body is not None else compress(encoding, raw)
+    resp.set_data(compressed)
+    resp.headers["Content-Encoding"] = encoding
+    if resp.headers.get("ETag"):
+        resp.headers["ETag"] = '{}-{}"'.format(resp.headers["ETag"][:-1], encoding)
+    compression_stats.served(encoding, len(raw), len(compressed))
+    return resp
+
+
+def output_json(data, code, headers=None):
+    """
+    Make a Flask response with a JSON encoded body. When the data is a `Payload`
+    the headers of the payload are added to the response. The body is compressed
+    when the client accepts a compressed body, see `compress_response`.
+    """
+    if isinstance(data, Payload):
+        headers = dict(data.headers, **(headers or {}))
+        if data.body is not None:
+            resp = make_response(data.body.encoded(), code)
+            resp.headers.extend(headers)
+            # bodies without a version are only used for this response
+            return compress_response(resp, data.body if data.body.version is not None else None)
+
+    resp = make_response(dumps(data, **_json_settings()) + "\n", code)
+    resp.headers.extend(headers or {})
+    return compress_response(resp)
+
+
+def cached_payload(cache, key, version, expires, build, headers=None):
+    """
+    Convenience function to get the response for an endpoint whose body only changes when
+    the version of the data changes. See `BodyCache`, `cache_headers` and `not_modified`.
+    The versions are only used to find the cached body, the ETag is the hash of the body.
+
+    :param cache: BodyCache for the endpoint
+    :param key: Unique key for the body, generally the endpoint
+    :param version: Version of the data
+    :param expires: Seconds since the epoch when the data is expected to change
+    :param build: Function in the form of `build()` that creates the JSON body
+    :param headers: Additional headers added to the response
+    :return: 304 response when the client has the current body, otherwise a Payload
+    """
+    body = cache.get(key, version, build)
+    tag = etag(body)
+    response_headers = cache_headers(tag, expires)
+    response_headers.update(headers or {})
+
+    resp = not_modified(tag, response_headers)
+    if resp is not None:
+        return resp
+    return Payload(body.data, response_headers, body)
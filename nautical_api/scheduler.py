@@ -0,0 +1,241 @@
+"""
+Adaptive refresh schedule of the buoys. Each station reports on its own cadence, some
+report every 10 minutes, most report hourly and others go silent for days. The cadence
+of each station is learned from the time of its observations (an exponentially weighted
+moving average of the time between new observations) and the station is refreshed shortly
+after its next report is expected to be published.
+
+When a refresh does not return a new observation (or fails) the station is retried with
+an exponential backoff, stations that stop reporting are checked less and less often.
+A random jitter is added to each refresh so that the stations reporting at the same time
+are not all refreshed at once.
+"""
+from heapq import heappush, heappop
+from random import Random
+from threading import Lock
+from time import time
+from typing import NamedTuple
+
+
+# Cadence (seconds) assumed for a station until the cadence is learned
+DEFAULT_INTERVAL = 60 * 60
+# Bounds of the learned cadence (seconds)
+MIN_INTERVAL = 5 * 60
+MAX_INTERVAL = 24 * 60 * 60
+# Seconds between an observation and its publication by NOAA
+PUBLISH_DELAY = 5 * 60
+# Seconds before the first retry when the expected observation was not published
+RETRY_DELAY = 5 * 60
+# Max seconds between the retries of a station
+MAX_BACKOFF = 24 * 60 * 60
+# Weight of the newest interval in the moving average of the cadence
+ALPHA = 0.3
+# Fraction of the delay added (at random) to each refresh, and the max jitter (seconds)
+JITTER = 0.1
+MAX_JITTER = 5 * 60
+
+
+class StationSchedule(NamedTuple):
+    """Refresh schedule of a single station.
+    """
+
+    station: str
+    due: float = None
+    interval: float = DEFAULT_INTERVAL
+    observed: int = None
+    samples: int = 0
+    misses: int = 0
+
+
+class RefreshScheduler:
+
+    """
+    Schedule of the next refresh for each station. The stations are added to the schedule
+    once they have been retrieved, see `observed` and `failed`. The stations that are due
+    are taken from the schedule (`due`) and added back when the result of the refresh arrives.
+    """
+
+    def __init__(
+        self,
+        interval=DEFAULT_INTERVAL,
+        publish_delay=PUBLISH_DELAY,
+        retry_delay=RETRY_DELAY,
+        max_backoff=MAX_BACKOFF,
+        jitter=JITTER,
+        seed=None
+    ):
+        """
+        :param interval: Cadence (seconds) assumed for a station until the cadence is learned
+        :param publish_delay: Seconds between an observation and its publication
+        :param retry_delay: Seconds before the first retry of a station without a new observation
+        :param max_backoff: Max seconds between the retries of a station
+        :param jitter: Fraction of the delay added (at random) to each refresh
+        :param seed: Seed of the random jitter
+        """
+        self._interval = float(interval)
+        self._publish_delay = float(publish_delay)
+        self._retry_delay = float(retry_delay)
+        self._max_backoff = float(max_backoff)
+        self._jitter = float(jitter)
+        self._random = Random(seed)
+
+        self._stations = {}
+        self._heap = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._stations)
+
+    def _jittered(self, now, delay):
+        """
+        :return: time of the refresh `delay` seconds after `now` plus the random jitter
+        """
+        delay = max(0.0, delay)
+        return now + delay + self._random.uniform(0.0, min(MAX_JITTER, delay * self._jitter))
+
+    def _backoff(self, misses):
+        """
+        :return: seconds before the next retry after the number of consecutive misses
+        """
+        return min(self._max_backoff, self._retry_delay * 2 ** min(misses - 1, 32))
+
+    def _set(self, state):
+        """
+        Save the schedule of the station, the station is pushed on the heap when it is due.
+        The entries of the heap that do not match the schedule of their station are skipped.
+        """
+        self._stations[state.station] = state
+        if state.due is not None:
+            heappush(self._heap, (state.due, state.station))
+
+    def observed(self, station, epoch, now=None):
+        """
+        Record the result of a refresh that returned an observation. When the observation is
+        new the cadence is updated and the station is refreshed once the next observation is
+        expected, otherwise the station is retried with a backoff.
+
+        :param station: ID of the station
+        :param epoch: Time (seconds since the epoch) of the observation, 0 or None when unknown
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: time of the next refresh
+        """
+        now = time() if now is None else now
+        with self._lock:
+            state = self._stations.get(station) or StationSchedule(station, interval=self._interval)
+
+            if not epoch or (state.observed is not None and epoch <= state.observed):
+                misses = state.misses + 1
+                state = state._replace(due=self._jittered(now, self._backoff(misses)), misses=misses)
+            else:
+                if state.observed is not None:
+                    sample = min(MAX_INTERVAL, max(MIN_INTERVAL, epoch - state.observed))
+                    interval = sample if state.samples == 0 else ALPHA * sample + (1.0 - ALPHA) * state.interval
+                    state = state._replace(interval=interval, samples=state.samples + 1)
+
+                expected = epoch + state.interval + self._publish_delay
+                if expected <= now:
+                    # the next observation should have been published already
+                    expected = now + self._retry_delay
+                state = state._replace(due=self._jittered(now, expected - now), observed=epoch, misses=0)
+
+            self._set(state)
+            return state.due
+
+    def failed(self, station, now=None):
+        """
+        Record a refresh that failed, the station is retried with a backoff.
+
+        :param station: ID of the station
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: time of the next refresh
+        """
+        now = time() if now is None else now
+        with self._lock:
+            state = self._stations.get(station) or StationSchedule(station, interval=self._interval)
+            misses = state.misses + 1
+            state = state._replace(due=self._jittered(now, self._backoff(misses)), misses=misses)
+            self._set(state)
+            return state.due
+
+    def defer(self, station, now=None):
+        """
+        Put a station that was taken by `due` back on the schedule when it was not refreshed
+        (such as a reading that was evicted), the station is due again after its interval.
+        Stations that are already scheduled are not changed.
+
+        :param station: ID of the station
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: time of the next refresh, None when the station is not in the schedule
+        """
+        now = time() if now is None else now
+        with self._lock:
+            state = self._stations.get(station)
+            if state is None or state.due is not None:
+                return state.due if state is not None else None
+            state = state._replace(due=self._jittered(now, state.interval))
+            self._set(state)
+            return state.due
+
+    def due(self, now=None):
+        """
+        Take the stations that are due. The stations stay in the schedule but they are not
+        due again until the result of their refresh is recorded (or they are deferred).
+
+        :param now: Current time (seconds since the epoch), defaults to the current time
+        :return: list of the IDs of the stations that are due, the most overdue first
+        """
+        now = time() if now is None else now
+        stations = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, station = heappop(self._heap)
+                state = self._stations.get(station)
+                if state is not None and state.due == due:
+                    self._stations[station] = state._replace(due=None)
+                    stations.append(station)
+        return stations
+
+    def next_due(self):
+        """
+        :return: time of the earliest refresh, None when no station is scheduled
+        """
+        with self._lock:
+            while self._heap:
+                due, station = self._heap[0]
+                state = self._stations.get(station)
+                if state is not None and state.due == due:
+                    return due
+                heappop(self._heap)
+        return None
+
+    def get(self, station):
+        """
+        :param station: ID of the station
+        :return: StationSchedule of the station, None when the station is not scheduled
+        """
+        return self._stations.get(station)
+
+    def retain(self, stations):
+        """
+        Remove the stations that are not in `stations` (removed by a pull).
+
+        :param stations: IDs of the stations to keep
+        """
+        stations = set(stations)
+        with self._lock:
+            for station in [x for x in self._stations if x not in stations]:
+                del self._stations[station]
+            self._heap = [entry for entry in self._heap if entry[1] in stations]
+            self._heap.sort()
+
+    def entries(self, limit=None):
+        """
+        Get the upcoming refreshes.
+
+        :param limit: Max number of entries, all entries when `None`
+        :return: list of StationSchedule sorted by the time of the next refresh, the
+        stations that are being refreshed (not due) are last
+        """
+        states = list(self._stations.values())
+        states.sort(key=lambda x: (x.due is None, x.due or 0.0, x.station))
+        return states[:limit] if limit is not None else states
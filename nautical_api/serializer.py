@@ -0,0 +1,115 @@
+"""
+Serializer of the buoy information. The fields that are set are selected from the slots
+of `BuoyData` and encoded by the backend. The text of each reading is cached by the
+resources (see `nautical_api.resources.BuoyBody`), the responses join the cached text.
+
+The default (`stdlib`) backend writes the same text as `json.dumps` with the default
+settings, so the responses are identical to the responses encoded by Flask-RESTful.
+When `orjson` is installed it can be selected as the backend, the text is then compact
+(no spaces after the separators) and NaN and infinite values are written as `null`
+(`json.dumps` writes `NaN` and `Infinity`, which are not valid JSON).
+"""
+import json
+from itertools import compress
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from nautical.noaa.buoy.buoy_data import BuoyData
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+FIELDS = tuple(BuoyData.__slots__)
+_get_fields = attrgetter(*FIELDS)
+_PRIMITIVES = (int, float, str)
+
+# Separators between the items and between the keys and values for each backend
+_SEPARATORS = {
+    "stdlib": (", ", ": "),
+    "orjson": (",", ":")
+}
+
+BACKENDS = ("stdlib", "orjson") if orjson is not None else ("stdlib", )
+_backend = "stdlib"
+
+
+def set_backend(name):
+    """
+    Set the backend used to encode the responses.
+
+    :param name: Name of the backend, see `BACKENDS`
+    :raises ValueError: when the backend is not available
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError("JSON backend {} is not available, choose from {}".format(name, ", ".join(BACKENDS)))
+    _backend = name
+
+
+def get_backend():
+    """
+    :return: Name of the backend used to encode the responses
+    """
+    return _backend
+
+
+def _values(data):
+    """
+    :return: tuple of the values of all fields, in the order of `FIELDS`
+    """
+    try:
+        return _get_fields(data)
+    except AttributeError:
+        return tuple(getattr(data, field, None) for field in FIELDS)
+
+
+def buoy_fields(data):
+    """
+    Get the fields of the buoy information that are set. Values that are not numbers
+    or strings (such as the time) are converted to strings.
+
+    :param data: nautical.noaa.buoy.BuoyData object
+    :return: dictionary of the field names mapped to their values
+    """
+    values = _values(data)
+    return {
+        field: value if isinstance(value, _PRIMITIVES) else str(value)
+        for field, value in zip(compress(FIELDS, values), compress(values, values))
+    }
+
+
+def encode_buoy(data):
+    """
+    Encode the fields of the buoy information that are set, see `buoy_fields`.
+
+    :param data: nautical.noaa.buoy.BuoyData object
+    :return: JSON text of the object
+    """
+    return dumps(buoy_fields(data))
+
+
+def encode_object(items):
+    """
+    Join encoded values into a JSON object.
+
+    :param items: Iterable of tuples (key, JSON text of the value)
+    :return: JSON text of the object
+    """
+    item_sep, key_sep = _SEPARATORS[_backend]
+    return "{" + item_sep.join(encode_basestring_ascii(str(key)) + key_sep + text for key, text in items) + "}"
+
+
+def dumps(data, **settings):
+    """
+    Encode the data with the backend. When settings are provided (such as `indent`) the
+    data is encoded with `json.dumps`.
+
+    :param data: JSON data
+    :param settings: Arguments of `json.dumps`
+    :return: JSON text
+    """
+    if not settings and _backend == "orjson":
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, **settings)
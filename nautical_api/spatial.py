@@ -0,0 +1,148 @@
+"""
+Spatial index of the buoy locations. The locations are placed in a grid of cells
+(1 degree by default) so that a lookup only measures the distance to the buoys in
+the cells that overlap the area of the lookup. Distances are great circle distances
+(haversine) in kilometers.
+"""
+from math import asin, cos, floor, radians, sin, sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+# Kilometers in one degree of latitude
+KM_PER_DEGREE = 111.195
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    :return: great circle distance (kilometers) between the two points (degrees)
+    """
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def buoy_locations(sources):
+    """
+    Get the location of each buoy in the sources. Buoys without a location are skipped,
+    buoys that are part of multiple sources are only included once.
+
+    :param sources: dictionary of source names mapped to their respective source
+    :return: tuple of (station, latitude, longitude) sorted by station
+    """
+    locations = {}
+    for source in sources.values():
+        for buoy in source.buoys.values():
+            location = buoy.location
+            if location is None or location.latitude is None or location.longitude is None:
+                continue
+            locations.setdefault(str(buoy.station), (float(location.latitude), float(location.longitude)))
+    return tuple((station, lat, lon) for station, (lat, lon) in sorted(locations.items()))
+
+
+class SpatialIndex:
+
+    """
+    Grid index of the buoy locations. The index is immutable, a new index is
+    created when the locations change.
+    """
+
+    def __init__(self, locations=(), cell_size=1.0):
+        """
+        :param locations: tuple of (station, latitude, longitude), see `buoy_locations`
+        :param cell_size: Size (degrees) of the cells of the grid
+        """
+        self.locations = tuple(locations)
+        self.cell_size = float(cell_size)
+        self._cells = {}
+        for i, (_, lat, lon) in enumerate(self.locations):
+            self._cells.setdefault(self._cell(lat, lon), []).append(i)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _cell(self, lat, lon):
+        return int(floor(lat / self.cell_size)), int(floor(lon / self.cell_size))
+
+    def _candidates(self, min_lat, max_lat, lon_ranges):
+        """
+        :param min_lat: Min latitude of the area
+        :param max_lat: Max latitude of the area
+        :param lon_ranges: List of (min longitude, max longitude) of the area, None for all longitudes
+        :return: Generator of the indices of the locations in the cells that overlap the area
+        """
+        row_lo, row_hi = int(floor(min_lat / self.cell_size)), int(floor(max_lat / self.cell_size))
+        if lon_ranges is not None:
+            cols = set()
+            for lo, hi in lon_ranges:
+                cols.update(range(int(floor(lo / self.cell_size)), int(floor(hi / self.cell_size)) + 1))
+
+            # visit the cells of the area when there are fewer of them than occupied cells
+            if (row_hi - row_lo + 1) * len(cols) < len(self._cells):
+                for row in range(row_lo, row_hi + 1):
+                    for col in cols:
+                        yield from self._cells.get((row, col), ())
+                return
+        else:
+            cols = None
+
+        for (row, col), indices in self._cells.items():
+            if row_lo <= row <= row_hi and (cols is None or col in cols):
+                yield from indices
+
+    def near(self, lat, lon, radius_km, limit=None):
+        """
+        Find the buoys within a distance of a point, the closest buoy is first.
+
+        :param lat: Latitude (degrees) of the point
+        :param lon: Longitude (degrees) of the point
+        :param radius_km: Max distance (kilometers) from the point
+        :param limit: Max number of buoys returned, all buoys when `None`
+        :return: list of (station, latitude, longitude, distance)
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        min_lat, max_lat = lat - dlat, lat + dlat
+
+        lon_ranges = None
+        if min_lat > -90 and max_lat < 90:
+            dlon = dlat / max(cos(radians(max(abs(min_lat), abs(max_lat)))), 1e-12)
+            if dlon < 180:
+                lon_ranges = _wrap(lon - dlon, lon + dlon)
+
+        output = []
+        for i in self._candidates(min_lat, max_lat, lon_ranges):
+            station, b_lat, b_lon = self.locations[i]
+            distance = haversine(lat, lon, b_lat, b_lon)
+            if distance <= radius_km:
+                output.append((station, b_lat, b_lon, distance))
+
+        output.sort(key=lambda x: (x[3], x[0]))
+        return output if limit is None else output[:limit]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Find the buoys inside a bounding box. The box crosses the antimeridian
+        when `min_lon` is greater than `max_lon`.
+
+        :return: list of (station, latitude, longitude) sorted by station
+        """
+        lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+
+        output = []
+        for i in self._candidates(min_lat, max_lat, lon_ranges):
+            station, lat, lon = self.locations[i]
+            if min_lat <= lat <= max_lat and any(lo <= lon <= hi for lo, hi in lon_ranges):
+                output.append(self.locations[i])
+
+        output.sort()
+        return output
+
+
+def _wrap(min_lon, max_lon):
+    """
+    :return: longitude ranges within [-180, 180] that cover the range from `min_lon` to `max_lon`
+    """
+    if min_lon < -180:
+        return [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return [(min_lon, max_lon)]
@@ -0,0 +1,194 @@
+"""
+Persistent (SQLite) store of the sources and the latest reading for each buoy. The
+store is written incrementally as the data arrives, and loaded when the application
+starts so that the last known data is served immediately after a restart.
+
+Each write is stamped with an increasing sequence number, so the processes that share
+the store (see `nautical_api.cluster`) only load what changed since their last load. The
+database file is memory mapped so the processes read the pages from the shared page cache.
+"""
+from nautical.noaa.buoy.buoy_data import BuoyData
+from nautical.noaa.buoy.source import Source
+from json import dumps, loads
+from logging import getLogger
+from sqlite3 import connect, Error as SQLiteError
+from threading import Lock
+from time import time
+
+
+log = getLogger()
+
+# Max number of bytes of the database file that are memory mapped
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class SnapshotStore:
+
+    """
+    SQLite store (WAL mode) that holds the sources and the latest reading for each buoy.
+    A single connection is shared by all threads, access to the connection is serialized.
+    Many processes can open the same store, a single process should write the sources
+    and readings.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to the SQLite database file, created when it does not exist
+        """
+        self.path = path
+        self._lock = Lock()
+        self._conn = connect(path, check_same_thread=False, timeout=30.0)
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA mmap_size={}".format(MMAP_SIZE))
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS readings "
+                "(station TEXT PRIMARY KEY, data TEXT NOT NULL, fetched REAL NOT NULL, "
+                "seq INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [x[1] for x in self._conn.execute("PRAGMA table_info(readings)")]
+            if "seq" not in columns:
+                # stores created before the sequence numbers
+                self._conn.execute("ALTER TABLE readings ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS readings_seq ON readings (seq)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS requests (station TEXT PRIMARY KEY, requested REAL NOT NULL)"
+            )
+
+    def _next_sequence(self):
+        """
+        Increment the sequence number, the connection must be in a transaction.
+
+        :return: the new sequence number
+        """
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('sequence', 0)")
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'sequence'")
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'sequence'").fetchone()[0]
+
+    def save_sources(self, sources):
+        """
+        Replace all sources in the store. The readings for buoys that are no longer
+        part of any source are removed.
+
+        :param sources: dictionary of source names mapped to their respective source
+        """
+        rows = [(str(name), dumps(source.to_json())) for name, source in sources.items()]
+        stations = set(str(b.station) for source in sources.values() for b in source.buoys.values())
+
+        try:
+            with self._lock, self._conn:
+                sequence = self._next_sequence()
+                self._conn.execute("DELETE FROM sources")
+                self._conn.executemany("INSERT INTO sources (name, data) VALUES (?, ?)", rows)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sources', ?)", (sequence, ))
+
+                existing = [x[0] for x in self._conn.execute("SELECT station FROM readings")]
+                self._conn.executemany(
+                    "DELETE FROM readings WHERE station = ?",
+                    [(x, ) for x in existing if x not in stations]
+                )
+        except SQLiteError as e:
+            log.error("{} failed to save sources: {}".format(self.__class__.__name__, e))
+
+    def save_reading(self, station, data, fetched):
+        """
+        Insert or replace the latest reading for a buoy.
+
+        :param station: ID of the buoy
+        :param data: nautical.noaa.buoy.BuoyData object
+        :param fetched: Seconds since the epoch when the data was fetched
+        """
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO readings (station, data, fetched, seq) VALUES (?, ?, ?, ?)",
+                    (station, dumps(data.to_json()), fetched, self._next_sequence())
+                )
+        except SQLiteError as e:
+            log.error("{} failed to save reading for {}: {}".format(self.__class__.__name__, station, e))
+
+    def load_sources(self):
+        """
+        :return: dictionary of source names mapped to their respective source
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT name, data FROM sources").fetchall()
+        return {name: Source.from_json(loads(data)) for name, data in rows}
+
+    def load_readings(self):
+        """
+        :return: dictionary of buoy IDs mapped to a tuple of the nautical.noaa.buoy.BuoyData
+        object and the seconds since the epoch when the data was fetched
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT station, data, fetched FROM readings").fetchall()
+        return {station: (BuoyData.from_json(loads(data)), fetched) for station, data, fetched in rows}
+
+    def sources_sequence(self):
+        """
+        :return: sequence number of the last time the sources were saved, 0 when the
+        sources were never saved
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'sources'").fetchone()
+        return row[0] if row is not None else 0
+
+    def load_updates(self, since=0):
+        """
+        Load the readings saved after a sequence number.
+
+        :param since: Sequence number returned by the previous call, 0 for all readings
+        :return: Tuple of the list of tuples (buoy ID, nautical.noaa.buoy.BuoyData object, seconds
+        since the epoch when the data was fetched), and the sequence number of the last reading
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT station, data, fetched, seq FROM readings WHERE seq > ? ORDER BY seq", (since, )
+            ).fetchall()
+
+        updates = [(station, BuoyData.from_json(loads(data)), fetched) for station, data, fetched, _ in rows]
+        return updates, rows[-1][3] if rows else since
+
+    def request_readings(self, stations):
+        """
+        Ask the process that writes the readings to retrieve the buoys, see `take_requests`.
+
+        :param stations: IDs of the buoys
+        """
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO requests (station, requested) VALUES (?, ?)",
+                    [(x, time()) for x in stations]
+                )
+        except SQLiteError as e:
+            log.error("{} failed to request readings: {}".format(self.__class__.__name__, e))
+
+    def take_requests(self):
+        """
+        Remove and return the requested buoys, see `request_readings`.
+
+        :return: list of the IDs of the requested buoys, the oldest request first
+        """
+        try:
+            with self._lock, self._conn:
+                rows = self._conn.execute("SELECT station, requested FROM requests ORDER BY requested").fetchall()
+                # requests made (again) after the select are kept
+                self._conn.executemany("DELETE FROM requests WHERE station = ? AND requested = ?", rows)
+        except SQLiteError as e:
+            log.error("{} failed to take requests: {}".format(self.__class__.__name__, e))
+            return []
+        return [x[0] for x in rows]
+
+    def close(self):
+        """
+        Close the connection to the store.
+        """
+        with self._lock:
+            self._conn.close()
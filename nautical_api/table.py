@@ -0,0 +1,153 @@
+"""
+Columnar table of the current reading for every buoy. Each numeric field of the
+readings is a column (typed array) with one row per buoy, missing values are NaN.
+Filters are evaluated across all buoys in a single pass. When NumPy is installed the
+columns are viewed as NumPy arrays (without copying) and the filters are vectorized.
+"""
+from array import array
+from operator import eq, ge, gt, le, lt, ne
+from threading import Lock
+from .history import NUMERIC_FIELDS, NAN, to_float
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+OPERATORS = {
+    "gt": gt,
+    "ge": ge,
+    "lt": lt,
+    "le": le,
+    "eq": eq,
+    "ne": ne
+}
+
+
+class ReadingTable:
+
+    """
+    Columnar table of the current readings, one row per buoy.
+    """
+
+    def __init__(self):
+        self._stations = []
+        self._rows = {}
+        self._columns = {field: array("d") for field in NUMERIC_FIELDS}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._stations)
+
+    def reset(self, stations):
+        """
+        Set the buoys (rows) of the table. The values of the buoys that remain in the
+        table are kept, the values of new buoys are missing (NaN).
+
+        :param stations: IDs of the buoys
+        """
+        stations = list(dict.fromkeys(stations))
+        with self._lock:
+            previous = self._rows
+            columns = {}
+            for field, column in self._columns.items():
+                # new arrays are created, views of the previous arrays may still exist
+                new = array("d", [NAN]) * len(stations)
+                for row, station in enumerate(stations):
+                    index = previous.get(station)
+                    if index is not None:
+                        new[row] = column[index]
+                columns[field] = new
+
+            self._stations = stations
+            self._rows = {station: row for row, station in enumerate(stations)}
+            self._columns = columns
+
+    def update(self, station, data):
+        """
+        Set the values of a buoy from its reading. Buoys that are not in the table are ignored.
+
+        :param station: ID of the buoy
+        :param data: nautical.noaa.buoy.BuoyData object
+        """
+        with self._lock:
+            row = self._rows.get(station)
+            if row is None:
+                return
+            for field, column in self._columns.items():
+                column[row] = to_float(getattr(data, field, None))
+
+    def clear(self, station):
+        """
+        Remove the values of a buoy (its reading was evicted), the values are missing (NaN).
+
+        :param station: ID of the buoy
+        """
+        with self._lock:
+            row = self._rows.get(station)
+            if row is None:
+                return
+            for column in self._columns.values():
+                column[row] = NAN
+
+    def columns(self):
+        """
+        Copy the columns of the table, the copies are not changed by the updates.
+
+        :return: tuple of the list of the buoy IDs (rows) and the dictionary of the fields
+        mapped to a copy of their column
+        """
+        with self._lock:
+            return list(self._stations), {field: column[:] for field, column in self._columns.items()}
+
+    def query(self, predicates, fields=None):
+        """
+        Find the buoys where all predicates are true. Missing values never match.
+
+        :param predicates: List of tuples (field, operator name, value), see `OPERATORS`
+        :param fields: Names of the fields included for the matching buoys, defaults to the
+        fields of the predicates.
+        :return: dictionary of the matching buoy IDs mapped to a dictionary of their fields
+        """
+        if fields is None:
+            fields = list(dict.fromkeys(field for field, _, _ in predicates))
+
+        with self._lock:
+            if not self._stations:
+                return {}
+
+            if numpy is not None:
+                rows = self._query_numpy(predicates)
+            else:
+                rows = self._query_python(predicates)
+
+            return {
+                self._stations[row]: {
+                    field: self._columns[field][row] for field in fields
+                    if self._columns[field][row] == self._columns[field][row]  # not NaN
+                }
+                for row in rows
+            }
+
+    def _query_numpy(self, predicates):
+        """
+        :return: indices of the matching rows, evaluated with NumPy
+        """
+        mask = numpy.ones(len(self._stations), dtype=bool)
+        for field, op, value in predicates:
+            column = numpy.frombuffer(self._columns[field], dtype=numpy.float64)
+            mask &= ~numpy.isnan(column)
+            mask &= OPERATORS[op](column, value)
+        return numpy.flatnonzero(mask).tolist()
+
+    def _query_python(self, predicates):
+        """
+        :return: indices of the matching rows
+        """
+        rows = range(len(self._stations))
+        for field, op, value in predicates:
+            column = self._columns[field]
+            fn = OPERATORS[op]
+            rows = [row for row in rows if column[row] == column[row] and fn(column[row], value)]
+        return list(rows)
@@ -26,6 +26,11 @@ setup(
         'singleton_decorator',
         'waitress'
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'zstd': ['zstandard'],
+        'arrow': ['pyarrow']
+    },
     url=jd["url"],
     download_url='{}/archive/v_{}.tar.gz'.format(jd["url"], jd["version"].replace(".", "")),
     description='A simple rest application that exposes information gathered from the nautical library.',
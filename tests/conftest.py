@@ -0,0 +1,80 @@
+from nautical.noaa.buoy.buoy import Buoy
+from nautical.noaa.buoy.buoy_data import BuoyData
+from nautical.noaa.buoy.source import Source
+from nautical.location.point import Point
+from nautical_api import connector, resources
+from nautical_api.connector import NauticalDatabase
+import pytest
+
+
+def make_sources(num_sources=2, num_buoys=5):
+    """
+    Create offline sources in the same format that is returned by
+    `nautical.io.sources.get_buoy_sources`.
+
+    :param num_sources: Number of sources to create
+    :param num_buoys: Number of buoys added to each source
+    :return: dictionary of source names mapped to their respective source
+    """
+    sources = {}
+    for i in range(num_sources):
+        source = Source("Test Source/{}".format(i), "Offline test source")
+        for j in range(num_buoys):
+            station = "{}{:04d}".format(i, j)
+            source.add_buoy(Buoy(station, location=Point(30.0 + i, -70.0 - j)))
+        sources[source.name] = source
+    return sources
+
+
+def make_buoy(station, wvht=1.5):
+    """
+    Create an offline buoy in the same format that is returned by
+    `nautical.io.buoy.create_buoy`.
+
+    :param station: ID of the buoy
+    :param wvht: Wave height that is set in the present data
+    :return: nautical.noaa.buoy.Buoy with present data
+    """
+    data = BuoyData()
+    data.set("wvht", wvht)
+    data.set("wspd", 10)
+    data.set("wdir", "NW")
+
+    buoy = Buoy(station)
+    buoy.present = data
+    return buoy
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """
+    Replace the nautical library calls made by the connector with offline data.
+
+    :return: list of the buoy IDs that were passed to `create_buoy`
+    """
+    requested = []
+
+    def _create_buoy(station):
+        requested.append(station)
+        return make_buoy(station)
+
+    monkeypatch.setattr(connector, "get_buoy_sources", lambda: make_sources())
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    return requested
+
+
+
+@pytest.fixture
+def database(offline):
+    """
+    Offline database that replaces the singleton used by the resources for the
+    duration of the test. The database has been pulled, but the buoys are not warmed.
+    """
+    previous = NauticalDatabase._instance
+    db = NauticalDatabase.__wrapped__(prefetch=False)
+    db._pull_all()
+    NauticalDatabase._instance = db
+    resources._bodies.clear()
+    yield db
+    db.stop()
+    NauticalDatabase._instance = previous
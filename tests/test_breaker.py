@@ -0,0 +1,42 @@
+from nautical_api.breaker import CircuitBreakers, CLOSED, OPEN, HALF_OPEN
+
+
+def test_breaker_negative_cache():
+    """
+    A failure is cached for the negative ttl, a success removes the station.
+    """
+    breakers = CircuitBreakers(negative_ttl=60, threshold=3)
+    assert breakers.allow("a", now=0)
+
+    state = breakers.failure("a", "HTTP Error 404", now=0)
+    assert state.state == CLOSED and state.failures == 1 and state.retry_at == 60
+    assert not breakers.allow("a", now=59)
+    assert breakers.allow("a", now=60)
+
+    breakers.success("a")
+    assert breakers.get("a") is None and len(breakers) == 0
+
+
+def test_breaker_open():
+    """
+    The breaker opens after consecutive failures, a single trial is allowed after the
+    cooldown and the cooldown is doubled when the trial fails.
+    """
+    breakers = CircuitBreakers(negative_ttl=10, threshold=2, cooldown=100, max_cooldown=150)
+    breakers.failure("a", now=0)
+    state = breakers.failure("a", now=10)
+    assert state.state == OPEN and state.retry_at == 110
+
+    assert not breakers.allow("a", now=109)
+    assert breakers.allow("a", now=110)
+    assert breakers.get("a").state == HALF_OPEN
+    assert not breakers.allow("a", now=111)
+    # the result of the trial did not arrive in time
+    assert breakers.allow("a", now=120)
+
+    state = breakers.failure("a", now=130)
+    assert state.state == OPEN and state.trips == 2 and state.retry_at == 280
+
+    breakers.failure("b", now=0)
+    breakers.retain(["b"])
+    assert [x.station for x in breakers.states()] == ["b"]
@@ -0,0 +1,92 @@
+from nautical_api.cache import ReadingCache, reading_size
+from nautical_api.connector import Reading
+from nautical_api.responses import BodyCache
+from conftest import make_buoy
+
+
+def _reading(fetched=1000.0, epoch=None):
+    """
+    :return: Reading of an offline buoy, the epoch time of the observation is replaced by `epoch`
+    """
+    data = make_buoy("a").present
+    if epoch is not None:
+        class _Data:
+            pass
+
+        data = _Data()
+        data.wvht = 1.5
+        data.epoch_time = epoch
+    return Reading(data, fetched)
+
+
+def test_cache_max_entries():
+    """
+    The least recently used readings are evicted when the cache is full.
+    """
+    cache = ReadingCache(max_entries=2)
+    assert cache.add("a", _reading()) == []
+    assert cache.add("b", _reading()) == []
+    assert cache.touch("a")
+    assert cache.add("c", _reading()) == ["b"]
+    assert "b" not in cache and len(cache) == 2
+
+    # replacing a reading does not evict
+    assert cache.add("a", _reading()) == []
+    assert cache.stats()["evictions"] == {"size": 1, "expired": 0}
+
+    cache.retain(["c"])
+    assert len(cache) == 1
+    assert cache.stats()["evictions"]["size"] == 1
+
+    # lookups that are not uses and replaced readings do not change the order
+    assert cache.add("a", _reading()) == []
+    assert cache.touch("c", used=False)
+    assert cache.add("c", _reading()) == []
+    assert cache.add("d", _reading()) == ["c"]
+
+
+def test_cache_max_bytes():
+    """
+    The readings are evicted until the bytes used are within the budget, the new
+    reading is kept even when it is larger than the budget.
+    """
+    size = reading_size(_reading())
+    cache = ReadingCache(max_bytes=size * 2)
+    cache.add("a", _reading())
+    cache.add("b", _reading())
+    assert cache.nbytes == size * 2
+    assert cache.add("c", _reading()) == ["a"]
+
+    cache = ReadingCache(max_bytes=1)
+    assert cache.add("a", _reading()) == []
+    assert cache.add("b", _reading()) == ["a"]
+    assert cache.nbytes == size
+
+
+def test_cache_ttl():
+    """
+    The readings expire after the observation time, or after the time fetched when the
+    observation time is unknown. Old observations are kept for `min_ttl` after the fetch.
+    """
+    cache = ReadingCache(ttl=100, min_ttl=10)
+    cache.add("a", _reading(fetched=5000, epoch=1000))
+    cache.add("b", _reading(fetched=5000, epoch=0))
+    assert cache.touch("a", now=5009)
+    assert not cache.touch("a", now=5010)
+    assert cache.touch("b", now=5099)
+    assert not cache.touch("b", now=5100)
+    assert cache.stats() == {"entries": 0, "bytes": 0, "evictions": {"size": 0, "expired": 2}}
+
+
+def test_body_cache_max_entries():
+    """
+    The least recently used bodies are removed when the body cache is full.
+    """
+    bodies = BodyCache(max_entries=2)
+    bodies.get("a", 1, lambda: {"a": 1})
+    bodies.get("b", 1, lambda: {"b": 1})
+    bodies.get("a", 1, lambda: {"a": 2})
+    bodies.get("c", 1, lambda: {"c": 1})
+    assert len(bodies) == 2
+    assert bodies.get("a", 1, lambda: {"a": 3}).data == {"a": 1}
+    assert bodies.get("b", 1, lambda: {"b": 2}).data == {"b": 2}
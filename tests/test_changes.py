@@ -0,0 +1,56 @@
+from nautical_api.changes import ChangeLog
+
+
+def test_change_log_since():
+    """
+    Only the keys stamped after the generation are returned, the most recent change first.
+    """
+    changes = ChangeLog(start=100)
+    assert changes.update(["a", "b"]) == 101
+    assert changes.update(["c"]) == 102
+    assert changes.update(["a"]) == 103
+    assert changes.update([]) == 103
+
+    output = changes.since(101)
+    assert not output.reset
+    assert output.generation == 103
+    assert output.changed == ["a", "c"]
+    assert changes.since(103).changed == []
+
+
+def test_change_log_tombstones():
+    """
+    Removed keys leave a tombstone until the key is added again.
+    """
+    changes = ChangeLog(start=0)
+    changes.update(["a", "b"])
+    changes.remove(["a"])
+
+    output = changes.since(1)
+    assert output.changed == [] and output.removed == ["a"]
+
+    changes.update(["a"])
+    output = changes.since(1)
+    assert output.changed == ["a"] and output.removed == []
+
+
+def test_change_log_reset():
+    """
+    Clients that synced before the compacted tombstones, before the log was created or
+    with an unknown generation must reset.
+    """
+    changes = ChangeLog(max_tombstones=1, start=10)
+    changes.update(["a", "b", "c"])
+    assert changes.since(5).reset
+    assert changes.since(12).reset
+    assert changes.since(None).reset
+
+    changes.remove(["a"])
+    changes.remove(["b"])
+    output = changes.since(11)
+    assert output.reset
+    assert output.changed == ["c"] and output.removed == []
+
+    output = changes.since(12)
+    assert not output.reset
+    assert output.removed == ["b"]
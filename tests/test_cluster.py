@@ -0,0 +1,119 @@
+from nautical_api.cluster import LeaderLock
+from nautical_api.connector import NauticalDatabase
+from multiprocessing import get_context
+from conftest import make_buoy, make_sources
+from time import sleep
+
+
+def _wait_for(condition, timeout=10.0):
+    """
+    :return: True when the condition is met before the timeout
+    """
+    for _ in range(int(timeout / 0.05)):
+        if condition():
+            return True
+        sleep(0.05)
+    return condition()
+
+
+def _database(tmp_path, buoy_fn, **kwargs):
+    return NauticalDatabase.__wrapped__(
+        store=str(tmp_path / "nautical.db"),
+        leader_lock=str(tmp_path / "nautical.lock"),
+        sync_interval=0.05,
+        sources_fn=lambda: make_sources(1, 3),
+        buoy_fn=buoy_fn,
+        **kwargs
+    )
+
+
+def test_leader_lock(tmp_path):
+    """
+    Only a single lock on the file is held at a time.
+    """
+    first = LeaderLock(str(tmp_path / "nautical.lock"))
+    second = LeaderLock(str(tmp_path / "nautical.lock"))
+    assert first.acquire() and first.held
+    assert not second.acquire() and not second.held
+
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_leader_and_follower(tmp_path):
+    """
+    The follower loads the data retrieved by the leader, the buoys that it needs are
+    retrieved by the leader. The follower becomes the leader when the leader stops.
+    """
+    fetched = []
+
+    def _leader_buoy(station):
+        fetched.append(station)
+        return make_buoy(station, wvht=2.0)
+
+    def _follower_buoy(station):
+        return make_buoy(station, wvht=3.0)
+
+    leader = _database(tmp_path, _leader_buoy, prefetch=False)
+    leader.run()
+    follower = _database(tmp_path, _follower_buoy, prefetch=False)
+    follower.run()
+    assert follower._following and not leader._following
+    assert follower.get_all_buoy_ids() == leader.get_all_buoy_ids()
+
+    # retrieved by the leader, loaded by the follower
+    assert leader.get_buoy("00000").wvht == 2.0
+    assert _wait_for(lambda: follower._buoys.get("00000") is not None)
+    assert follower.get_buoy("00000").wvht == 2.0
+
+    # requested by the follower, retrieved by the leader
+    assert follower.get_buoy("00001").wvht == 2.0
+    assert fetched == ["00000", "00001"]
+
+    leader.stop()
+    assert _wait_for(lambda: not follower._following)
+    assert follower.get_buoy("00002").wvht == 3.0
+    follower.stop()
+
+
+def _worker(tmp_path, fetches, results):
+    """
+    Worker process of `test_worker_processes`, the role of the worker and the number of
+    buoys it has are added to the results.
+    """
+    def _create_buoy(station):
+        with fetches.get_lock():
+            fetches.value += 1
+        return make_buoy(station)
+
+    db = _database(tmp_path, _create_buoy, prefetch=True)
+    db.run()
+    # the sources may not have been saved by the leader yet
+    _wait_for(lambda: db._buoys and all(x is not None for x in db._buoys.values()))
+    results.put(("follower" if db._following else "leader", sum(x is not None for x in db._buoys.values())))
+    # keep the leader running until all followers loaded the data
+    sleep(1.0)
+    db.stop()
+
+
+def test_worker_processes(tmp_path):
+    """
+    A single worker process retrieves the buoys, the other workers load them from the store.
+    """
+    # the workers are spawned, forking the (threaded) test process is not safe
+    context = get_context("spawn")
+    fetches = context.Value("i", 0)
+    results = context.Queue()
+    workers = [context.Process(target=_worker, args=(tmp_path, fetches, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+
+    output = sorted(results.get(timeout=30) for _ in workers)
+    # a follower takes over (and refreshes the buoys) once the leader stops
+    fetched = fetches.value
+    for worker in workers:
+        worker.join(10)
+
+    assert output == [("follower", 3), ("follower", 3), ("leader", 3)]
+    assert fetched == 3
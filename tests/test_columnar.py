@@ -0,0 +1,58 @@
+from nautical_api import columnar
+from nautical_api.connector import NauticalDatabase
+from conftest import make_buoy, make_sources
+import pytest
+
+
+def _database(tmp_path, **kwargs):
+    db = NauticalDatabase.__wrapped__(
+        prefetch=False,
+        snapshot_dir=str(tmp_path / "snapshots"),
+        sources_fn=lambda: make_sources(2, 3),
+        buoy_fn=make_buoy,
+        **kwargs
+    )
+    db._pull_all()
+    return db
+
+
+@pytest.mark.skipif(columnar.pyarrow is None, reason="pyarrow is not installed")
+def test_snapshot_file(tmp_path):
+    """
+    The file contains a row for each buoy with its sources and the fields of its reading,
+    it can be memory mapped. Only the latest files are kept.
+    """
+    pyarrow = columnar.pyarrow
+    db = _database(tmp_path, snapshot_keep=2)
+    db.get_buoy("00001")
+    path = db._write_snapshot()
+    assert path == db.get_snapshot_file()
+    # the data did not change
+    assert db._write_snapshot(force=True) is None
+
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+    rows = {row["station"]: row for row in table.to_pylist()}
+    assert len(rows) == 6
+    assert rows["00001"]["wvht"] == 1.5 and rows["00001"]["fetched"] > 0
+    assert rows["00001"]["sources"] == ["Test_Source_0"] and rows["00001"]["latitude"] == 30.0
+    assert rows["00002"]["fetched"] is None and rows["00002"]["wvht"] != rows["00002"]["wvht"]
+    assert b"Test Source/1" in table.schema.metadata[b"sources"]
+
+    for buoy in ("00002", "10000"):
+        db.get_buoy(buoy)
+        assert db._write_snapshot(force=True) is not None
+    assert len(db._snapshot_files.files()) == 2
+    assert db.get_snapshot_file() != path
+    db.stop()
+
+
+def test_snapshot_disabled(tmp_path, monkeypatch):
+    """
+    Without pyarrow the snapshot files are disabled.
+    """
+    monkeypatch.setattr(columnar, "pyarrow", None)
+    db = _database(tmp_path)
+    db.get_buoy("00001")
+    assert db._write_snapshot(force=True) is None
+    assert db.get_snapshot_file() is None
+    db.stop()
@@ -1,6 +1,13 @@
+from nautical_api import connector
 from nautical_api.connector import find_wait_time, NauticalDatabase
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep
+from conftest import make_buoy, make_sources
 import pytest
 from uuid import UUID, uuid4
+from nautical.noaa.buoy.buoy import Buoy
+from urllib.error import URLError
 
 
 GOOD_UUID = str(uuid4())
@@ -230,3 +237,519 @@ def test_db_stop():
     """
     NauticalDatabase().stop()
     assert True
+
+
+def test_db_prefetch(offline):
+    """
+    After a pull, all buoys are warmed in the background so that the requests for
+    the buoys are served from memory without calling the nautical library again.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=True, prefetch_workers=4)
+    db._pull_all()
+    db._prefetch_thread.join(10)
+
+    status = db.get_prefetch_status()
+    assert status["total"] == len(db.get_all_buoy_ids())
+    assert status["completed"] == status["total"]
+    assert status["failed"] == 0
+    assert not status["running"]
+
+    num_requested = len(offline)
+    assert num_requested == status["total"]
+    assert db.get_buoy(db.get_all_buoy_ids()[0]) is not None
+    assert len(offline) == num_requested
+
+    db.stop()
+
+
+def test_db_prefetch_sources(offline):
+    """
+    When sources are provided, only the buoys in the sources (name or alias) are warmed.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=True, prefetch_sources=["Test_Source_0"])
+    db._pull_all()
+    db._prefetch_thread.join(10)
+
+    assert db.get_prefetch_status()["completed"] == 5
+    assert all(x.startswith("0") for x in offline)
+
+    db.stop()
+
+
+def test_db_single_flight(offline, monkeypatch):
+    """
+    Concurrent requests for the same buoy share a single fetch, while requests for
+    other buoys and the list of buoys are not blocked by the fetch.
+    """
+    release = Event()
+    blocked = "00000"
+
+    def _create_buoy(station):
+        offline.append(station)
+        if station == blocked:
+            release.wait(10)
+        return make_buoy(station)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+
+    db = NauticalDatabase.__wrapped__(prefetch=False)
+    db._pull_all()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        waiting = [executor.submit(db.get_buoy, blocked) for _ in range(3)]
+
+        # the other buoys and lists are served while the blocked buoy is fetched
+        assert db.get_buoy("00001") is not None
+        assert len(db.get_all_buoy_ids()) > 0
+        assert len(db.get_aliases()) > 0
+        assert not any(f.done() for f in waiting)
+
+        release.set()
+        assert all(f.result(10) is not None for f in waiting)
+
+    assert offline.count(blocked) == 1
+
+    db.stop()
+
+
+def test_db_removed_while_fetched(offline, monkeypatch):
+    """
+    The reading of a buoy that is removed by a pull while it is fetched is returned to
+    the waiting request, but it is not stored or recorded in the history.
+    """
+    fetching = Event()
+    release = Event()
+    removed = "00004"
+
+    def _create_buoy(station):
+        offline.append(station)
+        fetching.set()
+        release.wait(10)
+        return make_buoy(station)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+
+    db = NauticalDatabase.__wrapped__(prefetch=False)
+    db._pull_all()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiting = executor.submit(db.get_buoy, removed)
+        assert fetching.wait(10)
+
+        monkeypatch.setattr(connector, "get_buoy_sources", lambda: make_sources(num_buoys=4))
+        db._pull_all(stale=False)
+        release.set()
+        assert waiting.result(10) is not None
+
+    assert removed not in db._buoys
+    assert removed not in db._cache
+    assert db._history.query(removed) is None
+    assert removed not in db._table.columns()[0]
+    db.stop()
+
+
+def test_db_stale_while_revalidate(database, offline, monkeypatch):
+    """
+    After a pull, the previous reading of a buoy is served (as stale) while the
+    buoy is refreshed in the background.
+    """
+    buoy_id = database.get_all_buoy_ids()[0]
+    assert not database.get_buoy_reading(buoy_id).stale
+
+    release = Event()
+
+    def _create_buoy(station):
+        release.wait(10)
+        return make_buoy(station, wvht=2.5)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    database._pull_all()
+
+    reading = database.get_buoy_reading(buoy_id)
+    assert reading.stale
+    assert reading.data.wvht == 1.5
+    assert reading.age >= 0.0
+
+    release.set()
+    for _ in range(100):
+        reading = database.get_buoy_reading(buoy_id)
+        if not reading.stale:
+            break
+        sleep(0.1)
+
+    assert not reading.stale
+    assert reading.data.wvht == 2.5
+
+
+def test_db_keep_snapshot(database, monkeypatch):
+    """
+    When no sources are found during a pull, the current snapshot is kept.
+    """
+    snapshot = database._snapshot
+    monkeypatch.setattr(connector, "get_buoy_sources", lambda: {})
+    database._pull_all()
+
+    assert database._snapshot is snapshot
+    assert len(database.get_all_buoy_ids()) > 0
+
+
+def test_db_get_buoy_readings(database, offline, monkeypatch):
+    """
+    The buoys in a batch are fetched concurrently, a slow buoy is reported as an
+    error without holding up the other buoys.
+    """
+    release = Event()
+    slow = "00000"
+
+    def _create_buoy(station):
+        if station == slow:
+            release.wait(10)
+        return make_buoy(station)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+
+    buoy_ids = database.get_all_buoy_ids()
+    readings, errors = database.get_buoy_readings(buoy_ids + ["missing"], timeout=0.5)
+    release.set()
+
+    assert len(readings) == len(buoy_ids) - 1
+    assert errors == {slow: "timeout", "missing": "not found"}
+
+
+def test_callbacks(database, monkeypatch):
+    """
+    The callbacks are called when a pull finishes and when the reading of a buoy changes.
+    """
+    updates = []
+    first = database.subscribe(updates.append)
+    second = database.subscribe(lambda _: 1 / 0)
+    assert first is not None and second is not None and first != second
+
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+    assert [(x.kind, x.buoy) for x in updates] == [("reading", buoy_id)]
+
+    # the same information fetched again is not a change
+    database._load_buoy(buoy_id, connector.Future())
+    assert len(updates) == 1
+
+    monkeypatch.setattr(connector, "create_buoy", lambda x: make_buoy(x, wvht=2.5))
+    database._load_buoy(buoy_id, connector.Future())
+    assert updates[-1].reading.data.wvht == 2.5
+
+    database._pull_all()
+    assert updates[-1].kind == "pull"
+    assert updates[-1].generation == database.get_changes()["generation"]
+
+    assert database.unsubscribe(first)
+    last = updates[-1]
+    database._pull_all()
+    assert updates[-1] is last
+
+
+def test_callbacks_without_update(database):
+    """
+    Callbacks that take no arguments are called without the update.
+    """
+    calls = []
+    assert database.subscribe(lambda: calls.append(1)) is not None
+    database.get_buoy(database.get_all_buoy_ids()[0])
+    database._pull_all()
+    assert calls == [1, 1]
+
+
+def test_db_refresh_schedule(database, offline):
+    """
+    The buoys are scheduled once retrieved, the buoys that are due are marked as stale
+    and refreshed while the pull of the sources keeps the readings.
+    """
+    buoy_id = database.get_all_buoy_ids()[0]
+    assert database.get_schedule() == []
+
+    database.get_buoy(buoy_id)
+    assert [x.station for x in database.get_schedule()] == [buoy_id]
+    assert database.get_next_refresh(buoy_id) > database.get_buoy_reading(buoy_id).fetched
+
+    database._pull_all(stale=False)
+    assert not database.get_buoy_reading(buoy_id).stale
+    assert database._refresh_due() == []
+
+    # make the buoy due, without prefetch it is refreshed by the next request
+    database._scheduler.failed(buoy_id, now=0)
+    assert database._refresh_due() == [buoy_id]
+    assert database.get_buoy_reading(buoy_id).stale
+    for _ in range(100):
+        if not database.get_buoy_reading(buoy_id).stale:
+            break
+        sleep(0.1)
+    assert offline.count(buoy_id) == 2
+
+
+def test_db_refresh_evicted(database):
+    """
+    A buoy that is due while its reading was evicted is put back on the schedule.
+    """
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+    database._buoys[buoy_id] = None
+
+    database._scheduler.failed(buoy_id, now=0)
+    assert database._refresh_due() == [buoy_id]
+    assert database._scheduler.get(buoy_id).due is not None
+
+
+def test_db_refresh_failed(database, offline, monkeypatch):
+    """
+    A buoy is rescheduled when its fetch raised an unexpected error.
+    """
+    buoy_id = database.get_all_buoy_ids()[0]
+
+    def _create_buoy(station):
+        raise ValueError("bad data")
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    with pytest.raises(ValueError):
+        database.get_buoy(buoy_id)
+
+    schedule = database._scheduler.get(buoy_id)
+    assert schedule.due is not None and schedule.misses == 1
+    assert not database._inflight
+
+
+def test_db_prefetch_hot_only(offline):
+    """
+    The most frequently requested buoys are warmed first, with `prefetch_hot_only` the
+    other buoys are left to be fetched on request.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=False, hot_size=2, prefetch_hot_only=True)
+    db._pull_all()
+    buoy_ids = db.get_all_buoy_ids()
+    assert db._prefetch_buoy_ids() == buoy_ids
+
+    for _ in range(3):
+        db.get_buoy(buoy_ids[4])
+    db.get_buoy(buoy_ids[2])
+    db.get_buoy(buoy_ids[7])
+    db.get_buoy(buoy_ids[7])
+
+    assert db._prefetch_buoy_ids() == [buoy_ids[4], buoy_ids[7]]
+    db._prefetch_hot_only = False
+    assert db._prefetch_buoy_ids()[:3] == [buoy_ids[4], buoy_ids[7], buoy_ids[2]]
+    assert len(db._prefetch_buoy_ids()) == len(buoy_ids)
+
+    stats = db.get_hot_set()
+    assert [x[0] for x in stats["keys"]] == [buoy_ids[4], buoy_ids[7]]
+    assert stats["tracked"] == 3
+
+    db.stop()
+
+
+def test_db_cache_eviction(offline):
+    """
+    The least recently used readings are evicted when the cache is full, expired readings
+    are evicted and fetched again on request.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=False, cache_entries=2)
+    db._pull_all()
+    buoy_ids = db.get_all_buoy_ids()
+    for buoy_id in buoy_ids[:3]:
+        db.get_buoy(buoy_id)
+
+    assert db._buoys[buoy_ids[0]] is None
+    assert db._buoys[buoy_ids[1]] is not None
+    stats = db.get_cache_stats()
+    assert stats["fresh"] == 2 and stats["evictions"]["size"] == 1 and stats["cache_bytes"] > 0
+
+    # the values of the evicted buoy are removed from the table
+    assert set(db.query_buoys([("wvht", "ge", 0)])) == set(buoy_ids[1:3])
+
+    # the evicted buoy is fetched again
+    assert db.get_buoy(buoy_ids[0]) is not None
+    assert offline.count(buoy_ids[0]) == 2
+    db.stop()
+
+    db = NauticalDatabase.__wrapped__(prefetch=False, cache_ttl=0)
+    db._pull_all()
+    db.get_buoy(buoy_ids[0])
+    db.get_buoy(buoy_ids[0])
+    assert offline.count(buoy_ids[0]) == 4
+    assert db.get_cache_stats()["evictions"]["expired"] == 1
+    db.stop()
+
+
+def test_db_cache_warm_up(offline):
+    """
+    The warm up is limited to the size of the cache and it does not change the order of
+    the requested readings.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=False, cache_entries=3)
+    db._pull_all()
+    buoy_ids = db.get_all_buoy_ids()
+    db.get_buoy(buoy_ids[5])
+    db.get_buoy(buoy_ids[6])
+    warmed = db._prefetch_buoy_ids()
+    assert set(warmed[:2]) == {buoy_ids[5], buoy_ids[6]} and warmed[2:] == [buoy_ids[0]]
+
+    db._prefetch = True
+    db._start_prefetch()
+    db._prefetch_thread.join(10)
+    assert sorted(offline) == sorted([buoy_ids[5], buoy_ids[6], buoy_ids[0]])
+
+    # the buoys refreshed in the background are not used
+    db._refresh_buoys([buoy_ids[5]])
+    db.get_buoy(buoy_ids[6])
+    db.get_buoy(buoy_ids[1])
+    assert db._buoys[buoy_ids[6]] is not None and db._buoys[buoy_ids[5]] is None
+    db.stop()
+
+
+def test_db_failed_fetches(offline, monkeypatch):
+    """
+    Transient errors are retried, failures are cached and the breaker of a buoy that
+    keeps failing stops the fetches.
+    """
+    calls = []
+
+    def _create_buoy(station):
+        calls.append(station)
+        if station.endswith("1"):
+            raise connector.URLError("timed out")
+        if station.endswith("2"):
+            raise connector.HTTPError("url", 404, "Not Found", None, None)
+        return make_buoy(station)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    db = NauticalDatabase.__wrapped__(prefetch=False, retry_delay=0.0, breaker_threshold=2, negative_ttl=0.0)
+    db._pull_all()
+
+    assert db.get_buoy("00001") is None
+    assert calls == ["00001"] * 3
+    assert db.get_buoy("00002") is None
+    assert calls.count("00002") == 1
+
+    # the breaker is open, the buoy is not fetched
+    assert db.get_buoy("00001") is None
+    assert db.get_buoy("00001") is None
+    assert calls.count("00001") == 6
+    readings, errors = db.get_buoy_readings(["00001", "00003"])
+    assert errors == {"00001": "unavailable"} and "00003" in readings
+    assert calls.count("00001") == 6
+
+    states = {x.station: x for x in db.get_breakers()}
+    assert states["00001"].state == "open" and states["00001"].error == "<urlopen error timed out>"
+    assert states["00002"].state == "closed" and states["00002"].failures == 1
+    db.stop()
+
+
+def test_db_incremental_pull(database, offline, monkeypatch):
+    """
+    A scheduled pull only applies the changes to the sources, the snapshot (and its
+    aliases) is kept when nothing changed and the readings are not invalidated.
+    """
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+    snapshot = database.get_snapshot()
+    buoys = database._buoys
+
+    database._pull_all(stale=False)
+    assert database.get_snapshot() is snapshot
+    assert database._buoys is buoys
+    assert not database.get_buoy_reading(buoy_id).stale
+
+    # add a buoy to the first source, the other buoys and the aliases are kept
+    monkeypatch.setattr(connector, "get_buoy_sources", lambda: make_sources(num_buoys=6))
+    database._pull_all(stale=False)
+    changed = database.get_snapshot()
+    assert changed.generation == snapshot.generation + 1
+    assert changed.aliases is snapshot.aliases
+    assert "00005" in changed.buoys and database._buoys["00005"] is None
+    assert not database.get_buoy_reading(buoy_id).stale
+    assert offline == [buoy_id]
+
+
+def test_db_run_background(offline):
+    """
+    Without blocking, `run` returns before the first pull and the database becomes
+    ready once the sources are pulled.
+    """
+    release = Event()
+
+    def _sources():
+        release.wait(10)
+        return make_sources()
+
+    db = NauticalDatabase.__wrapped__(prefetch=False, sources_fn=_sources)
+    db.run(block=False)
+    assert not db.is_ready()
+    assert not db.get_readiness()["ready"]
+    assert db.get_all_buoy_ids() == []
+
+    release.set()
+    assert db.wait_ready(10)
+    readiness = db.get_readiness()
+    assert readiness["origin"] == "pull" and readiness["seconds"] > 0
+    assert len(db.get_all_buoy_ids()) == 10
+    db.stop()
+
+
+def test_db_iter_readings(offline):
+    """
+    The readings are iterated without retrieving the buoys or counting the accesses,
+    expired readings are not included.
+    """
+    db = NauticalDatabase.__wrapped__(prefetch=False, cache_ttl=0)
+    db._pull_all()
+    buoy_ids = db.get_all_buoy_ids()
+    db.get_buoy(buoy_ids[0])
+
+    readings = dict(db.iter_readings())
+    assert list(readings) == buoy_ids
+    assert all(x is None for x in readings.values())
+    assert dict(db.iter_readings(["Test Source/1", "Test Source/1"])).keys() == set(buoy_ids[5:])
+    assert offline == [buoy_ids[0]]
+    assert db.get_hot_set()["tracked"] == 1
+    db.stop()
+
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_db_run_pull_failed(offline, engine):
+    """
+    When the first pull fails, the pull is retried and the database becomes ready.
+    """
+    calls = []
+
+    def _sources():
+        calls.append(1)
+        if len(calls) == 1:
+            raise URLError("unreachable")
+        return make_sources()
+
+    db = NauticalDatabase.__wrapped__(prefetch=False, engine=engine, sources_fn=_sources)
+    db.run(block=False)
+    assert db.wait_ready(10)
+    assert len(calls) == 2
+    assert len(db.get_all_buoy_ids()) == 10
+    db.stop()
+
+
+def test_db_cache_ttl_old_observation(offline, monkeypatch):
+    """
+    A buoy whose observation is older than the ttl is not fetched again on every request.
+    """
+    def _create_buoy(station):
+        offline.append(station)
+        present = make_buoy(station).present
+        present.year -= 5
+        buoy = Buoy(station)
+        buoy.present = present
+        return buoy
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    db = NauticalDatabase.__wrapped__(prefetch=False, cache_ttl=3600)
+    db._pull_all()
+    buoy_id = db.get_all_buoy_ids()[0]
+    for _ in range(5):
+        assert db.get_buoy(buoy_id) is not None
+
+    assert offline == [buoy_id]
+    db.stop()
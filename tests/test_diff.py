@@ -0,0 +1,52 @@
+from nautical_api.diff import EMPTY_INDEX, index_sources, diff_sources
+from nautical.location.point import Point
+from conftest import make_buoy, make_sources
+
+
+def _find(sources, station):
+    """
+    :return: Buoy of the station in the sources
+    """
+    return next(b for source in sources.values() for b in source.buoys.values() if b.station == station)
+
+
+def test_diff_sources():
+    """
+    Only the sources and buoys that were added, removed or moved are reported.
+    """
+    index = index_sources(make_sources(2, 3))
+    diff = diff_sources(EMPTY_INDEX, index)
+    assert diff.changed and len(diff.added) == 6 and len(diff.added_sources) == 2
+
+    diff = diff_sources(index, index_sources(make_sources(2, 3)))
+    assert not diff.changed and diff.unchanged == 6
+
+    sources = make_sources(1, 4)
+    _find(sources, "00001").location = Point(10.0, 10.0)
+    diff = diff_sources(index, index_sources(sources))
+    assert diff.members_changed
+    assert diff.added == ("00003", )
+    assert diff.removed == ("10000", "10001", "10002")
+    assert diff.moved == ("00001", )
+    assert diff.removed_sources == ("Test Source/1", )
+    assert diff.changed_sources == ("Test Source/0", )
+    assert diff.stats()["unchanged"] == 2
+
+
+def test_diff_advanced():
+    """
+    Buoys listed with a newer observation are reported as advanced, without changing the sources.
+    """
+    sources = make_sources(1, 2)
+    listed = make_buoy("00000").present
+    listed.year -= 1
+    _find(sources, "00000").present = listed
+    index = index_sources(sources)
+    assert index.stations["00000"][2] == listed.epoch_time
+
+    sources = make_sources(1, 2)
+    _find(sources, "00000").present = make_buoy("00000").present
+
+    diff = diff_sources(index, index_sources(sources))
+    assert not diff.changed
+    assert diff.advanced == ("00000", )
@@ -0,0 +1,122 @@
+from nautical_api.connector import NauticalDatabase
+from nautical_api.engine import AsyncioEngine, EngineStopped, ThreadedEngine
+from conftest import make_buoy, make_sources
+from threading import Event, Lock
+from time import sleep
+import pytest
+
+
+ENGINES = [ThreadedEngine, AsyncioEngine]
+
+
+@pytest.mark.parametrize("engine_type", ENGINES)
+def test_engine_submit(engine_type):
+    """
+    Functions submitted to the engine are run in the background and the result
+    is available through the future.
+    """
+    engine = engine_type(2)
+    assert engine.submit(lambda x: x * 2, 21).result(5) == 42
+    assert engine.execute(lambda x: x * 2, 4) == 8
+    engine.stop()
+
+
+@pytest.mark.parametrize("engine_type", ENGINES)
+def test_engine_schedule(engine_type):
+    """
+    Only the most recently scheduled function is run.
+    """
+    engine = engine_type(2)
+    first = Event()
+    second = Event()
+
+    engine.schedule(0.2, first.set)
+    engine.schedule(0.1, second.set)
+
+    assert second.wait(5)
+    sleep(0.3)
+    assert not first.is_set()
+    engine.stop()
+
+
+@pytest.mark.parametrize("engine_type", ENGINES)
+def test_engine_stopped(engine_type):
+    """
+    Nothing is accepted by the engine once it has been stopped.
+    """
+    engine = engine_type(2)
+    engine.submit(lambda: None).result(5)
+    engine.stop()
+
+    with pytest.raises(EngineStopped):
+        engine.submit(lambda: None)
+
+
+@pytest.mark.parametrize("engine_type", ENGINES)
+def test_engine_schedule_failed(engine_type):
+    """
+    A scheduled function that fails is scheduled again.
+    """
+    engine = engine_type(2)
+    calls = []
+    done = Event()
+
+    def _scheduled():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("pull failed")
+        done.set()
+
+    engine.schedule(0, _scheduled)
+    assert done.wait(5)
+    assert len(calls) == 2
+    engine.stop()
+
+
+def test_asyncio_engine_in_flight():
+    """
+    The number of functions in flight is limited by the semaphore of the asyncio engine.
+    """
+    engine = AsyncioEngine(3)
+    lock = Lock()
+    state = {"current": 0, "max": 0}
+
+    def _fetch():
+        with lock:
+            state["current"] += 1
+            state["max"] = max(state["max"], state["current"])
+        sleep(0.02)
+        with lock:
+            state["current"] -= 1
+
+    futures = [engine.submit(_fetch) for _ in range(20)]
+    for future in futures:
+        future.result(5)
+
+    assert state["max"] == 3
+    engine.stop()
+
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_db_engine(engine):
+    """
+    The database provides the same read api with either engine when using a local
+    stand-in for the nautical library.
+    """
+    db = NauticalDatabase.__wrapped__(
+        prefetch=True,
+        engine=engine,
+        fetch_workers=4,
+        sources_fn=lambda: make_sources(3, 10),
+        buoy_fn=make_buoy
+    )
+    db.run()
+    db._prefetch_thread.join(10)
+
+    assert db.get_prefetch_status()["completed"] == 30
+    assert len(db.get_all_buoy_ids()) == 30
+    assert len(db.get_aliases()) == 3
+    assert db.get_source("Test Source/0") is not None
+    assert db.get_buoy("00000").wvht == 1.5
+
+    db.stop()
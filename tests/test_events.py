@@ -0,0 +1,60 @@
+from nautical_api.connector import Update, Reading, PULL_UPDATE, READING_UPDATE
+from nautical_api.events import Subscriber, stream
+from conftest import make_buoy
+from json import loads
+
+
+def _update(buoy, version=1):
+    return Update(READING_UPDATE, 1, buoy, Reading(make_buoy(buoy).present, 0.0, False, version))
+
+
+def test_subscriber_filter():
+    """
+    Reading updates are only kept for the buoys of the subscriber, pull updates are always kept.
+    """
+    subscriber = Subscriber(buoys=["a"])
+    subscriber(_update("b"))
+    subscriber(_update("a"))
+    subscriber(Update(PULL_UPDATE, 2))
+
+    assert subscriber.get(0).buoy == "a"
+    assert subscriber.get(0).kind == PULL_UPDATE
+    assert subscriber.get(0) is None
+
+
+def test_subscriber_drops():
+    """
+    A full queue drops the updates instead of blocking.
+    """
+    subscriber = Subscriber(maxsize=2)
+    for i in range(5):
+        subscriber(_update("a", i))
+
+    assert subscriber.take_dropped() == 3
+    assert subscriber.take_dropped() == 0
+    assert [subscriber.get(0).reading.version for _ in range(2)] == [0, 1]
+
+
+def test_stream():
+    """
+    The stream subscribes when started, reports drops and unsubscribes when closed.
+    """
+    subscribed = []
+    subscriber = Subscriber(maxsize=1)
+    events = stream(subscriber, lambda x: subscribed.append(x) or "id", subscribed.remove, heartbeat=0.01)
+
+    assert next(events) == ": connected\n\n"
+    assert subscribed == [subscriber]
+    assert next(events) == ": heartbeat\n\n"
+
+    subscriber(_update("a"))
+    subscriber(_update("b"))
+    assert next(events) == 'event: dropped\ndata: {"dropped": 1}\n\n'
+
+    event = next(events).split("\n")
+    assert event[0] == "event: reading"
+    assert loads(event[1][len("data: "):])["buoy"] == "a"
+
+    subscribed.append("id")
+    events.close()
+    assert subscribed == [subscriber]
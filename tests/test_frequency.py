@@ -0,0 +1,54 @@
+from nautical_api.frequency import AccessFrequency
+
+
+def test_frequency_decay():
+    """
+    The score of the accesses is halved every half life, recent accesses outweigh
+    older (even more frequent) accesses.
+    """
+    frequency = AccessFrequency(half_life=100, start=0)
+    for _ in range(4):
+        frequency.touch("a", now=0)
+    frequency.touch("b", now=300)
+    frequency.touch("b", now=300)
+
+    assert frequency.score("a", now=300) == 0.5
+    assert frequency.score("b", now=300) == 2.0
+    assert frequency.score("c", now=300) == 0.0
+    assert frequency.hot() == ["b", "a"]
+    assert frequency.order(["c", "a", "b", "d"]) == ["b", "a", "c", "d"]
+
+
+def test_frequency_rescale():
+    """
+    The scores are rescaled when the reference time becomes too old, the keys that
+    decayed away are forgotten.
+    """
+    frequency = AccessFrequency(half_life=1, start=0)
+    frequency.touch("a", now=0)
+    frequency.touch("b", now=1000)
+    assert len(frequency) == 1
+    assert frequency.score("b", now=1001) == 0.5
+
+
+def test_frequency_stats():
+    """
+    The coverage is the share of the accesses to the hot set, the hit rate is the
+    share of those accesses served from memory.
+    """
+    frequency = AccessFrequency(half_life=1e9, hot_size=2, start=0)
+    for key, hits, misses in (("a", 5, 1), ("b", 2, 1), ("c", 0, 1)):
+        for _ in range(hits):
+            frequency.touch(key, True, now=0)
+        for _ in range(misses):
+            frequency.touch(key, False, now=0)
+
+    stats = frequency.stats(now=0)
+    assert stats["size"] == 2 and stats["tracked"] == 3
+    assert [x[0] for x in stats["keys"]] == ["a", "b"]
+    assert abs(stats["coverage"] - 9 / 10) < 1e-9
+    assert abs(stats["hit_rate"] - 7 / 9) < 1e-9
+    assert abs(stats["overall_hit_rate"] - 7 / 10) < 1e-9
+
+    frequency.retain(["a"])
+    assert frequency.stats(now=0)["coverage"] == 1.0
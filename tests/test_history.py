@@ -0,0 +1,70 @@
+from nautical_api.history import History, StationHistory, NUMERIC_FIELDS
+from conftest import make_buoy
+
+
+def _reading(epoch, wvht):
+    """
+    :return: BuoyData where the epoch time is replaced by `epoch`
+    """
+    class _Data:
+        pass
+
+    data = _Data()
+    data.wvht = wvht
+    data.wdir = "NW"
+    data.epoch_time = epoch
+    return data
+
+
+def test_history_ring_buffer():
+    """
+    The buffer keeps the most recent readings, oldest first.
+    """
+    history = StationHistory(3)
+    for i in range(5):
+        assert history.append(100 + i, _reading(100 + i, float(i)))
+
+    output = history.query()
+    assert [x["time"] for x in output] == [102, 103, 104]
+    assert [x["wvht"] for x in output] == [2.0, 3.0, 4.0]
+
+    # non numeric values are not kept
+    assert "wdir" not in output[0]
+
+
+def test_history_duplicate():
+    """
+    A reading that is not newer than the most recent reading is ignored.
+    """
+    history = StationHistory(3)
+    assert history.append(100, _reading(100, 1.0))
+    assert not history.append(100, _reading(100, 2.0))
+    assert len(history) == 1
+
+
+def test_history_query():
+    """
+    The readings can be limited by time and fields.
+    """
+    history = StationHistory(5)
+    for i in range(5):
+        history.append(100 + i, _reading(100 + i, float(i)))
+
+    output = history.query(since=102, fields=["wvht"])
+    assert output == [{"time": 103, "wvht": 3.0}, {"time": 104, "wvht": 4.0}]
+
+
+def test_history_memory():
+    """
+    The memory used by each buoy is fixed by the size of the history.
+    """
+    history = History(10)
+    history.record("00000", make_buoy("00000").present)
+    history.record("00001", make_buoy("00001").present)
+
+    assert history.nbytes == 2 * 10 * 8 * (len(NUMERIC_FIELDS) + 1)
+
+    history.retain(["00001"])
+    assert len(history) == 1
+    assert history.query("00000") is None
+    assert history.query("00001")[0]["wvht"] == 1.5
@@ -0,0 +1,47 @@
+from nautical_api.metrics import Counter, Gauge, Histogram, Registry, TimedLock
+from threading import Thread
+from time import sleep
+
+
+def test_metrics_render():
+    """
+    The metrics are rendered in the Prometheus text format, the histogram buckets are cumulative.
+    """
+    registry = Registry()
+    counter = Counter("test_total", "Test counter.", ["result"], registry=registry)
+    gauge = Gauge("test_value", "Test gauge.", registry=registry)
+    histogram = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0), registry=registry)
+
+    counter.labels("hit").inc()
+    counter.labels("hit").inc(2)
+    gauge.set(1.5)
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{result="hit"} 3' in lines
+    assert "test_value 1.5" in lines
+    assert 'test_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+    assert "test_seconds_sum 5.65" in lines
+    assert "test_seconds_count 4" in lines
+
+
+def test_timed_lock():
+    """
+    The wait is observed each time the lock is acquired.
+    """
+    histogram = Histogram("test_wait_seconds", "Test wait.", ["lock"], registry=None)
+    lock = TimedLock("test", histogram)
+
+    with lock:
+        thread = Thread(target=lambda: lock.acquire() and lock.release())
+        thread.start()
+        sleep(0.05)
+    thread.join()
+
+    child = histogram.labels("test")
+    assert child.count == 2
+    assert 'test_wait_seconds_bucket{lock="test",le="0.01"} 1' in histogram.render()
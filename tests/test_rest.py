@@ -1,6 +1,11 @@
 import requests
+import gzip
+import json
 from nautical_api.resources import *
 from nautical_api.connector import NauticalDatabase
+from nautical_api.app import create_app
+from nautical_api import connector, resources, responses
+from conftest import make_sources
 import pytest
 from flask import Flask
 from flask_restful import Api
@@ -109,3 +114,504 @@ def test_buoys_live():
     assert len(resp[buoy_id]) > 0
     
     
+
+
+def test_buoy_age_header(database):
+    """
+    The age of the buoy information is added to the response headers, stale information
+    also includes a warning.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+
+    resp = client.get("/buoys/{}".format(buoy_id))
+    assert resp.status_code == 200
+    assert "wvht" in resp.get_json()[buoy_id]
+    assert int(resp.headers["Age"]) >= 0
+    assert "Warning" not in resp.headers
+
+
+@pytest.mark.parametrize("endpoint", ["/sources", "/sources/Test_Source_0", "/buoys", "/buoys/00000"])
+def test_etag_not_modified(database, endpoint):
+    """
+    The responses include a strong ETag and the max age of the response. Requests with a
+    matching If-None-Match header receive a 304 (Not Modified) without a body.
+    """
+    client = create_app().test_client()
+
+    resp = client.get(endpoint)
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert not etag.startswith("W/")
+    assert resp.headers["Cache-Control"].startswith("max-age=")
+
+    resp = client.get(endpoint, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == etag
+
+
+def test_etag_changes(database, monkeypatch):
+    """
+    The ETag changes when the data changes (new pull of the sources), a pull that did not
+    change the buoys keeps the ETag.
+    """
+    client = create_app().test_client()
+
+    etag = client.get("/buoys").headers["ETag"]
+    database._pull_all()
+    assert client.get("/buoys", headers={"If-None-Match": etag}).status_code == 304
+
+    monkeypatch.setattr(connector, "get_buoy_sources", lambda: make_sources(num_buoys=6))
+    database._pull_all()
+
+    resp = client.get("/buoys", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+    assert len(resp.get_json()["buoys"]) == len(database.get_all_buoy_ids())
+
+
+def test_batch_buoys(database):
+    """
+    Get the information for many buoys in a single request with GET or POST.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()[:3]
+
+    resp = client.post("/buoys/batch", json={"ids": buoy_ids + ["missing"]})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert sorted(data["buoys"].keys()) == sorted(buoy_ids)
+    assert data["errors"] == {"missing": "not found"}
+    assert data["buoys"][buoy_ids[0]] == client.get("/buoys/{}".format(buoy_ids[0])).get_json()[buoy_ids[0]]
+
+    resp = client.get("/buoys/batch?ids={}".format(",".join(buoy_ids)))
+    assert resp.status_code == 200
+    assert sorted(resp.get_json()["buoys"].keys()) == sorted(buoy_ids)
+
+
+def test_batch_buoys_too_large(database):
+    """
+    Batches larger than the max batch size are rejected.
+    """
+    client = create_app().test_client()
+
+    resp = client.post("/buoys/batch", json={"ids": [str(x) for x in range(MAX_BATCH_SIZE + 1)]})
+    assert resp.status_code == 400
+
+
+def test_buoy_history(database):
+    """
+    The history of a buoy contains the readings that have been retrieved.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+
+    resp = client.get("/buoys/{}/history?fields=wvht".format(buoy_id))
+    assert resp.status_code == 200
+    history = resp.get_json()[buoy_id]
+    assert len(history) == 1
+    assert set(history[0].keys()) == {"time", "wvht"}
+
+    resp = client.get("/buoys/{}/history?since={}".format(buoy_id, history[0]["time"]))
+    assert resp.get_json()[buoy_id] == []
+
+    resp = client.get("/buoys/{}/history?fields=unknown".format(buoy_id))
+    assert resp.status_code == 400
+
+
+def test_buoy_query(database):
+    """
+    The query endpoint filters the buoys that have been retrieved.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()[:2]
+    for buoy_id in buoy_ids:
+        database.get_buoy(buoy_id)
+
+    resp = client.get("/buoys/query?wvht_gt=1&wspd_le=10&fields=wvht")
+    assert resp.status_code == 200
+    assert resp.get_json()["buoys"] == {x: {"wvht": 1.5} for x in buoy_ids}
+
+    assert client.get("/buoys/query?wvht_gt=2").get_json()["buoys"] == {}
+
+    for query in ("wvht_between=1", "unknown_gt=1", "wvht_gt=abc", "wvht_gt=1&fields=unknown", ""):
+        assert client.get("/buoys/query?" + query).status_code == 400
+
+
+def test_buoys_near_and_bbox(database):
+    """
+    The buoys near a location are sorted by distance, the bounding box contains a single source.
+    """
+    client = create_app().test_client()
+
+    resp = client.get("/buoys/near?lat=30&lon=-70&radius_km=250&limit=3")
+    assert resp.status_code == 200
+    buoys = resp.get_json()["buoys"]
+    assert [x["id"] for x in buoys] == ["00000", "00001", "10000"]
+    assert buoys[0]["distance_km"] == 0
+
+    resp = client.get("/buoys/bbox?min_lat=30.5&min_lon=-80&max_lat=31.5&max_lon=-60")
+    assert [x["id"] for x in resp.get_json()["buoys"]] == ["1{:04d}".format(j) for j in range(5)]
+
+    for query in ("near?lon=-70", "near?lat=91&lon=0", "near?lat=0&lon=0&limit=0", "near?lat=a&lon=0",
+                  "bbox?min_lat=10&min_lon=0&max_lat=0&max_lon=1"):
+        assert client.get("/buoys/" + query).status_code == 400
+
+
+def test_event_stream(database):
+    """
+    The stream only contains the events for the requested buoys.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()
+
+    resp = client.get("/events?buoys={}".format(buoy_ids[1]), buffered=False)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+
+    events = iter(resp.response)
+    assert next(events) == b": connected\n\n"
+
+    database.get_buoy(buoy_ids[0])
+    database.get_buoy(buoy_ids[1])
+    assert next(events).startswith(b"event: reading\ndata: {\"buoy\": \"" + buoy_ids[1].encode())
+
+    resp.close()
+    assert not database._callbacks
+
+    assert client.get("/events?sources=unknown").status_code == 400
+
+
+def test_event_stream_generation(database):
+    """
+    The generation of an event can be passed as `since` to the changes.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+
+    resp = client.get("/events?buoys={}".format(buoy_id), buffered=False)
+    events = iter(resp.response)
+    assert next(events) == b": connected\n\n"
+    database.get_buoy(buoy_id)
+    event = next(events).decode()
+    resp.close()
+    generation = json.loads(event.split("data: ", 1)[1])["generation"]
+
+    output = client.get("/changes?since={}".format(generation - 1)).get_json()
+    assert not output["reset"]
+    assert list(output["buoys"]) == [buoy_id]
+    output = client.get("/changes?since={}".format(generation)).get_json()
+    assert not output["reset"] and output["buoys"] == {}
+    assert client.get("/readyz").get_json()["generation"] == generation
+
+
+def test_changes(database, monkeypatch):
+    """
+    Only the buoys and sources that changed after the generation are returned.
+    """
+    client = create_app().test_client()
+
+    output = client.get("/changes").get_json()
+    assert output["reset"]
+    assert set(output["sources"]) == set(database.get_aliases())
+    assert set(output["buoys"]) == set(database.get_all_buoy_ids())
+    generation = output["generation"]
+
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+    output = client.get("/changes?since={}".format(generation)).get_json()
+    assert not output["reset"]
+    assert output["sources"] == {}
+    assert output["buoys"] == {buoy_id: jsonify_buoy_data(database.get_buoy(buoy_id))}
+    generation = output["generation"]
+
+    # remove the second source and its buoys, add a buoy to the first source
+    monkeypatch.setattr(connector, "get_buoy_sources", lambda: make_sources(num_sources=1, num_buoys=6))
+    database._pull_all()
+
+    output = client.get("/changes?since={}".format(generation)).get_json()
+    assert not output["reset"]
+    assert list(output["sources"]) == ["Test_Source_0"]
+    assert output["buoys"] == {"00005": None}
+    assert output["removed_sources"] == ["Test_Source_1"]
+    assert sorted(output["removed_buoys"]) == ["1{:04d}".format(j) for j in range(5)]
+
+    assert client.get("/changes?since=abc").status_code == 400
+
+
+@pytest.mark.parametrize("accept,encoding", [("gzip", "gzip"), ("gzip;q=0, br", None), ("identity", None)])
+def test_compression(database, monkeypatch, accept, encoding):
+    """
+    Cached bodies are compressed once for each encoding, the ETag differs for each encoding.
+    """
+    monkeypatch.setattr(responses, "MIN_COMPRESS_SIZE", 0)
+    responses.compression_stats.clear()
+    client = create_app().test_client()
+    expected = client.get("/buoys").get_json()
+
+    for _ in range(2):
+        resp = client.get("/buoys", headers={"Accept-Encoding": accept})
+        assert resp.headers.get("Content-Encoding") == encoding
+        assert "Accept-Encoding" in resp.headers["Vary"]
+        data = gzip.decompress(resp.data) if encoding else resp.data
+        assert json.loads(data) == expected
+
+    stats = responses.compression_stats.to_json()
+    if encoding:
+        assert resp.headers["ETag"].endswith('-{}"'.format(encoding))
+        assert stats[encoding]["compressed"] == 1
+        assert stats[encoding]["responses"] == 2
+        resp = client.get("/buoys", headers={"Accept-Encoding": accept, "If-None-Match": resp.headers["ETag"]})
+        assert resp.status_code == 304
+    else:
+        assert stats == {}
+
+
+def test_compression_dynamic(database, monkeypatch):
+    """
+    Bodies that are not cached are compressed for each response.
+    """
+    monkeypatch.setattr(responses, "MIN_COMPRESS_SIZE", 0)
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()[:3]
+
+    resp = client.get("/buoys/batch?ids={}".format(",".join(buoy_ids)), headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert set(json.loads(gzip.decompress(resp.data))["buoys"]) == set(buoy_ids)
+
+    stats = client.get("/stats/compression").get_json()["encodings"]
+    assert stats["gzip"]["bytes_saved"] != 0
+
+
+def test_metrics(database):
+    """
+    The metrics include the latency of the requests and the state of the cache.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+    client.get("/buoys/{}".format(buoy_id))
+    client.get("/buoys/{}".format(buoy_id))
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain")
+
+    lines = resp.get_data(as_text=True).splitlines()
+    assert any(x.startswith('nautical_request_duration_seconds_count{endpoint="specific_buoy"}') for x in lines)
+    assert any(x.startswith('nautical_cache_requests_total{result="hit"}') for x in lines)
+    assert 'nautical_cache_buoys{state="fresh"} 1' in lines
+    assert any(x.startswith('nautical_lock_wait_seconds_count{lock="retrieve"}') for x in lines)
+    assert any(x.startswith('nautical_pull_duration_seconds_count{stage="all"}') for x in lines)
+
+
+def test_serialized_bodies(database):
+    """
+    The bodies written by the serializer are identical to the bodies encoded by flask_restful.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()[:3]
+    for buoy_id in buoy_ids:
+        database.get_buoy(buoy_id)
+
+    resp = client.get("/buoys/{}".format(buoy_ids[0]))
+    expected = {buoy_ids[0]: jsonify_buoy_data(database.get_buoy(buoy_ids[0]))}
+    assert resp.data == (json.dumps(expected) + "\n").encode("utf-8")
+
+    resp = client.get("/buoys/batch?ids={},unknown".format(",".join(buoy_ids)))
+    expected = {
+        "buoys": {x: jsonify_buoy_data(database.get_buoy(x)) for x in buoy_ids},
+        "errors": {"unknown": "not found"}
+    }
+    assert resp.data == (json.dumps(expected) + "\n").encode("utf-8")
+
+
+def test_schedule(database):
+    """
+    The schedule lists the next refresh of the buoys that have been retrieved.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()
+    client.get("/buoys/{}".format(buoy_ids[0]))
+    client.get("/buoys/{}".format(buoy_ids[1]))
+
+    resp = client.get("/schedule")
+    assert resp.status_code == 200
+    assert resp.json["next_pull"] > 0
+    assert sorted(x["id"] for x in resp.json["buoys"]) == sorted(buoy_ids[:2])
+    assert all(x["due"] is not None and x["misses"] >= 0 for x in resp.json["buoys"])
+
+    resp = client.get("/schedule?buoys={}&limit=5".format(buoy_ids[1]))
+    assert [x["id"] for x in resp.json["buoys"]] == [buoy_ids[1]]
+    assert client.get("/schedule?limit=0").status_code == 400
+
+
+def test_hot_set(database):
+    """
+    The hot set lists the most requested buoys along with the coverage and hit rate.
+    """
+    client = create_app().test_client()
+    buoy_ids = database.get_all_buoy_ids()
+    for _ in range(3):
+        client.get("/buoys/{}".format(buoy_ids[1]))
+    client.get("/buoys/{}".format(buoy_ids[0]))
+
+    resp = client.get("/hotset?limit=1")
+    assert resp.status_code == 200
+    assert resp.json["size"] == 1 and resp.json["tracked"] == 2
+    assert [x["id"] for x in resp.json["buoys"]] == [buoy_ids[1]]
+    assert abs(resp.json["hit_rate"] - 2 / 3) < 1e-6
+    assert 0.7 < resp.json["coverage"] < 0.8
+    assert client.get("/hotset?limit=x").status_code == 400
+
+
+def test_breakers(database, monkeypatch):
+    """
+    The buoys that failed to be retrieved are listed with the state of their breaker.
+    """
+    def _create_buoy(station):
+        raise connector.HTTPError("url", 404, "Not Found", None, None)
+
+    monkeypatch.setattr(connector, "create_buoy", _create_buoy)
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+    client.get("/buoys/{}".format(buoy_id))
+
+    resp = client.get("/breakers")
+    assert resp.status_code == 200
+    assert resp.json["counts"] == {"closed": 1, "open": 0, "half_open": 0}
+    assert resp.json["buoys"][0]["id"] == buoy_id
+    assert resp.json["buoys"][0]["failures"] == 1
+    assert client.get("/breakers?state=open").json["buoys"] == []
+    assert client.get("/breakers?state=x").status_code == 400
+
+
+def test_health(database):
+    """
+    The application is alive before the data is ready, ready once the sources are loaded.
+    """
+    client = create_app().test_client()
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["ready"] and response.get_json()["origin"] == "pull"
+
+    previous = NauticalDatabase._instance
+    NauticalDatabase._instance = NauticalDatabase.__wrapped__(prefetch=False)
+    try:
+        assert client.get("/healthz").status_code == 200
+        response = client.get("/readyz")
+        assert response.status_code == 503 and not response.get_json()["ready"]
+    finally:
+        NauticalDatabase._instance = previous
+
+
+def test_export(database):
+    """
+    The export streams a line for each buoy, the buoys are not retrieved by the export.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+    database.get_buoy(buoy_id)
+
+    response = client.get("/buoys/export")
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(x) for x in response.get_data(as_text=True).splitlines()]
+    assert [x["id"] for x in lines] == database.get_all_buoy_ids()
+    assert lines[0]["data"]["wvht"] == 1.5 and not lines[0]["stale"]
+    assert all(x["data"] is None for x in lines[1:])
+
+    response = client.get("/buoys/export?sources=Test_Source_1")
+    lines = [json.loads(x) for x in response.get_data(as_text=True).splitlines()]
+    assert [x["id"] for x in lines] == ["1{:04d}".format(j) for j in range(5)]
+
+    assert client.get("/buoys/export?sources=unknown").status_code == 400
+
+
+def test_export_chunks():
+    """
+    The first line is sent on its own, the other lines are joined into chunks.
+    """
+    chunks = list(export_lines([(str(x), None) for x in range(10)], chunk_size=200))
+    assert chunks[0].count("\n") == 1
+    assert len(chunks) > 2 and all(len(x) < 300 for x in chunks)
+    assert sum(x.count("\n") for x in chunks) == 10
+
+
+def test_snapshot_file(database):
+    """
+    The latest snapshot file is served, 404 when no file was written.
+    """
+    client = create_app().test_client()
+    assert client.get("/snapshot").status_code == 404
+
+
+def test_snapshot_file_removed(database, tmp_path, monkeypatch):
+    """
+    A file that is removed before it is sent is replaced by the latest file, 404 when
+    the files keep being removed.
+    """
+    latest = tmp_path / "snapshot-2.arrow"
+    latest.write_bytes(b"arrow")
+    paths = [str(tmp_path / "snapshot-1.arrow"), str(latest)]
+    monkeypatch.setattr(database, "get_snapshot_file", lambda: paths.pop(0) if len(paths) > 1 else paths[0])
+
+    client = create_app().test_client()
+    resp = client.get("/snapshot")
+    assert resp.status_code == 200 and resp.data == b"arrow"
+    resp.close()
+
+    latest.unlink()
+    assert client.get("/snapshot").status_code == 404
+
+
+def test_event_stream_limit(database):
+    """
+    The streams over the limit are rejected, the slot of a stream is released when it is closed.
+    """
+    client = create_app().test_client()
+    streams = [client.get("/events", buffered=False) for _ in range(MAX_EVENT_STREAMS)]
+    assert all(x.status_code == 200 for x in streams)
+    assert client.get("/events", buffered=False).status_code == 503
+
+    streams.pop().close()
+    streams.append(client.get("/events", buffered=False))
+    assert streams[-1].status_code == 200
+    for resp in streams:
+        resp.close()
+
+
+def test_etag_content(database):
+    """
+    The ETag only depends on the body, not on the version of the data in this process
+    (another worker process has other versions).
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+    etag = client.get("/buoys/{}".format(buoy_id)).headers["ETag"]
+
+    reading = database.get_buoy_reading(buoy_id)
+    database._buoys[buoy_id] = reading._replace(version=reading.version + 1000)
+    resources._bodies.clear()
+    resp = client.get("/buoys/{}".format(buoy_id), headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+
+def test_etag_same_reading(database):
+    """
+    Fetching the same observation again keeps the version of the reading, the ETag of
+    the buoy does not change.
+    """
+    client = create_app().test_client()
+    buoy_id = database.get_all_buoy_ids()[0]
+
+    resp = client.get("/buoys/{}".format(buoy_id))
+    etag = resp.headers["ETag"]
+    version = database.get_buoy_reading(buoy_id).version
+
+    database._load_buoy(buoy_id, connector.Future())
+    assert database.get_buoy_reading(buoy_id).version == version
+    resp = client.get("/buoys/{}".format(buoy_id), headers={"If-None-Match": etag})
+    assert resp.status_code == 304
@@ -0,0 +1,78 @@
+from nautical_api.scheduler import RefreshScheduler, PUBLISH_DELAY
+
+
+def test_scheduler_learns_cadence():
+    """
+    The interval between new observations is learned and the station is refreshed once
+    the next observation is expected to be published.
+    """
+    scheduler = RefreshScheduler(interval=3600, jitter=0.0)
+    assert scheduler.observed("a", 1000, now=1100) == 1000 + 3600 + PUBLISH_DELAY
+
+    # the first interval replaces the default, the following intervals are averaged
+    scheduler.observed("a", 1600, now=1700)
+    assert scheduler.get("a").interval == 600
+    assert scheduler.get("a").due == 1600 + 600 + PUBLISH_DELAY
+
+    scheduler.observed("a", 2800, now=2900)
+    assert 600 < scheduler.get("a").interval < 1200
+    assert scheduler.get("a").misses == 0
+
+
+def test_scheduler_backoff():
+    """
+    Refreshes without a new observation (and failures) are retried with an exponential
+    backoff that is reset by the next observation.
+    """
+    scheduler = RefreshScheduler(retry_delay=100, max_backoff=1000, jitter=0.0)
+    scheduler.observed("a", 1000, now=1100)
+
+    delays = []
+    for now in (5000, 6000, 7000):
+        delays.append(scheduler.observed("a", 1000, now=now) - now)
+    delays.append(scheduler.failed("a", now=8000) - 8000)
+    delays.append(scheduler.failed("a", now=9000) - 9000)
+    assert delays == [100, 200, 400, 800, 1000]
+    assert scheduler.get("a").misses == 5
+
+    scheduler.observed("a", 9500, now=9600)
+    assert scheduler.get("a").misses == 0
+
+
+def test_scheduler_jitter():
+    """
+    The jitter spreads the refreshes of stations that report at the same time.
+    """
+    scheduler = RefreshScheduler(interval=3600, jitter=0.1, seed=1)
+    due = set(scheduler.observed(str(x), 1000, now=1000) for x in range(20))
+    expected = 1000 + 3600 + PUBLISH_DELAY
+    assert len(due) > 1
+    assert all(expected <= x <= expected + 300 for x in due)
+
+
+def test_scheduler_due():
+    """
+    The stations that are due are taken from the schedule, the most overdue first, and
+    they are not due again until the result of the refresh is recorded.
+    """
+    scheduler = RefreshScheduler(interval=3600, jitter=0.0)
+    scheduler.observed("a", 1000, now=1000)
+    scheduler.observed("b", 500, now=1000)
+    scheduler.failed("c", now=1000)
+    assert scheduler.next_due() == 1000 + 300
+
+    assert scheduler.due(now=1000) == []
+    assert scheduler.due(now=10000) == ["c", "b", "a"]
+    assert scheduler.due(now=10000) == []
+    assert scheduler.next_due() is None
+    assert [x.station for x in scheduler.entries()] == ["a", "b", "c"]
+
+    # deferred stations are due again after their interval, scheduled stations are kept
+    assert scheduler.defer("a", now=10000) == 10000 + 3600
+    assert scheduler.defer("a", now=20000) == 10000 + 3600
+    assert scheduler.defer("unknown") is None
+
+    scheduler.failed("b", now=10000)
+    scheduler.retain(["b", "c"])
+    assert len(scheduler) == 2
+    assert [x.station for x in scheduler.entries(limit=1)] == ["b"]
@@ -0,0 +1,80 @@
+from nautical_api import serializer
+from nautical_api.serializer import buoy_fields, encode_buoy, encode_object
+from enum import IntEnum
+from conftest import make_buoy
+import json
+import pytest
+
+
+class _Level(IntEnum):
+    HIGH = 3
+
+
+def _jsonify(data):
+    """
+    The conversion that was used before the serializer, the output must not change.
+    """
+    output = {}
+    for x, y in data:
+        output[x] = y if isinstance(y, (int, float, str)) else str(y)
+    return output
+
+
+@pytest.fixture
+def data():
+    data = make_buoy("test", wvht=2.25).present
+    data.set("wdir", "Né")
+    data.set("pres", float("inf"))
+    data.set("atmp", float("nan"))
+    data.set("dpd", 7)
+    data.set("vis", True)
+    data.set("tide", _Level.HIGH)
+    data.set("wtmp", 0.0)  # not set, falsy values are skipped
+    return data
+
+
+def test_buoy_fields(data):
+    """
+    The fields match the previous conversion.
+    """
+    expected = _jsonify(data)
+    output = buoy_fields(data)
+    assert list(output) == list(expected)
+    assert json.dumps(output) == json.dumps(expected)
+    assert "wtmp" not in output
+
+
+def test_encode_buoy(data):
+    """
+    The text is identical to the text of `json.dumps`.
+    """
+    assert encode_buoy(data) == json.dumps(_jsonify(data))
+    assert encode_object([("a", encode_buoy(data)), ("b\"", "null")]) == json.dumps(
+        {"a": _jsonify(data), "b\"": None}
+    )
+    assert encode_object([]) == json.dumps({})
+
+
+@pytest.mark.skipif(serializer.orjson is None, reason="orjson is not installed")
+def test_orjson_backend(monkeypatch):
+    """
+    The orjson backend writes compact text with the same values, except NaN and infinite
+    values that are written as null.
+    """
+    monkeypatch.setattr(serializer, "_backend", "orjson")
+    data = make_buoy("test").present
+    text = encode_object([("test", encode_buoy(data))])
+    assert ", " not in text
+    assert json.loads(text) == {"test": buoy_fields(data)}
+    assert serializer.dumps({"a": 1}) == '{"a":1}'
+    assert serializer.dumps({"a": float("nan"), "b": float("inf")}) == '{"a":null,"b":null}'
+
+
+def test_set_backend():
+    """
+    Only the available backends can be selected.
+    """
+    with pytest.raises(ValueError):
+        serializer.set_backend("unknown")
+    serializer.set_backend("stdlib")
+    assert serializer.get_backend() == "stdlib"
@@ -0,0 +1,68 @@
+from nautical_api.spatial import SpatialIndex, buoy_locations, haversine
+from nautical.location.point import Point
+from conftest import make_sources
+from random import Random
+import pytest
+
+
+@pytest.fixture
+def locations():
+    rand = Random(7)
+    return tuple(
+        ("{:05d}".format(i), rand.uniform(-89.0, 89.0), rand.uniform(-180.0, 180.0))
+        for i in range(2000)
+    )
+
+
+@pytest.mark.parametrize("lat,lon,radius", [
+    (30.0, -70.0, 500.0),
+    (0.0, 179.5, 800.0),
+    (85.0, 10.0, 1500.0),
+    (-10.0, 40.0, 20016.0),
+])
+def test_spatial_near(locations, lat, lon, radius):
+    """
+    The lookup returns the same buoys as measuring the distance to every buoy.
+    """
+    index = SpatialIndex(locations)
+    expected = sorted(
+        (haversine(lat, lon, b_lat, b_lon), station) for station, b_lat, b_lon in locations
+        if haversine(lat, lon, b_lat, b_lon) <= radius
+    )
+
+    output = index.near(lat, lon, radius)
+    assert [x[0] for x in output] == [station for _, station in expected]
+    assert [x[0] for x in index.near(lat, lon, radius, limit=3)] == [station for _, station in expected[:3]]
+
+
+@pytest.mark.parametrize("box", [
+    (20.0, -80.0, 40.0, -60.0),
+    (-5.0, 170.0, 5.0, -170.0),
+])
+def test_spatial_bbox(locations, box):
+    """
+    The box crosses the antimeridian when the min longitude is greater than the max longitude.
+    """
+    min_lat, min_lon, max_lat, max_lon = box
+    expected = [
+        x for x in locations if min_lat <= x[1] <= max_lat and (
+            min_lon <= x[2] <= max_lon if min_lon <= max_lon else x[2] >= min_lon or x[2] <= max_lon
+        )
+    ]
+    assert SpatialIndex(locations).bbox(*box) == expected
+
+
+def test_spatial_rebuild(database):
+    """
+    The index is only rebuilt when the buoys or their locations change.
+    """
+    index = database._spatial
+    assert len(index) == len(database.get_all_buoy_ids())
+    assert not database._update_spatial(database.get_snapshot())
+    assert database._spatial is index
+
+    sources = make_sources()
+    next(iter(next(iter(sources.values())).buoys.values())).location = Point(10.0, 10.0)
+    snapshot = database.get_snapshot()._replace(sources=sources)
+    assert database._update_spatial(snapshot)
+    assert database._spatial.locations == buoy_locations(sources)
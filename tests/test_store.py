@@ -0,0 +1,105 @@
+from nautical_api.connector import NauticalDatabase
+from nautical_api.store import SnapshotStore
+from conftest import make_buoy, make_sources
+from threading import Event
+from time import time
+
+
+def test_store_sources(tmp_path):
+    """
+    The sources (and their buoys) are loaded in the same form they were saved.
+    """
+    store = SnapshotStore(str(tmp_path / "nautical.db"))
+    sources = make_sources(2, 3)
+    store.save_sources(sources)
+
+    loaded = store.load_sources()
+    assert sorted(loaded.keys()) == sorted(sources.keys())
+    for name, source in loaded.items():
+        assert sorted(b.station for b in source) == sorted(b.station for b in sources[name])
+
+    store.close()
+
+
+def test_store_readings(tmp_path):
+    """
+    The latest reading is kept for each buoy, and the readings of buoys that are no
+    longer part of a source are removed.
+    """
+    store = SnapshotStore(str(tmp_path / "nautical.db"))
+    store.save_sources(make_sources(1, 2))
+
+    now = time()
+    store.save_reading("00000", make_buoy("00000", wvht=1.0).present, now - 10)
+    store.save_reading("00000", make_buoy("00000", wvht=2.0).present, now)
+    store.save_reading("00001", make_buoy("00001").present, now)
+
+    readings = store.load_readings()
+    data, fetched = readings["00000"]
+    assert data.wvht == 2.0
+    assert fetched == now
+
+    store.save_sources(make_sources(1, 1))
+    assert list(store.load_readings().keys()) == ["00000"]
+
+    store.close()
+
+
+def test_store_updates(tmp_path):
+    """
+    Only the readings saved after the sequence number are loaded, the buoys requested
+    by the followers are taken once.
+    """
+    store = SnapshotStore(str(tmp_path / "nautical.db"))
+    assert store.sources_sequence() == 0
+    store.save_sources(make_sources(1, 2))
+    assert store.sources_sequence() > 0
+
+    now = time()
+    store.save_reading("00000", make_buoy("00000").present, now)
+    updates, cursor = store.load_updates()
+    assert [x[0] for x in updates] == ["00000"]
+
+    store.save_reading("00001", make_buoy("00001").present, now)
+    updates, cursor = store.load_updates(cursor)
+    assert [x[0] for x in updates] == ["00001"]
+    assert store.load_updates(cursor) == ([], cursor)
+
+    store.request_readings(["00000", "00001"])
+    assert sorted(store.take_requests()) == ["00000", "00001"]
+    assert store.take_requests() == []
+
+    store.close()
+
+
+def test_db_warm_start(tmp_path):
+    """
+    A database started with an existing store serves the saved data (marked as stale)
+    before the first pull completes.
+    """
+    path = str(tmp_path / "nautical.db")
+    db = NauticalDatabase.__wrapped__(
+        prefetch=True, store=path, sources_fn=lambda: make_sources(1, 3), buoy_fn=make_buoy
+    )
+    db.run()
+    db._prefetch_thread.join(10)
+    db.stop()
+
+    release = Event()
+
+    def _create_buoy(station):
+        release.wait(10)
+        return make_buoy(station, wvht=3.0)
+
+    restarted = NauticalDatabase.__wrapped__(
+        prefetch=False, store=path, sources_fn=lambda: make_sources(1, 3), buoy_fn=_create_buoy
+    )
+    restarted.run()
+
+    assert len(restarted.get_all_buoy_ids()) == 3
+    reading = restarted.get_buoy_reading("00000")
+    assert reading.stale
+    assert reading.data.wvht == 1.5
+
+    release.set()
+    restarted.stop()
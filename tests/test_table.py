@@ -0,0 +1,61 @@
+from nautical_api import table
+from nautical_api.table import ReadingTable
+from conftest import make_buoy
+import pytest
+
+
+@pytest.fixture(params=["numpy", "python"])
+def reading_table(request, monkeypatch):
+    """
+    Table of three buoys, the queries are run with and without numpy.
+    """
+    if request.param == "python":
+        monkeypatch.setattr(table, "numpy", None)
+    elif table.numpy is None:
+        pytest.skip("numpy is not installed")
+
+    reading_table = ReadingTable()
+    reading_table.reset(["a", "b", "c"])
+    reading_table.update("a", make_buoy("a", wvht=1.0).present)
+    reading_table.update("b", make_buoy("b", wvht=3.5).present)
+    return reading_table
+
+
+def test_table_query(reading_table):
+    """
+    Only the buoys that match all predicates are returned.
+    """
+    assert reading_table.query([("wvht", "gt", 2)]) == {"b": {"wvht": 3.5}}
+    assert set(reading_table.query([("wvht", "ge", 1), ("wspd", "eq", 10)])) == {"a", "b"}
+    assert reading_table.query([("wvht", "lt", 2)], fields=["wvht", "wspd"]) == {
+        "a": {"wvht": 1.0, "wspd": 10.0}
+    }
+
+
+def test_table_missing_values(reading_table):
+    """
+    Buoys without a value for a field never match, even for `ne`.
+    """
+    assert set(reading_table.query([("wvht", "ne", 1)])) == {"b"}
+    assert reading_table.query([("atmp", "gt", -100)]) == {}
+
+
+def test_table_reset(reading_table):
+    """
+    The values of the buoys that remain are kept, new buoys are missing.
+    """
+    reading_table.reset(["b", "d"])
+    assert len(reading_table) == 2
+    assert reading_table.query([("wvht", "ge", 0)]) == {"b": {"wvht": 3.5}}
+
+    reading_table.reset([])
+    assert reading_table.query([("wvht", "ge", 0)]) == {}
+
+
+def test_table_clear(reading_table):
+    """
+    The values of a cleared buoy are missing.
+    """
+    reading_table.clear("b")
+    reading_table.clear("unknown")
+    assert reading_table.query([("wvht", "ge", 0)]) == {"a": {"wvht": 1.0}}